@@ -1,139 +1,466 @@
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 import os
 import sqlite3
-import os
-from datetime import datetime, timedelta
-from apscheduler.schedulers.background import BackgroundScheduler
-import requests
+import threading
+import base64
+import itertools
+import socket
+import time
+import uuid
+from datetime import datetime, date, timedelta, timezone
 import json
-# Cloud Run環境かどうかを判定
-if os.getenv('K_SERVICE'):
-    # Cloud Run環境ではFirestoreを使用
-    from firestore_models import (init_db, add_pomodoro, update_pomodoro, add_task, update_task, 
-                        add_note, get_today_pomodoros, get_today_tasks, get_task_notes, get_active_task,
-                        add_category, get_categories, add_task_template, get_task_templates, deactivate_task_template)
-else:
-    # ローカル環境ではSQLiteを使用
-    from models import (init_db, add_pomodoro, update_pomodoro, add_task, update_task, 
-                        add_note, get_today_pomodoros, get_today_tasks, get_task_notes, get_active_task,
-                        add_category, get_categories, add_task_template, get_task_templates, deactivate_task_template)
-
-app = Flask(__name__)
-
-# 本番環境対応のCORS設定
-if os.getenv('FLASK_ENV') == 'production':
-    # 本番環境ではフロントエンドのURLのみ許可
-    frontend_url = os.getenv('FRONTEND_URL', 'http://localhost')
-    CORS(app, origins=[frontend_url])
-else:
-    # 開発環境では全てのオリジンを許可
-    CORS(app)
-
-# データベースの初期化
-init_db()
+from notifier import create_notifier
+from events import create_event_broker
+from storage import LazyBackend
+from health import create_cached_check
+import metrics
+import records
+# ストレージは最初に使うときに読み込む（K_SERVICE設定時はFirestore、それ以外はSQLite）
+# 読み込み時に関数ごとの所要時間を /metrics に出す計測付きに置き換える
+storage = LazyBackend(prepare=metrics.instrument_storage)
 
-# APSchedulerの設定
-scheduler = BackgroundScheduler()
-scheduler.start()
+api = Blueprint('api', __name__)
+
+# タイマー処理の設定
+# タイマーはDBに保存し、リースを持つ1プロセスだけが期限の来たものを発火する
+TIMER_POLL_SECONDS = float(os.getenv('TIMER_POLL_SECONDS', '2'))
+TIMER_LEASE_SECONDS = TIMER_POLL_SECONDS * 5
+# 発火待ちのタイマー数のゲージを数え直す間隔（Firestoreでは集計クエリが課金されるので毎回は数えない）
+TIMER_GAUGE_SECONDS = float(os.getenv('TIMER_GAUGE_SECONDS', '60'))
 
 # Discord Webhook URL
 DISCORD_WEBHOOK_URL = os.getenv('DISCORD_WEBHOOK_URL', '')
 
-@app.route('/api/export/data', methods=['GET'])
+# Discord通知のディスパッチャー（送信はバックグラウンドスレッドで行う）
+notifier = create_notifier(DISCORD_WEBHOOK_URL, on_send=metrics.observe_notification_send)
+
+# SSE配信（イベントはストレージ経由で全ワーカー・インスタンスに届く）
+EVENTS_HEARTBEAT_SECONDS = float(os.getenv('EVENTS_HEARTBEAT_SECONDS', '15'))
+event_broker = create_event_broker(
+    lambda event_type, payload: storage.add_event(event_type, payload),
+    lambda callback, stop: storage.watch_events(callback, stop)
+)
+
+# レディネスプローブのストレージ疎通確認（間隔を空けて確認し、間は前回の結果を返す）
+storage_check = create_cached_check(lambda: storage.ping())
+
+# エクスポートの列（CSVはポモドーロ・タスク・メモを1つの表にまとめる）
+EXPORT_CSV_COLUMNS = ['type', 'id', 'task_id', 'category_id', 'name', 'start_at', 'end_at',
+                      'status', 'completed', 'body', 'created_at']
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+def _parse_date_range(args, default_days=1):
+    """クエリパラメータから期間を取得（date または from/to、省略時は今日までのdefault_days日間）"""
+    if args.get('from') or args.get('to'):
+        start_date = date.fromisoformat(args.get('from') or args.get('to'))
+        end_date = date.fromisoformat(args.get('to') or args.get('from'))
+    elif args.get('date'):
+        start_date = end_date = date.fromisoformat(args.get('date'))
+    else:
+        end_date = date.today()
+        start_date = end_date - timedelta(days=default_days - 1)
+    
+    if start_date > end_date:
+        raise ValueError('from は to 以前の日付を指定してください')
+    return start_date, end_date
+
+def _export_sources():
+    """エクスポート対象の (種別, 期間で逐次取得する関数) の一覧"""
+    return [('pomodoro', storage.iter_pomodoros), ('task', storage.iter_tasks), ('note', storage.iter_notes)]
+
+def record_json(payload, status=200):
+    """レコードを含む値を辞書に変換せずにJSONの応答にする"""
+    return Response(records.dumps(payload), status, mimetype='application/json')
+
+def _chunked(pieces):
+    """小さな文字列をまとめて送信単位の大きさにする"""
+    buffer = []
+    size = 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= EXPORT_CHUNK_SIZE:
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer)
+
+def _export_json(start_date, end_date):
+    """JSON形式で逐次出力"""
+    header = {'success': True, 'from': str(start_date), 'to': str(end_date)}
+    if start_date == end_date:
+        header['date'] = str(start_date)
+    yield json.dumps(header, ensure_ascii=False)[:-1] + ', "data": {'
+    
+    for i, (record_type, iter_rows) in enumerate(_export_sources()):
+        yield (', ' if i else '') + f'"{record_type}s": ['
+        for j, row in enumerate(iter_rows(start_date, end_date)):
+            yield (', ' if j else '') + records.dumps(row)
+        yield ']'
+    yield '}}'
+
+def _export_ndjson(start_date, end_date):
+    """NDJSON形式で逐次出力（1行1レコード）"""
+    for record_type, iter_rows in _export_sources():
+        # {"type": ..., に続けてレコードの項目を並べる
+        prefix = '{"type": ' + records.dumps(record_type) + ', '
+        for row in iter_rows(start_date, end_date):
+            yield prefix + records.dumps(row)[1:] + '\n'
+
+def _export_csv(start_date, end_date):
+    """CSV形式で逐次出力（type列で種別を区別）"""
+    import csv
+    import io
+    
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(EXPORT_CSV_COLUMNS)
+    for record_type, iter_rows in _export_sources():
+        # 列ごとにレコードの何番目の項目か（ない列は空欄）
+        fields = records.RECORD_TYPES[record_type]._fields
+        positions = [fields.index(column) if column in fields else None for column in EXPORT_CSV_COLUMNS]
+        for row in iter_rows(start_date, end_date):
+            writer.writerow([record_type if column == 'type' else ('' if position is None else row[position])
+                             for column, position in zip(EXPORT_CSV_COLUMNS, positions)])
+            yield output.getvalue()
+            output.seek(0)
+            output.truncate()
+    yield output.getvalue()
+
+def _export_markdown(start_date, end_date):
+    """Markdown形式で逐次出力"""
+    sources = dict(_export_sources())
+    
+    if start_date == end_date:
+        yield f"# 作業記録 - {start_date}\n\n"
+    else:
+        yield f"# 作業記録 - {start_date} 〜 {end_date}\n\n"
+    
+    yield "## ポモドーロ記録\n\n"
+    empty = True
+    for p in sources['pomodoro'](start_date, end_date):
+        empty = False
+        duration = "25分完了" if p.completed else "未完了"
+        yield f"- {p.start_at[:16]} - {duration}\n"
+    if empty:
+        yield "記録なし\n"
+    
+    yield "\n## タスク記録\n\n"
+    empty = True
+    for t in sources['task'](start_date, end_date):
+        empty = False
+        status = "完了" if t.status == 'completed' else "進行中"
+        yield f"- **{t.name}** ({status})\n"
+        yield f"  - 開始: {t.start_at[:16]}\n"
+        if t.end_at:
+            yield f"  - 終了: {t.end_at[:16]}\n"
+    if empty:
+        yield "記録なし\n"
+
+EXPORT_FORMATS = {
+    'json': (_export_json, 'application/json'),
+    'ndjson': (_export_ndjson, 'application/x-ndjson'),
+    'csv': (_export_csv, 'text/csv; charset=utf-8'),
+    'markdown': (_export_markdown, 'text/markdown; charset=utf-8'),
+}
+
+@api.route('/api/export/data', methods=['GET'])
 def export_data():
-    """データエクスポート"""
-    export_format = request.args.get('format', 'json')  # json, csv, markdown
-    export_date = request.args.get('date', None)  # YYYY-MM-DD形式
+    """データエクスポート（from/to で期間指定、結果は逐次送信）"""
+    export_format = request.args.get('format', 'json')  # json, ndjson, csv, markdown
+    
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'success': False, 'message': '無効なフォーマットです'}), 400
     
     try:
-        # Cloud Run環境かどうかを判定してインポート
-        if os.getenv('K_SERVICE'):
-            from firestore_models import get_pomodoros_by_date, get_tasks_by_date, get_all_notes_by_date
-        else:
-            from models import get_pomodoros_by_date, get_tasks_by_date, get_all_notes_by_date
-        from datetime import date
+        start_date, end_date = _parse_date_range(request.args)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    generate, content_type = EXPORT_FORMATS[export_format]
+    body = _chunked(generate(start_date, end_date))
+    # 送信を始めたあとはステータスを変えられないので、最初の送信単位だけは先に作ってエラーを500で返す
+    # （それ以降のエラーはサーバーがログに出して接続を切り、クライアントには途中で切れた応答になる）
+    try:
+        first = next(body, '')
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+    return Response(stream_with_context(itertools.chain([first], body)), 200, {'Content-Type': content_type})
+
+# インポート時に応答へ含めるエラーの件数と、アップロードを読む単位
+IMPORT_ERROR_SAMPLES = 20
+IMPORT_READ_SIZE = 64 * 1024
+
+def _parse_import_time(value, required=True):
+    """インポートする時刻を解析（タイムゾーン付きはローカル時刻に変換）"""
+    if value in (None, ''):
+        if required:
+            raise ValueError('時刻がありません')
+        return None
+    parsed = datetime.fromisoformat(str(value))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+def _parse_import_record(record):
+    """エクスポートと同じ形式の1レコードを (種別, 項目) に変換"""
+    record_type = record.get('type')
+    if record_type == 'pomodoro':
+        end_at = _parse_import_time(record.get('end_at'), required=False)
+        if end_at is None:
+            raise ValueError('進行中（end_at なし）のポモドーロはインポートできません')
+        return record_type, {
+            'start_at': _parse_import_time(record.get('start_at')),
+            'end_at': end_at,
+            'completed': str(record.get('completed')).lower() in ('1', 'true')
+        }
+    if record_type == 'task':
+        if not record.get('name'):
+            raise ValueError('name がありません')
+        end_at = _parse_import_time(record.get('end_at'), required=False)
+        if end_at is None:
+            raise ValueError('進行中（end_at なし）のタスクはインポートできません')
+        return record_type, {
+            'id': record.get('id') or None,
+            'category_id': record.get('category_id') or None,
+            'template_id': record.get('template_id') or None,
+            'name': record['name'],
+            'start_at': _parse_import_time(record.get('start_at')),
+            'end_at': end_at
+        }
+    if record_type == 'note':
+        if record.get('task_id') in (None, ''):
+            raise ValueError('task_id がありません')
+        return record_type, {
+            'task_id': record['task_id'],
+            'body': record.get('body') or record.get('note') or '',
+            'created_at': _parse_import_time(record.get('created_at'), required=False)
+        }
+    raise ValueError(f'type が不正です: {record_type}')
+
+def _iter_lines(stream):
+    """アップロードをIMPORT_READ_SIZEずつ読み、行単位に分けて返す（全体はメモリに載せない）"""
+    pending = b''
+    while True:
+        chunk = stream.read(IMPORT_READ_SIZE)
+        if not chunk:
+            break
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line + b'\n'
+    if pending:
+        yield pending
+
+def _iter_import(stream, import_format, errors):
+    """アップロードを1行ずつ読み、解析できたレコードを順に返す（不正な行はerrorsに記録）
+
+    メモは、それより前の行でインポートしたタスクに付いているものだけを返す。
+    """
+    import csv
+    
+    task_ids = set()
+    lines = (line.decode('utf-8') for line in _iter_lines(stream))
+    if import_format == 'csv':
+        reader = csv.DictReader(line.lstrip('\ufeff') if i == 0 else line for i, line in enumerate(lines))
+        records = ((reader.line_num, row) for row in reader)
+    else:
+        records = ((line_no, line) for line_no, line in enumerate(lines, start=1) if line.strip())
+    
+    for line_no, record in records:
+        try:
+            if import_format == 'ndjson':
+                record = json.loads(record)
+            record_type, fields = _parse_import_record(record)
+            if record_type == 'task' and fields['id'] is not None:
+                task_ids.add(str(fields['id']))
+            elif record_type == 'note' and str(fields['task_id']) not in task_ids:
+                raise ValueError(f"task_id {fields['task_id']} のタスクがインポートにありません")
+            yield record_type, fields
+        except (ValueError, TypeError, AttributeError) as e:
+            errors.append(f'{line_no}行目: {e}')
+
+@api.route('/api/import', methods=['POST'])
+def import_data():
+    """NDJSON/CSVのポモドーロ・タスク・メモを一括登録（アップロードは逐次読み込み）"""
+    import_format = request.args.get('format')
+    if import_format is None:
+        import_format = 'csv' if request.mimetype == 'text/csv' else 'ndjson'
+    if import_format not in ('ndjson', 'csv'):
+        return jsonify({'success': False, 'error': 'format は ndjson または csv です'}), 400
+    
+    try:
+        errors = []
+        started = time.perf_counter()
+        counts = storage.import_records(_iter_import(request.stream, import_format, errors))
+        elapsed = time.perf_counter() - started
+        total = sum(counts.values())
         
-        target_date = date.fromisoformat(export_date) if export_date else date.today()
+        return jsonify({
+            'success': True,
+            'imported': counts,
+            'skipped': len(errors),
+            'errors': errors[:IMPORT_ERROR_SAMPLES],
+            'elapsed_seconds': round(elapsed, 3),
+            'records_per_sec': round(total / elapsed, 1) if elapsed > 0 else None
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+STATS_GROUP_BY = ('day', 'week', 'category', 'hour')
+
+def _completion_ratio(group):
+    """完了したポモドーロの割合（記録がなければNone）"""
+    finished = group['completed_pomodoros'] + group['aborted_pomodoros']
+    return round(group['completed_pomodoros'] / finished, 4) if finished else None
+
+@api.route('/api/stats', methods=['GET'])
+def get_stats_api():
+    """期間集計（集中時間・曜日×時間帯ヒートマップ・完了率・連続日数）"""
+    group_by = request.args.get('group_by', 'day')
+    if group_by not in STATS_GROUP_BY:
+        return jsonify({'success': False, 'error': f'group_by は {", ".join(STATS_GROUP_BY)} のいずれかです'}), 400
+    
+    try:
+        start_date, end_date = _parse_date_range(request.args, default_days=30)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    try:
+        stats = storage.get_stats(start_date, end_date, group_by)
         
-        # データ取得
-        pomodoros = get_pomodoros_by_date(target_date)
-        tasks = get_tasks_by_date(target_date)
-        notes = get_all_notes_by_date(target_date)
+        totals = dict(stats['totals'])
+        totals['completion_ratio'] = _completion_ratio(totals)
+        groups = [dict(group, completion_ratio=_completion_ratio(group)) for group in stats['groups']]
         
-        if export_format == 'json':
-            return jsonify({
-                'success': True,
-                'date': str(target_date),
-                'data': {
-                    'pomodoros': [dict(p) for p in pomodoros],
-                    'tasks': [dict(t) for t in tasks],
-                    'notes': [dict(n) for n in notes]
-                }
-            })
+        # heatmap[曜日(0=日曜)][時] = 集中時間（分）
+        heatmap = [[0] * 24 for _ in range(7)]
+        for weekday, hour, minutes in stats['heatmap']:
+            heatmap[weekday][hour] = round(minutes, 1)
         
-        elif export_format == 'csv':
-            import csv
-            import io
-            
-            output = io.StringIO()
-            
-            # ポモドーロデータのみ
-            output.write("ID,開始時刻,終了時刻,完了\n")
-            for p in pomodoros:
-                output.write(f"{p['id']},{p['start_at']},{p['end_at'] or '未完了'},{p['completed']}\n")
-            
-            return output.getvalue(), 200, {'Content-Type': 'text/csv; charset=utf-8'}
-        
-        elif export_format == 'markdown':
-            md_content = f"# 作業記録 - {target_date}\n\n"
-            
-            md_content += "## ポモドーロ記録\n\n"
-            if pomodoros:
-                for p in pomodoros:
-                    duration = "25分完了" if p['completed'] else "未完了"
-                    md_content += f"- {p['start_at'][:16]} - {duration}\n"
-            else:
-                md_content += "記録なし\n"
-            
-            md_content += "\n## タスク記録\n\n"
-            if tasks:
-                for t in tasks:
-                    status = "完了" if t['status'] == 'completed' else "進行中"
-                    md_content += f"- **{t['name']}** ({status})\n"
-                    md_content += f"  - 開始: {t['start_at'][:16]}\n"
-                    if t['end_at']:
-                        md_content += f"  - 終了: {t['end_at'][:16]}\n"
-            else:
-                md_content += "記録なし\n"
-            
-            return md_content, 200, {'Content-Type': 'text/markdown; charset=utf-8'}
+        # 現在の連続日数は期間の最終日（当日分が未記録なら前日）まで続いている区間
+        streaks = stats['streaks']
+        current = 0
+        if streaks and streaks[-1]['last_day'] >= str(end_date - timedelta(days=1)):
+            current = streaks[-1]['days']
+        
+        return jsonify({
+            'success': True,
+            'from': str(start_date),
+            'to': str(end_date),
+            'group_by': group_by,
+            'totals': totals,
+            'groups': groups,
+            'heatmap': heatmap,
+            'streaks': {
+                'current': current,
+                'longest': max((streak['days'] for streak in streaks), default=0)
+            }
+        })
         
-        else:
-            return jsonify({'success': False, 'message': '無効なフォーマットです'}), 400
-            
     except Exception as e:
-        return jsonify({'success': False, 'message': str(e)}), 500
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+HISTORY_DEFAULT_LIMIT = 50
+HISTORY_MAX_LIMIT = 200
+HISTORY_TASK_STATUSES = ('active', 'completed')
+
+def _encode_cursor(row):
+    """ページ最後の行から次ページ用の不透明なカーソルを作る"""
+    raw = json.dumps([row.start_at, row.id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def _decode_cursor(cursor):
+    """カーソルを (start_at, id) に戻す"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        start_at, row_id = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError('cursor が不正です')
+    if not isinstance(start_at, str):
+        raise ValueError('cursor が不正です')
+    return start_at, row_id
 
+def _history_response(fetch_page, **filters):
+    """履歴の1ページ分を返す（limit+1件読んで次ページの有無を判定）"""
+    try:
+        limit = int(request.args.get('limit', HISTORY_DEFAULT_LIMIT))
+        if not 1 <= limit <= HISTORY_MAX_LIMIT:
+            raise ValueError(f'limit は 1〜{HISTORY_MAX_LIMIT} で指定してください')
+        cursor = request.args.get('cursor')
+        after = _decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    try:
+        rows = fetch_page(limit + 1, after, **filters)
+        items = rows[:limit]
+        return record_json({
+            'success': True,
+            'items': items,
+            'next_cursor': _encode_cursor(items[-1]) if len(rows) > limit else None
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@api.route('/api/history/tasks', methods=['GET'])
+def get_task_history_api():
+    """タスク履歴（新しい順、cursorで続きを取得）"""
+    status = request.args.get('status')
+    if status is not None and status not in HISTORY_TASK_STATUSES:
+        return jsonify({'success': False, 'error': f'status は {", ".join(HISTORY_TASK_STATUSES)} のいずれかです'}), 400
+    return _history_response(storage.get_task_history, category_id=request.args.get('category_id'), status=status)
+
+@api.route('/api/history/pomodoros', methods=['GET'])
+def get_pomodoro_history_api():
+    """ポモドーロ履歴（新しい順、cursorで続きを取得）"""
+    completed = request.args.get('completed')
+    if completed is not None and completed not in ('true', 'false'):
+        return jsonify({'success': False, 'error': 'completed は true または false です'}), 400
+    return _history_response(storage.get_pomodoro_history,
+                             completed=None if completed is None else completed == 'true')
+
+@metrics.NOTIFICATION_ENQUEUE_SECONDS.time()
 def send_discord_notification(message):
-    """Discord Webhookに通知を送信"""
+    """Discord Webhookに通知を送信（キューに積んで即座に戻る）"""
     if not DISCORD_WEBHOOK_URL:
         return
     
+    notifier.notify(message)
+
+def process_due_timers():
+    """期限の来たタイマーを発火（リースを持つプロセスのみ）
+
+    全プロセスで定期的に呼ばれるので、プロセスごとのゲージもここで更新する。
+    """
     try:
-        payload = {
-            'content': message,
-            'username': 'PomoHub'
-        }
-        requests.post(DISCORD_WEBHOOK_URL, json=payload)
+        metrics.NOTIFICATION_BACKLOG.set(notifier.backlog())
+        metrics.SSE_CLIENTS.set(event_broker.client_count())
+        if not storage.acquire_lease('pomodoro_timers', _scheduler_owner(), TIMER_LEASE_SECONDS):
+            metrics.SCHEDULER_PENDING_TIMERS.set(0)
+            _scheduler['pending_counted'] = None
+            return
+        now = datetime.now()
+        # ポモドーロの完了はタイマーの発火と同じトランザクションで済んでいる
+        for timer in storage.claim_due_timers(now):
+            metrics.observe_timer_lag(timer['fire_at'], now)
+            pomodoro_finished_callback(timer['pomodoro_id'])
+        # リースを取った直後と、その後は TIMER_GAUGE_SECONDS ごとに数え直す
+        counted = _scheduler['pending_counted']
+        if counted is None or time.monotonic() - counted >= TIMER_GAUGE_SECONDS:
+            metrics.SCHEDULER_PENDING_TIMERS.set(storage.count_pending_timers())
+            _scheduler['pending_counted'] = time.monotonic()
     except Exception as e:
-        print(f"Discord通知エラー: {e}")
+        print(f"タイマー処理エラー: {e}")
+    finally:
+        _scheduler['last_run'] = time.monotonic()
 
 def pomodoro_finished_callback(pomodoro_id):
-    """ポモドーロ終了時のコールバック"""
+    """ポモドーロ終了時のコールバック（完了の記録は claim_due_timers が済ませている）"""
     try:
-        # ポモドーロ終了時刻を更新
-        update_pomodoro(pomodoro_id, datetime.now(), completed=True)
+        event_broker.publish('pomodoro_finished', {'pomodoro_id': pomodoro_id})
         
         # Discord通知
         message = '🍅 ポモドーロタイマー終了！お疲れ様でした！'
@@ -141,25 +468,76 @@ def pomodoro_finished_callback(pomodoro_id):
     except Exception as e:
         print(f"ポモドーロ終了処理エラー: {e}")
 
+# APSchedulerの設定
+# 期限の来たタイマーを定期的に確認する（起動直後にも実行し、停止中に期限が来た分を回収）
+# import時には起動せず、各プロセスの最初のリクエストで別スレッドから起動する
+# （gunicornの preload_app でも、スケジューラーのスレッドはfork後のワーカーで作られる）
+_scheduler = {'pid': None, 'scheduler': None, 'last_run': None, 'pending_counted': None}
+_scheduler_lock = threading.Lock()
+
+def _scheduler_owner():
+    """このプロセスのリースの所有者ID
+
+    import時に作るとpreload_appでforkした全ワーカーが同じIDになり、全員がリースを持つので、
+    プロセスごとに最初に使うときに作る。
+    """
+    owner = _scheduler.get('owner')
+    if owner is None or owner[0] != os.getpid():
+        owner = _scheduler['owner'] = (os.getpid(), f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}')
+    return owner[1]
+
+def start_scheduler():
+    """このプロセスのスケジューラーを起動（起動済みなら何もしない）"""
+    with _scheduler_lock:
+        if _scheduler['pid'] == os.getpid():
+            return _scheduler['scheduler']
+        from apscheduler.schedulers.background import BackgroundScheduler
+        scheduler = BackgroundScheduler()
+        scheduler.add_job(
+            process_due_timers,
+            'interval',
+            seconds=TIMER_POLL_SECONDS,
+            next_run_time=datetime.now(),
+            id='process_due_timers',
+            max_instances=1,
+            coalesce=True
+        )
+        _scheduler['last_run'] = time.monotonic()
+        scheduler.start()
+        _scheduler['pid'] = os.getpid()
+        _scheduler['scheduler'] = scheduler
+        return scheduler
+
+def ensure_scheduler_started():
+    """最初のリクエストでスケジューラーの起動を始める（応答は待たせない）"""
+    if _scheduler['pid'] != os.getpid():
+        threading.Thread(target=start_scheduler, name='scheduler-start', daemon=True).start()
+
+def scheduler_state():
+    """スケジューラーの状態（起動前: idle / 動作中: running / 停止: dead / タイマー処理が進まない: stalled）"""
+    scheduler = _scheduler['scheduler']
+    if _scheduler['pid'] != os.getpid() or scheduler is None:
+        return 'idle'
+    if not scheduler.running:
+        return 'dead'
+    if time.monotonic() - _scheduler['last_run'] > TIMER_LEASE_SECONDS:
+        return 'stalled'
+    return 'running'
+
 # ポモドーロタイマーのエンドポイント
-@app.route('/api/pomodoro/start', methods=['POST'])
+@api.route('/api/pomodoro/start', methods=['POST'])
 def start_pomodoro():
     """ポモドーロタイマー開始"""
     try:
         # ポモドーロ開始
-        pomodoro_id = add_pomodoro()
+        pomodoro_id = storage.add_pomodoro()
         
         # 25分後の終了時刻
         end_time = datetime.now() + timedelta(minutes=25)
         
-        # APSchedulerでタイマー終了をスケジュール
-        scheduler.add_job(
-            pomodoro_finished_callback,
-            'date',
-            run_date=end_time,
-            args=[pomodoro_id],
-            id=f'pomodoro_{pomodoro_id}'
-        )
+        # タイマー終了をDBに登録（どのワーカーが落ちても失われない）
+        storage.add_timer(pomodoro_id, end_time)
+        event_broker.publish('pomodoro_started', {'pomodoro_id': pomodoro_id, 'end_time': end_time.isoformat()})
         
         # Discord通知
         send_discord_notification('🍅 ポモドーロタイマー開始！')
@@ -174,7 +552,7 @@ def start_pomodoro():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/pomodoro/stop', methods=['POST'])
+@api.route('/api/pomodoro/stop', methods=['POST'])
 def stop_pomodoro():
     """ポモドーロタイマー停止"""
     try:
@@ -184,37 +562,66 @@ def stop_pomodoro():
         if not pomodoro_id:
             return jsonify({'success': False, 'error': 'pomodoro_id is required'}), 400
         
-        # ポモドーロ終了
-        update_pomodoro(pomodoro_id, datetime.now(), completed=False)
+        # スケジュールされたタイマーをキャンセル（全ワーカーに反映される）
+        # キャンセルできなければタイマーが先に発火して完了にしているので、中断で上書きしない
+        if not storage.cancel_timer(pomodoro_id):
+            return jsonify({'success': True, 'stopped': False})
         
-        # スケジュールされたタイマーをキャンセル
-        try:
-            scheduler.remove_job(f'pomodoro_{pomodoro_id}')
-        except:
-            pass  # ジョブが存在しない場合は無視
+        # ポモドーロ終了
+        storage.update_pomodoro(pomodoro_id, datetime.now(), completed=False)
+        event_broker.publish('pomodoro_stopped', {'pomodoro_id': pomodoro_id})
         
         # Discord通知
         send_discord_notification('⏹️ ポモドーロタイマーを停止しました')
         
-        return jsonify({'success': True})
+        return jsonify({'success': True, 'stopped': True})
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def conditional_json(resource, build_payload, tag_suffix='', encode=jsonify):
+    """リソースのバージョンでETag/Last-Modifiedを付ける
+
+    If-None-Match が一致すれば（なければ If-Modified-Since 以降に更新がなければ）
+    データを読まずに304を返す。レコードを返す build_payload には encode=record_json を渡す。
+    """
+    version, updated_at = storage.get_resource_version(resource)
+    etag = f'{resource}-{version}{tag_suffix}'
+    # Last-Modified は秒単位なので、更新した秒が過ぎてから付ける
+    # （同じ秒のうちにもう一度更新されると If-Modified-Since で変更を見逃すため）
+    last_modified = None
+    if updated_at and int(updated_at) < int(time.time()):
+        last_modified = datetime.fromtimestamp(int(updated_at), timezone.utc)
+    
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains(etag)
+    else:
+        not_modified = (last_modified is not None and request.if_modified_since is not None
+                        and last_modified <= request.if_modified_since)
+    if not_modified:
+        response = Response(status=304)
+    else:
+        response = encode(build_payload())
+    
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 # タスク管理のエンドポイント
-@app.route('/api/categories', methods=['GET'])
+@api.route('/api/categories', methods=['GET'])
 def get_categories_api():
     """カテゴリ一覧取得"""
     try:
-        categories = get_categories()
-        return jsonify({
+        return conditional_json('categories', lambda: {
             'success': True,
-            'categories': [dict(cat) for cat in categories]
+            'categories': [dict(cat) for cat in storage.get_categories()]
         })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/categories', methods=['POST'])
+@api.route('/api/categories', methods=['POST'])
 def add_category_api():
     """カテゴリ追加"""
     try:
@@ -225,7 +632,7 @@ def add_category_api():
         if not name:
             return jsonify({'success': False, 'error': 'category name is required'}), 400
         
-        category_id = add_category(name, color)
+        category_id = storage.add_category(name, color)
         
         return jsonify({
             'success': True,
@@ -235,19 +642,18 @@ def add_category_api():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/task-templates', methods=['GET'])
+@api.route('/api/task-templates', methods=['GET'])
 def get_task_templates_api():
     """タスクテンプレート一覧取得"""
     try:
-        templates = get_task_templates()
-        return jsonify({
+        return conditional_json('task_templates', lambda: {
             'success': True,
-            'templates': [dict(template) for template in templates]
+            'templates': [dict(template) for template in storage.get_task_templates()]
         })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/task-templates', methods=['POST'])
+@api.route('/api/task-templates', methods=['POST'])
 def add_task_template_api():
     """タスクテンプレート追加"""
     try:
@@ -258,7 +664,7 @@ def add_task_template_api():
         if not name:
             return jsonify({'success': False, 'error': 'task name is required'}), 400
         
-        template_id = add_task_template(name, category_id)
+        template_id = storage.add_task_template(name, category_id)
         
         return jsonify({
             'success': True,
@@ -268,16 +674,16 @@ def add_task_template_api():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/task-templates/<int:template_id>', methods=['DELETE'])
+@api.route('/api/task-templates/<int:template_id>', methods=['DELETE'])
 def delete_task_template_api(template_id):
     """タスクテンプレート削除"""
     try:
-        deactivate_task_template(template_id)
+        storage.deactivate_task_template(template_id)
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/task/start', methods=['POST'])
+@api.route('/api/task/start', methods=['POST'])
 def start_task():
     """タスク開始"""
     try:
@@ -289,13 +695,14 @@ def start_task():
         if not task_name:
             return jsonify({'success': False, 'error': 'task name is required'}), 400
         
-        # 現在アクティブなタスクがあれば終了する
-        active_task = get_active_task()
-        if active_task:
-            update_task(active_task['id'], datetime.now())
-        
-        # 新しいタスク開始
-        task_id = add_task(task_name, category_id, template_id)
+        # 現在アクティブなタスクの終了と新しいタスクの開始を1トランザクションで行う
+        task_id, previous_task_id = storage.switch_task(task_name, category_id, template_id)
+        event_broker.publish('task_switched', {
+            'task_id': task_id,
+            'task_name': task_name,
+            'category_id': category_id,
+            'previous_task_id': previous_task_id
+        })
         
         # Discord通知
         message = f'📋 タスク開始: {task_name}'
@@ -311,7 +718,7 @@ def start_task():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/task/stop', methods=['POST'])
+@api.route('/api/task/stop', methods=['POST'])
 def stop_task():
     """タスク終了"""
     try:
@@ -320,14 +727,15 @@ def stop_task():
         
         if not task_id:
             # アクティブなタスクを取得
-            active_task = get_active_task()
+            active_task = storage.get_active_task()
             if active_task:
                 task_id = active_task['id']
             else:
                 return jsonify({'success': False, 'error': 'No active task found'}), 400
         
         # タスク終了
-        update_task(task_id, datetime.now())
+        storage.update_task(task_id, datetime.now())
+        event_broker.publish('task_stopped', {'task_id': task_id})
         
         # Discord通知
         send_discord_notification('✅ タスクを完了しました')
@@ -337,11 +745,11 @@ def stop_task():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/task/current', methods=['GET'])
+@api.route('/api/task/current', methods=['GET'])
 def get_current_task():
     """現在のアクティブなタスクを取得"""
     try:
-        active_task = get_active_task()
+        active_task = storage.get_active_task()
         
         if active_task:
             return jsonify({
@@ -361,7 +769,7 @@ def get_current_task():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/note', methods=['POST'])
+@api.route('/api/note', methods=['POST'])
 def add_note_api():
     """メモ追加"""
     try:
@@ -371,7 +779,7 @@ def add_note_api():
         
         # task_idが指定されていない場合、アクティブなタスクを使用
         if not task_id:
-            active_task = get_active_task()
+            active_task = storage.get_active_task()
             if active_task:
                 task_id = active_task['id']
             else:
@@ -381,67 +789,117 @@ def add_note_api():
             return jsonify({'success': False, 'error': 'note is required'}), 400
         
         # メモ追加
-        note_id = add_note(task_id, note_text)
+        note_id = storage.add_note(task_id, note_text)
+        event_broker.publish('note_added', {'note_id': note_id, 'task_id': task_id, 'note': note_text})
         
         return jsonify({'success': True, 'note_id': note_id})
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/today', methods=['GET'])
+@api.route('/api/events', methods=['GET'])
+def events_stream():
+    """ポモドーロ・タスク・メモの変化をServer-Sent Eventsで配信"""
+    subscriber = event_broker.subscribe(request.headers.get('Last-Event-ID'))
+    if subscriber is None:
+        response = jsonify({'success': False, 'error': 'too many event streams'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(int(event_broker.retry_seconds))
+        return response
+    
+    return Response(event_broker.stream(subscriber, EVENTS_HEARTBEAT_SECONDS), 200, {
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@api.route('/api/today', methods=['GET'])
 def get_today_summary():
     """今日のサマリー取得"""
     try:
-        pomodoros = get_today_pomodoros()
-        tasks = get_today_tasks()
-        
-        summary = {
-            'date': datetime.now().strftime('%Y-%m-%d'),
-            'pomodoros': [],
-            'tasks': []
-        }
-        
-        # Cloud Run環境（Firestore）とローカル環境（SQLite）で処理を分岐
-        if os.getenv('K_SERVICE'):
-            # Firestore: 辞書形式のデータ
-            summary['pomodoros'] = pomodoros
-            
-            # タスク情報とメモを結合
-            for task in tasks:
-                task['notes'] = get_task_notes(task['id'])
-            summary['tasks'] = tasks
-        else:
-            # SQLite: タプル形式のデータ
-            for pomo in pomodoros:
-                pomo_data = {
-                    'id': pomo[0],
-                    'start_at': pomo[1],
-                    'end_at': pomo[2],
-                    'completed': pomo[3]
-                }
-                summary['pomodoros'].append(pomo_data)
-            
-            for task in tasks:
-                task_data = {
-                    'id': task[0],
-                    'name': task[1],
-                    'start_at': task[2],
-                    'end_at': task[3],
-                    'status': task[4],
-                    'notes': get_task_notes(task[0])
-                }
-                summary['tasks'].append(task_data)
-        
-        return jsonify(summary)
-        
+        today = datetime.now().strftime('%Y-%m-%d')
+        return conditional_json('today', lambda: build_today_summary(today), tag_suffix=f'-{today}',
+                                encode=record_json)
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/health', methods=['GET'])
+def build_today_summary(today):
+    """今日のサマリーを組み立てる（Firestoreは日別サマリーの1ドキュメントを読むだけ）"""
+    return storage.get_daily_summary(date.fromisoformat(today))
+
+@api.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus形式のメトリクス（gunicornでは全ワーカー分を合算）"""
+    body, content_type = metrics.render()
+    return Response(body, 200, {'Content-Type': content_type})
+
+@api.route('/health', methods=['GET'])
 def health_check():
     """ヘルスチェック"""
     return jsonify({'status': 'ok', 'timestamp': datetime.now().isoformat()})
 
+@api.route('/health/live', methods=['GET'])
+def liveness_check():
+    """ライブネスプローブ（プロセスが応答できるかだけを見る）"""
+    return jsonify({'status': 'ok'})
+
+@api.route('/health/ready', methods=['GET'])
+def readiness_check():
+    """レディネスプローブ
+
+    ストレージの疎通は HEALTH_CHECK_INTERVAL_SECONDS ごとに1回だけ確認し、間は前回の結果を使う。
+    スケジューラー・SSE受信・Discord通知のスレッドは、起動済みなのに止まっていれば失敗にする
+    （未起動の idle は、最初に必要になったときに起動するので正常として扱う）。
+    """
+    threads = {
+        'scheduler': scheduler_state(),
+        'event_broker': event_broker.thread_state(),
+        'notifier': notifier.thread_state()
+    }
+    checks = {'storage': storage_check.result()}
+    for name, state in threads.items():
+        checks[name] = {'ok': state in ('idle', 'running'), 'state': state}
+    checks['notifier'].update(backlog=notifier.backlog(), dropped=notifier.dropped)
+    ready = all(check['ok'] for check in checks.values())
+    return jsonify({'status': 'ok' if ready else 'unavailable', 'checks': checks}), 200 if ready else 503
+
+def create_app():
+    """アプリを作成
+
+    ストレージの読み込み・init_db()・スケジューラー・Discord通知の送信スレッドは
+    最初に必要になるまで遅らせるので、import直後の /health はすぐに応答できる。
+    """
+    app = Flask(__name__)
+    
+    # 本番環境対応のCORS設定
+    if os.getenv('FLASK_ENV') == 'production':
+        # 本番環境ではフロントエンドのURLのみ許可
+        frontend_url = os.getenv('FRONTEND_URL', 'http://localhost')
+        CORS(app, origins=[frontend_url])
+    else:
+        # 開発環境では全てのオリジンを許可
+        CORS(app)
+    
+    @app.before_request
+    def start_request_timer():
+        """リクエストの処理時間の計測開始と、スケジューラーの起動"""
+        g.request_started = time.perf_counter()
+        ensure_scheduler_started()
+    
+    @app.after_request
+    def record_request_time(response):
+        """ルートごとの処理時間を記録（未定義のパスは1つにまとめる）"""
+        started = g.pop('request_started', None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            metrics.observe_request(request.method, route, response.status_code, time.perf_counter() - started)
+        return response
+    
+    app.register_blueprint(api)
+    return app
+
+app = create_app()
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5001))
     app.run(host='0.0.0.0', port=port)
\ No newline at end of file
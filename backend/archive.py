@@ -0,0 +1,245 @@
+"""SQLiteの締まった月の記録をアーカイブDBへ移す
+
+ARCHIVE_KEEP_MONTHS か月より前の月のポモドーロ・タスク・メモを、本体のDB（pomo_hub.db）から
+隣のアーカイブDB（pomo_hub.archive.db）へ月単位で移す。移した月は本体の archived_months に
+記録し、その最後の月の翌月1日0時を「境界」とする。アーカイブの行はすべて境界より前なので、
+models は読む期間が境界より前にかかるときだけアーカイブを読み取り専用でATTACHし、
+本体のテーブルとUNION ALLで合わせて読む（最近の期間を読むときはアーカイブを開かない）。
+アーカイブへのコミットを本体より先に済ませるので、本体から消えた行は必ずアーカイブにある。
+読む側は実行後に境界を読み直し、変わっていたら新しい境界で読み直す。
+
+進行中のタスク・タイマー待ちのポモドーロなど、まだ更新されうる行は移さずに本体に残す。
+アーカイブは境界より後の月だけを移すので、月を移したときに残した行や、翌月以降に終わったタスク、
+後からインポートした境界より前の行は、以後も本体に残り続ける（本体から読むので表示・集計には
+含まれる）。境界より前の行をあとから移すと、アーカイブへのコミットから本体での削除までの間に
+二重に見えてしまうため移さない。残っている件数は archive --status で確認できる。
+"""
+import os
+import sqlite3
+import time
+import urllib.parse
+from datetime import date
+
+# 本体に残す月数（今月に加えて、直前の何か月を残すか）
+ARCHIVE_KEEP_MONTHS = int(os.getenv('ARCHIVE_KEEP_MONTHS', '3'))
+
+# アーカイブDBへの書き込みが、読み込み中のワーカーを待つ時間
+ARCHIVE_LOCK_TIMEOUT_MS = 60000
+
+# アーカイブするテーブルの列（本体と同じ順序・同じ型で、UNION ALLでそのまま合わせられる）
+ARCHIVED_COLUMNS = {
+    'pomodoros': 'id, start_at, end_at, completed',
+    'tasks': 'id, template_id, category_id, name, start_at, end_at, status',
+    'notes': 'id, task_id, body, created_at',
+}
+
+# アーカイブDBのスキーマ（本体と同じ列の型・インデックス。行は本体のIDのまま移す）
+ARCHIVE_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS pomodoros (
+           id INTEGER PRIMARY KEY,
+           start_at TIMESTAMP NOT NULL,
+           end_at TIMESTAMP,
+           completed BOOLEAN DEFAULT FALSE
+       )''',
+    '''CREATE TABLE IF NOT EXISTS tasks (
+           id INTEGER PRIMARY KEY,
+           template_id INTEGER,
+           category_id INTEGER,
+           name TEXT NOT NULL,
+           start_at TIMESTAMP NOT NULL,
+           end_at TIMESTAMP,
+           status TEXT DEFAULT 'active'
+       )''',
+    '''CREATE TABLE IF NOT EXISTS notes (
+           id INTEGER PRIMARY KEY,
+           task_id INTEGER NOT NULL,
+           body TEXT NOT NULL,
+           created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+       )''',
+    'CREATE INDEX IF NOT EXISTS idx_pomodoros_start_at ON pomodoros (start_at)',
+    'CREATE INDEX IF NOT EXISTS idx_pomodoros_completed_start_at ON pomodoros (completed, start_at)',
+    'CREATE INDEX IF NOT EXISTS idx_tasks_start_at ON tasks (start_at)',
+    'CREATE INDEX IF NOT EXISTS idx_tasks_status_start_at ON tasks (status, start_at)',
+    'CREATE INDEX IF NOT EXISTS idx_tasks_category_id_start_at ON tasks (category_id, start_at)',
+    'CREATE INDEX IF NOT EXISTS idx_notes_task_id_created_at ON notes (task_id, created_at)',
+]
+
+# 月の中で移す行（?1 は月初、?2 は翌月初）
+# 進行中のタスクとタイマー待ちのポモドーロは本体に残す。タスクは月内に終わったものだけを移すので、
+# アーカイブのタスクはすべて境界までに終わっている（境界以後のポモドーロの時点で進行中のものはない）。
+# {db} は本体のスキーマ名（本体の接続では main、アーカイブ側の接続では hot）
+MOVABLE_CONDITIONS = {
+    'pomodoros': '''start_at >= ?1 AND start_at < ?2
+                    AND id NOT IN (SELECT pomodoro_id FROM {db}.timers WHERE status = 'pending')''',
+    'tasks': '''start_at >= ?1 AND start_at < ?2 AND end_at < ?2 AND status != 'active'
+                AND id NOT IN (SELECT task_id FROM {db}.active_task)''',
+}
+
+def archive_path(database):
+    """本体のDBに対応するアーカイブDBのパス（pomo_hub.db -> pomo_hub.archive.db）"""
+    root, ext = os.path.splitext(database)
+    return f'{root}.archive{ext or ".db"}'
+
+def _read_only_uri(path):
+    return 'file:' + urllib.parse.quote(os.path.abspath(path)) + '?mode=ro'
+
+def attach(conn, path):
+    """アーカイブDBを読み取り専用で archive としてATTACH（接続は uri=True で開いておく）"""
+    conn.execute('ATTACH DATABASE ? AS archive', (_read_only_uri(path),))
+
+def get_boundary(conn):
+    """アーカイブ済みの期間の終わり（'YYYY-MM-DD HH:MM:SS'）、アーカイブがなければNone"""
+    return conn.execute('SELECT MAX(range_end) FROM archived_months').fetchone()[0]
+
+def get_archived_months(conn):
+    """アーカイブ済みの (月, ポモドーロ数, タスク数, メモ数, アーカイブ日時のepoch秒) の一覧"""
+    return [tuple(row) for row in conn.execute(
+        'SELECT month, pomodoros, tasks, notes, archived_at FROM archived_months ORDER BY month'
+    )]
+
+def count_left_behind(conn):
+    """境界より前に始まったのに本体に残っている行の件数を {テーブル: 件数} で返す（アーカイブがなければNone）"""
+    boundary = get_boundary(conn)
+    if boundary is None:
+        return None
+    return {
+        'pomodoros': conn.execute('SELECT COUNT(*) FROM pomodoros WHERE start_at < ?', (boundary,)).fetchone()[0],
+        'tasks': conn.execute('SELECT COUNT(*) FROM tasks WHERE start_at < ?', (boundary,)).fetchone()[0],
+        'notes': conn.execute(
+            'SELECT COUNT(*) FROM notes WHERE task_id IN (SELECT id FROM tasks WHERE start_at < ?)',
+            (boundary,)
+        ).fetchone()[0],
+    }
+
+# アーカイブを読まないときのFROM句（本体のテーブルそのまま）
+HOT_SOURCES = {table: table for table in ARCHIVED_COLUMNS}
+HOT_SOURCES['task_parts'] = (('tasks', ''),)
+
+def union_sources(boundary):
+    """本体とアーカイブ（境界より前の行だけ）を合わせた、テーブルごとのFROM句の副問い合わせ
+
+    アーカイブ側を境界で絞るので、移している途中の月の行が二重に見えることはない。
+    メモはタスクと一緒に移すので、タスクの開始時刻で絞る。境界は副問い合わせで読むと
+    UNION ALLが平坦化されずに全件を並べ替えるので、値を埋め込む（月に1回しか変わらない）。
+    """
+    arms = {
+        'pomodoros': f"SELECT {ARCHIVED_COLUMNS['pomodoros']} FROM archive.pomodoros WHERE start_at < '{boundary}'",
+        'tasks': f"SELECT {ARCHIVED_COLUMNS['tasks']} FROM archive.tasks WHERE start_at < '{boundary}'",
+        'notes': f"""SELECT n.id, n.task_id, n.body, n.created_at FROM archive.notes n
+                     JOIN archive.tasks t ON t.id = n.task_id WHERE t.start_at < '{boundary}'""",
+    }
+    sources = {
+        table: f'(SELECT {columns} FROM main.{table} UNION ALL {arms[table]})'
+        for table, columns in ARCHIVED_COLUMNS.items()
+    }
+    # 相関サブクエリの条件はUNION ALLの各部分に押し込まれないので、タスクは部分ごとにも引けるようにする
+    # （FROM句, ポモドーロ p に対する条件）。アーカイブのタスクは境界までに終わっているので境界より前だけ引く
+    sources['task_parts'] = (
+        ('main.tasks', ''),
+        ('archive.tasks', f"AND t.start_at < '{boundary}' AND p.start_at < '{boundary}'"),
+    )
+    return sources
+
+def _month_after(month_start):
+    return date(month_start.year + month_start.month // 12, month_start.month % 12 + 1, 1)
+
+def closed_months(conn, keep_months=ARCHIVE_KEEP_MONTHS, today=None):
+    """まだアーカイブしていない、移してよい月の [月初, 翌月初) の一覧
+
+    境界（初回は最も古い記録の月）から、今月と直前の keep_months か月を除いた月までを順に返す。
+    """
+    today = today or date.today()
+    cutoff_index = today.year * 12 + today.month - 1 - keep_months
+    cutoff = date(cutoff_index // 12, cutoff_index % 12 + 1, 1)
+
+    boundary = get_boundary(conn)
+    if boundary is None:
+        boundary = conn.execute(
+            'SELECT MIN(start_at) FROM (SELECT MIN(start_at) AS start_at FROM pomodoros '
+            'UNION ALL SELECT MIN(start_at) FROM tasks)'
+        ).fetchone()[0]
+        if boundary is None:
+            return []
+    month_start = date.fromisoformat(boundary[:7] + '-01')
+
+    months = []
+    while month_start < cutoff:
+        months.append((month_start, _month_after(month_start)))
+        month_start = _month_after(month_start)
+    return months
+
+def archive_month(hot, cold, month_start, month_end):
+    """1か月分の行をアーカイブDBへ移し、移した件数を {テーブル: 件数} で返す
+
+    hot は本体のDB、cold はアーカイブDB（書き込み可、本体を hot としてATTACH済み）の接続。
+    本体の書き込みロックを取ったままアーカイブへコピーしてコミットし、その後に本体から削除して
+    archived_months に記録する。本体がWALだとDBをまたぐトランザクションはDBごとにしか
+    アトミックにならないため、コミットを「アーカイブが先」の2回に分けている。
+    途中で止まってもアーカイブ側の行は境界より後なので見えず、再実行すると同じ月をやり直す。
+    """
+    month_range = (str(month_start), str(month_end))
+    with hot:
+        hot.execute('BEGIN IMMEDIATE')
+        counts = {}
+        with cold:
+            for table in ('pomodoros', 'tasks'):
+                counts[table] = cold.execute(
+                    f'''INSERT OR REPLACE INTO {table} ({ARCHIVED_COLUMNS[table]})
+                        SELECT {ARCHIVED_COLUMNS[table]} FROM hot.{table}
+                        WHERE {MOVABLE_CONDITIONS[table].format(db='hot')}''',
+                    month_range
+                ).rowcount
+            counts['notes'] = cold.execute(
+                f'''INSERT OR REPLACE INTO notes ({ARCHIVED_COLUMNS['notes']})
+                    SELECT {ARCHIVED_COLUMNS['notes']} FROM hot.notes
+                    WHERE task_id IN (SELECT id FROM hot.tasks WHERE {MOVABLE_CONDITIONS['tasks'].format(db='hot')})''',
+                month_range
+            ).rowcount
+
+        hot.execute(
+            f'''DELETE FROM notes
+                WHERE task_id IN (SELECT id FROM tasks WHERE {MOVABLE_CONDITIONS['tasks'].format(db='main')})''',
+            month_range
+        )
+        for table in ('tasks', 'pomodoros'):
+            hot.execute(f"DELETE FROM {table} WHERE {MOVABLE_CONDITIONS[table].format(db='main')}", month_range)
+        hot.execute(
+            '''INSERT OR REPLACE INTO archived_months (month, range_end, pomodoros, tasks, notes, archived_at)
+               VALUES (?, ?, ?, ?, ?, ?)''',
+            (f'{month_start:%Y-%m}', f'{month_end} 00:00:00',
+             counts['pomodoros'], counts['tasks'], counts['notes'], time.time())
+        )
+    return counts
+
+def open_archive(database):
+    """書き込み用にアーカイブDBを開き（なければ作成）、本体を hot としてATTACHした接続を返す
+
+    アーカイブは月に1回程度しか書き込まないので、WALにせず通常のジャーナルで使う
+    （読み取り専用のATTACHが -wal・-shm ファイルを必要としない）。
+    """
+    cold = sqlite3.connect(archive_path(database), timeout=ARCHIVE_LOCK_TIMEOUT_MS / 1000, uri=True)
+    for statement in ARCHIVE_SCHEMA:
+        cold.execute(statement)
+    cold.commit()
+    cold.execute('ATTACH DATABASE ? AS hot', (_read_only_uri(database),))
+    return cold
+
+def archive_closed_months(hot, database, keep_months=ARCHIVE_KEEP_MONTHS, today=None, on_archive=None):
+    """締まった月を古い順にすべてアーカイブし、[(月初, {テーブル: 件数})] を返す
+
+    hot は本体のDBの接続、database はそのパス。on_archive(月初, 件数) は1か月移すごとに呼ばれる。
+    """
+    months = closed_months(hot, keep_months, today)
+    if not months:
+        return []
+    archived = []
+    cold = open_archive(database)
+    try:
+        for month_start, month_end in months:
+            counts = archive_month(hot, cold, month_start, month_end)
+            if on_archive is not None:
+                on_archive(month_start, counts)
+            archived.append((month_start, counts))
+    finally:
+        cold.close()
+    return archived
@@ -0,0 +1,125 @@
+"""起動時間のベンチマーク（import時間と最初の応答までの時間）
+
+新しいプロセスで app を import する時間と、gunicornを起動してから
+/health と /api/today が最初に応答するまでの時間を --runs 回ずつ計測する。
+--baseline にgitのrefを渡すと、その時点の backend/ も同じ条件で計測して並べる。
+--output にJSONで保存し、--compare に以前のJSONを渡すと変化率も表示する。
+
+    python benchmarks/bench_cold_start.py --runs 10 --baseline HEAD~1 --output cold_start.json
+"""
+import argparse
+import http.client
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench_connections import export_backend, free_port
+from common import BACKEND_DIR, print_comparison, print_table, seed_history, summarize, write_results
+
+IMPORT_SCRIPT = 'import time; started = time.perf_counter(); import app; print(time.perf_counter() - started)'
+
+def server_env():
+    """計測用の環境変数（SQLiteを使い、Discordには送らない）"""
+    env = dict(os.environ)
+    env.pop('K_SERVICE', None)
+    env['DISCORD_WEBHOOK_URL'] = ''
+    return env
+
+def measure_import(source_dir, workdir):
+    """新しいプロセスで app を import する秒数"""
+    env = server_env()
+    env['PYTHONPATH'] = source_dir
+    output = subprocess.check_output([sys.executable, '-c', IMPORT_SCRIPT], cwd=workdir, env=env, text=True)
+    return float(output.strip().splitlines()[-1])
+
+def get(port, path):
+    """GETを1回送り、ステータスを返す（接続できなければNone）"""
+    try:
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        conn.request('GET', path)
+        response = conn.getresponse()
+        response.read()
+        conn.close()
+        return response.status
+    except OSError:
+        return None
+
+def measure_first_response(source_dir, workdir, workers, timeout=60):
+    """gunicornを起動し、(最初の /health までの秒数, 続く最初の /api/today までの秒数, その1回の秒数) を返す"""
+    port = free_port()
+    command = [
+        sys.executable, '-m', 'gunicorn',
+        '--config', os.path.join(source_dir, 'gunicorn_config.py'),
+        '--bind', f'127.0.0.1:{port}',
+        '--workers', str(workers),
+        '--chdir', workdir,
+        '--pythonpath', source_dir,
+        '--log-level', 'warning',
+        '--access-logfile', '/dev/null',
+        'app:app',
+    ]
+    started = time.perf_counter()
+    server = subprocess.Popen(command, env=server_env())
+    try:
+        deadline = started + timeout
+        while get(port, '/health') != 200:
+            if time.perf_counter() > deadline:
+                raise RuntimeError('server did not start')
+            time.sleep(0.005)
+        health = time.perf_counter() - started
+        request_started = time.perf_counter()
+        status = get(port, '/api/today')
+        if status != 200:
+            raise RuntimeError(f'/api/today returned {status}')
+        finished = time.perf_counter()
+        return health, finished - started, finished - request_started
+    finally:
+        server.terminate()
+        server.wait()
+
+def bench_tree(label, source_dir, args, results):
+    """1つのソースツリーを計測して results に追加"""
+    suffix = '' if label == 'working tree' else f' ({label})'
+    with tempfile.TemporaryDirectory() as workdir:
+        seed_history(os.path.join(workdir, 'pomo_hub.db'), args.days)
+        imports, healths, todays, first_requests = [], [], [], []
+        for _ in range(args.runs):
+            imports.append(measure_import(source_dir, workdir))
+            health, today, first_request = measure_first_response(source_dir, workdir, args.workers)
+            healths.append(health)
+            todays.append(today)
+            first_requests.append(first_request)
+
+    results[f'import app{suffix}'] = summarize(imports)
+    results[f'spawn -> first /health{suffix}'] = summarize(healths)
+    results[f'spawn -> first /api/today{suffix}'] = summarize(todays)
+    results[f'first /api/today request{suffix}'] = summarize(first_requests)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10, help='計測回数')
+    parser.add_argument('--workers', type=int, default=1, help='gunicornのワーカー数（Cloud Runと同じ1が既定）')
+    parser.add_argument('--days', type=int, default=30, help='投入する履歴の日数')
+    parser.add_argument('--baseline', help='比較対象のgit ref（例: HEAD~1）')
+    parser.add_argument('--output', help='結果を保存するJSONファイル')
+    parser.add_argument('--compare', help='比較する以前の結果JSON')
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.baseline:
+            bench_tree(args.baseline, export_backend(args.baseline, tmp), args, results)
+        bench_tree('working tree', BACKEND_DIR, args, results)
+
+    print_table(results)
+    params = {key: value for key, value in vars(args).items() if key not in ('output', 'compare')}
+    if args.output:
+        write_results(args.output, 'cold_start', params, results)
+        print(f'\nsaved: {args.output}')
+    if args.compare:
+        print_comparison(args.compare, results)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+"""SQLite接続レイヤーのベンチマーク
+
+gunicorn_config.py の設定でアプリを起動し、/api/today などへの
+リクエスト/秒を計測する。--baseline にgitのrefを渡すと、その時点の
+backend/ を一時ディレクトリに展開して同じ条件で計測し、結果を並べて表示する。
+
+    python benchmarks/bench_connections.py --baseline HEAD~1 --duration 10
+"""
+import argparse
+import http.client
+import io
+import json
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(BACKEND_DIR)
+GUNICORN_CONFIG = os.path.join(BACKEND_DIR, 'gunicorn_config.py')
+
+def free_port():
+    """空いているTCPポートを取得"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def export_backend(ref, dest):
+    """指定refのbackend/をdestに展開"""
+    archive = subprocess.check_output(
+        ['git', 'archive', '--format=tar', ref, 'backend'], cwd=REPO_DIR
+    )
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(dest)
+    return os.path.join(dest, 'backend')
+
+def seed_database(path, tasks, notes_per_task):
+    """今日の日付でタスク・メモ・ポモドーロを投入"""
+    sys.path.insert(0, BACKEND_DIR)
+    import models
+    models.DATABASE = path
+    models.init_db()
+    models.close_db_connection()
+
+    conn = sqlite3.connect(path)
+    start = datetime.combine(datetime.now().date(), datetime.min.time())
+    for i in range(tasks):
+        started = start + timedelta(minutes=i)
+        cursor = conn.execute(
+            'INSERT INTO tasks (name, start_at, end_at, status) VALUES (?, ?, ?, ?)',
+            (f'task {i}', str(started), str(started + timedelta(seconds=50)), 'completed')
+        )
+        conn.executemany(
+            'INSERT INTO notes (task_id, body) VALUES (?, ?)',
+            [(cursor.lastrowid, f'note {j}') for j in range(notes_per_task)]
+        )
+        conn.execute(
+            'INSERT INTO pomodoros (start_at, end_at, completed) VALUES (?, ?, ?)',
+            (str(started), str(started + timedelta(minutes=25)), True)
+        )
+    conn.commit()
+    conn.close()
+
+def wait_for_server(port, timeout=30):
+    """サーバーが応答するまで待機"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/health')
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('server did not start')
+
+def run_load(port, paths, clients, duration):
+    """複数クライアントでGETを送り続け、リクエスト数とエラー数を返す"""
+    counts = [0] * clients
+    errors = [0] * clients
+    deadline = time.time() + duration
+
+    def client(index):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        i = 0
+        while time.time() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            try:
+                conn.request('GET', path)
+                response = conn.getresponse()
+                response.read()
+                if response.status == 200:
+                    counts[index] += 1
+                else:
+                    errors[index] += 1
+            except (OSError, http.client.HTTPException):
+                errors[index] += 1
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts), sum(errors)
+
+def bench_tree(label, source_dir, args):
+    """1つのソースツリーをgunicornで起動して計測"""
+    with tempfile.TemporaryDirectory() as workdir:
+        seed_database(os.path.join(workdir, 'pomo_hub.db'), args.tasks, args.notes)
+        port = free_port()
+        env = dict(os.environ)
+        env.pop('K_SERVICE', None)
+        env['DISCORD_WEBHOOK_URL'] = ''
+        command = [
+            sys.executable, '-m', 'gunicorn',
+            # 設定のフックはそのツリーのappを前提にするので、ツリーごとの設定で起動する
+            '--config', os.path.join(source_dir, 'gunicorn_config.py'),
+            '--bind', f'127.0.0.1:{port}',
+            '--chdir', workdir,
+            '--pythonpath', source_dir,
+            '--log-level', 'warning',
+            '--access-logfile', '/dev/null',
+        ]
+        if args.workers:
+            command += ['--workers', str(args.workers)]
+        command.append('app:app')
+        server = subprocess.Popen(command, env=env)
+        try:
+            wait_for_server(port)
+            run_load(port, args.paths, args.clients, 1)  # ウォームアップ
+            requests_done, errors = run_load(port, args.paths, args.clients, args.duration)
+        finally:
+            server.terminate()
+            server.wait()
+
+    return {
+        'label': label,
+        'requests': requests_done,
+        'errors': errors,
+        'requests_per_sec': round(requests_done / args.duration, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--baseline', help='比較対象のgit ref（例: HEAD~1）')
+    parser.add_argument('--duration', type=float, default=10.0, help='計測秒数')
+    parser.add_argument('--clients', type=int, default=16, help='同時クライアント数')
+    parser.add_argument('--workers', type=int, help='gunicornのワーカー数（省略時はgunicorn_config.pyの値）')
+    parser.add_argument('--tasks', type=int, default=40, help='今日のタスク数')
+    parser.add_argument('--notes', type=int, default=3, help='タスクあたりのメモ数')
+    parser.add_argument('--path', dest='paths', action='append',
+                        help='計測するパス（複数指定可、既定: /api/today）')
+    args = parser.parse_args()
+    args.paths = args.paths or ['/api/today']
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.baseline:
+            results.append(bench_tree(args.baseline, export_backend(args.baseline, tmp), args))
+        results.append(bench_tree('working tree', BACKEND_DIR, args))
+
+    for result in results:
+        print(f"{result['label']:>20}: {result['requests_per_sec']:>8} req/s "
+              f"({result['requests']} ok, {result['errors']} errors)")
+    if len(results) == 2 and results[0]['requests_per_sec']:
+        ratio = results[1]['requests_per_sec'] / results[0]['requests_per_sec']
+        print(f'{"speedup":>20}: {ratio:.2f}x')
+    print(json.dumps(results))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+"""HTTPの負荷試験
+
+一時ディレクトリのSQLiteに履歴を投入し、gunicorn_config.py の設定でアプリを起動して、
+エンドポイントごとに同時クライアントでリクエストを送り続ける。エンドポイントごとの
+p50/p95/p99レイテンシとスループットを表示し、--output にJSONで保存する。
+--compare に以前のJSONを渡すと変化率も表示する。
+
+    python benchmarks/bench_load.py --days 90 --duration 5 --output load.json
+    python benchmarks/bench_load.py --only today --only task_start --compare load.json
+"""
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from bench_connections import GUNICORN_CONFIG, free_port, wait_for_server
+from common import BACKEND_DIR, print_comparison, print_table, seed_history, summarize, write_results
+
+def call(conn, method, path, body=None, headers=None):
+    """1リクエストを送り、(ステータス, 応答ヘッダー, 本文, 所要秒) を返す"""
+    headers = dict(headers or {})
+    payload = None
+    if isinstance(body, bytes):
+        payload = body
+        headers.setdefault('Content-Type', 'application/x-ndjson')
+    elif body is not None:
+        payload = json.dumps(body)
+        headers['Content-Type'] = 'application/json'
+    started = time.perf_counter()
+    conn.request(method, path, payload, headers)
+    response = conn.getresponse()
+    data = response.read()
+    elapsed = time.perf_counter() - started
+    return response.status, response.headers, data, elapsed
+
+def scenario_get(path, label=None):
+    """GETを1回送るシナリオ（結果はlabel、省略時はクエリを除いたパスで集計）"""
+    name = f'GET {path.split("?")[0]}' + (f' ({label})' if label else '')
+
+    def run(conn, record):
+        status, _, _, elapsed = call(conn, 'GET', path)
+        record(name, status == 200, elapsed)
+    return run
+
+def scenario_today_not_modified(conn, record):
+    """ETagを付けて /api/today を取得（304が返る経路）"""
+    status, headers, _, _ = call(conn, 'GET', '/api/today')
+    _, _, _, elapsed = call(conn, 'GET', '/api/today', headers={'If-None-Match': headers.get('ETag', '')})
+    record('GET /api/today (304)', True, elapsed)
+
+def scenario_task_start(conn, record):
+    """タスクの切り替え"""
+    status, _, _, elapsed = call(conn, 'POST', '/api/task/start', {'task': 'load test', 'category_id': 1})
+    record('POST /api/task/start', status == 200, elapsed)
+
+def scenario_note(conn, record):
+    """進行中タスクへのメモ追加"""
+    status, _, _, elapsed = call(conn, 'POST', '/api/note', {'note': 'load test'})
+    record('POST /api/note', status == 200, elapsed)
+
+def scenario_task_stop(conn, record):
+    """タスクを開始して終了（他のクライアントが切り替えても自分のタスクを終了する）"""
+    status, _, data, _ = call(conn, 'POST', '/api/task/start', {'task': 'load test', 'category_id': 1})
+    if status == 200:
+        task_id = json.loads(data)['task_id']
+        status, _, _, elapsed = call(conn, 'POST', '/api/task/stop', {'task_id': task_id})
+        record('POST /api/task/stop', status == 200, elapsed)
+
+def scenario_category(conn, record):
+    """カテゴリの追加"""
+    status, _, _, elapsed = call(conn, 'POST', '/api/categories', {'name': 'load test', 'color': '#6b7280'})
+    record('POST /api/categories', status == 200, elapsed)
+
+def scenario_task_template(conn, record):
+    """タスクテンプレートの追加と削除"""
+    status, _, data, elapsed = call(conn, 'POST', '/api/task-templates', {'name': 'load test', 'category_id': 1})
+    record('POST /api/task-templates', status == 200, elapsed)
+    if status == 200:
+        template_id = json.loads(data)['template_id']
+        status, _, _, elapsed = call(conn, 'DELETE', f'/api/task-templates/{template_id}')
+        record('DELETE /api/task-templates/<id>', status == 200, elapsed)
+
+def scenario_import(records):
+    """records件のポモドーロをNDJSONで一括登録するシナリオ（投入済みの履歴より前の日付に入れる）"""
+    started = datetime.combine(date.today() - timedelta(days=3650), datetime.min.time())
+    body = ''.join(
+        json.dumps({'type': 'pomodoro', 'start_at': (started + timedelta(minutes=30 * i)).isoformat(),
+                    'end_at': (started + timedelta(minutes=30 * i + 25)).isoformat(), 'completed': True}) + '\n'
+        for i in range(records)
+    ).encode()
+    name = f'POST /api/import ({records} records)'
+
+    def run(conn, record):
+        status, _, _, elapsed = call(conn, 'POST', '/api/import?format=ndjson', body)
+        record(name, status == 200, elapsed)
+    return run
+
+_streams = threading.local()
+
+def scenario_events(conn, record):
+    """ポモドーロを開始し、自分のSSE接続にそのイベントが届くまで（接続はクライアントごとに張ったまま）"""
+    stream = getattr(_streams, 'response', None)
+    if stream is None or stream.isclosed():
+        stream_conn = http.client.HTTPConnection(conn.host, conn.port, timeout=60)
+        stream_conn.request('GET', '/api/events')
+        stream = stream_conn.getresponse()
+        if stream.status != 200:
+            stream_conn.close()
+            record('GET /api/events (delivery)', False, 0)
+            return
+        _streams.response = stream
+
+    started = time.perf_counter()
+    status, _, data, _ = call(conn, 'POST', '/api/pomodoro/start', {})
+    if status != 200:
+        record('GET /api/events (delivery)', False, 0)
+        return
+    pomodoro_id = json.loads(data)['pomodoro_id']
+    expected = f'"pomodoro_id": {pomodoro_id},'.encode()
+    while True:
+        line = stream.readline()
+        if not line:
+            _streams.response = None
+            record('GET /api/events (delivery)', False, 0)
+            break
+        if line.startswith(b'data: ') and expected in line:
+            record('GET /api/events (delivery)', True, time.perf_counter() - started)
+            break
+    call(conn, 'POST', '/api/pomodoro/stop', {'pomodoro_id': pomodoro_id})
+
+def scenario_pomodoro(conn, record):
+    """ポモドーロの開始と停止"""
+    status, _, data, elapsed = call(conn, 'POST', '/api/pomodoro/start', {})
+    record('POST /api/pomodoro/start', status == 200, elapsed)
+    if status == 200:
+        pomodoro_id = json.loads(data)['pomodoro_id']
+        status, _, _, elapsed = call(conn, 'POST', '/api/pomodoro/stop', {'pomodoro_id': pomodoro_id})
+        record('POST /api/pomodoro/stop', status == 200, elapsed)
+
+def build_scenarios(days):
+    """シナリオ名 -> 実行関数"""
+    today = date.today()
+    week_ago = today - timedelta(days=6)
+    month_ago = today - timedelta(days=min(days, 30) - 1)
+    return {
+        'health': scenario_get('/health'),
+        'today': scenario_get('/api/today'),
+        'today_304': scenario_today_not_modified,
+        'task_current': scenario_get('/api/task/current'),
+        'categories': scenario_get('/api/categories'),
+        'task_templates': scenario_get('/api/task-templates'),
+        'stats': scenario_get(f'/api/stats?from={month_ago}&to={today}&group_by=day'),
+        'history_tasks': scenario_get('/api/history/tasks?limit=50'),
+        'history_pomodoros': scenario_get('/api/history/pomodoros?limit=50'),
+        'export_ndjson': scenario_get(f'/api/export/data?format=ndjson&from={week_ago}&to={today}', 'ndjson'),
+        'export_csv': scenario_get(f'/api/export/data?format=csv&from={week_ago}&to={today}', 'csv'),
+        'task_start': scenario_task_start,
+        'note': scenario_note,
+        'task_stop': scenario_task_stop,
+        'pomodoro': scenario_pomodoro,
+        'category': scenario_category,
+        'task_template': scenario_task_template,
+        'import': scenario_import(100),
+        'events': scenario_events,
+    }
+
+def run_scenario(port, scenario, clients, duration):
+    """複数クライアントでシナリオを繰り返し、名前ごとのレイテンシとエラー数を返す"""
+    latencies = {}
+    errors = {}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client():
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        local_latencies, local_errors = {}, {}
+
+        def record(name, ok, elapsed):
+            if ok:
+                local_latencies.setdefault(name, []).append(elapsed)
+            else:
+                local_errors[name] = local_errors.get(name, 0) + 1
+
+        while time.perf_counter() < deadline:
+            try:
+                scenario(conn, record)
+            except (OSError, http.client.HTTPException):
+                local_errors['connection'] = local_errors.get('connection', 0) + 1
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        with lock:
+            for name, values in local_latencies.items():
+                latencies.setdefault(name, []).extend(values)
+            for name, count in local_errors.items():
+                errors[name] = errors.get(name, 0) + count
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    names = set(latencies) | set(errors)
+    return {name: summarize(latencies.get(name, []), elapsed, errors.get(name, 0)) for name in sorted(names)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--duration', type=float, default=5.0, help='シナリオごとの計測秒数')
+    parser.add_argument('--warmup', type=float, default=1.0, help='シナリオごとのウォームアップ秒数')
+    parser.add_argument('--clients', type=int, default=8, help='同時クライアント数')
+    parser.add_argument('--workers', type=int, help='gunicornのワーカー数（省略時はgunicorn_config.pyの値）')
+    parser.add_argument('--days', type=int, default=90, help='投入する履歴の日数')
+    parser.add_argument('--tasks-per-day', type=int, default=8, help='1日あたりのタスク数')
+    parser.add_argument('--notes-per-task', type=int, default=2, help='タスクあたりのメモ数')
+    parser.add_argument('--seed', type=int, default=0, help='履歴生成の乱数シード')
+    parser.add_argument('--only', action='append', help='実行するシナリオ名（複数指定可）')
+    parser.add_argument('--output', help='結果を保存するJSONファイル')
+    parser.add_argument('--compare', help='比較する以前の結果JSON')
+    args = parser.parse_args()
+
+    scenarios = build_scenarios(args.days)
+    selected = args.only or list(scenarios)
+    unknown = [name for name in selected if name not in scenarios]
+    if unknown:
+        parser.error(f'unknown scenario: {", ".join(unknown)} (available: {", ".join(scenarios)})')
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        counts = seed_history(os.path.join(workdir, 'pomo_hub.db'), args.days,
+                              args.tasks_per_day, args.notes_per_task, args.seed)
+        print(f'seeded: {counts}')
+        port = free_port()
+        env = dict(os.environ)
+        env.pop('K_SERVICE', None)
+        env['DISCORD_WEBHOOK_URL'] = ''
+        # 切断済みのSSE接続をすぐ片付け、全クライアント分の接続を受け付ける
+        env['EVENTS_HEARTBEAT_SECONDS'] = '0.5'
+        env['EVENTS_MAX_CLIENTS'] = str(args.clients * 2)
+        command = [
+            sys.executable, '-m', 'gunicorn',
+            '--config', GUNICORN_CONFIG,
+            '--bind', f'127.0.0.1:{port}',
+            '--chdir', workdir,
+            '--pythonpath', BACKEND_DIR,
+            '--log-level', 'warning',
+            '--access-logfile', '/dev/null',
+        ]
+        if args.workers:
+            command += ['--workers', str(args.workers)]
+        command.append('app:app')
+        server = subprocess.Popen(command, env=env)
+        try:
+            wait_for_server(port)
+            for name in selected:
+                run_scenario(port, scenarios[name], args.clients, args.warmup)
+                results.update(run_scenario(port, scenarios[name], args.clients, args.duration))
+        finally:
+            server.terminate()
+            server.wait()
+
+    print_table(results)
+    params = {key: value for key, value in vars(args).items() if key not in ('output', 'compare')}
+    if args.output:
+        write_results(args.output, 'load', params, results)
+        print(f'\nsaved: {args.output}')
+    if args.compare:
+        print_comparison(args.compare, results)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""models.py の関数ごとのマイクロベンチマーク
+
+一時ディレクトリのSQLiteに履歴を投入し、各関数を繰り返し呼んで1回あたりの
+p50/p95/p99と1秒あたりの回数を表示する。--output にJSONで保存し、--compare に
+以前のJSONを渡すと変化率も表示する。計測していない公開関数があれば最後に表示する。
+
+    python benchmarks/bench_models.py --days 365 --output models.json
+"""
+import argparse
+import inspect
+import os
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+from common import BACKEND_DIR, print_comparison, print_table, seed_history, summarize, write_results
+
+sys.path.insert(0, BACKEND_DIR)
+import models
+
+# 計測しない関数（接続の後始末や、stopまで戻らない待ち受けループ）
+SKIPPED = {'close_db_connection', 'watch_events'}
+
+def build_cases(days):
+    """(表示名, 関数, 呼び出しごとの引数を作る関数) の一覧（引数の準備は計測に含めない）"""
+    today = date.today()
+    week_ago = today - timedelta(days=6)
+    first_day = today - timedelta(days=days - 1)
+    task_ids = [task.id for task in models.get_today_tasks()]
+    latest = models.get_task_history(1)[0]
+    counter = iter(range(10 ** 9))
+
+    def pending_timer():
+        pomodoro_id = models.add_pomodoro()
+        models.add_timer(pomodoro_id, datetime.now() + timedelta(hours=1))
+        return pomodoro_id
+
+    def import_batch():
+        started = datetime.now() - timedelta(days=days + next(counter) % 30)
+        return ([('pomodoro', {'start_at': started, 'end_at': started + timedelta(minutes=25), 'completed': True})
+                 for _ in range(1000)],)
+
+    return [
+        ('init_db', models.init_db, lambda: ()),
+        ('get_db_connection', models.get_db_connection, lambda: ()),
+        ('get_resource_version', models.get_resource_version, lambda: ('today',)),
+        ('add_pomodoro', models.add_pomodoro, lambda: ()),
+        ('update_pomodoro', models.update_pomodoro, lambda: (models.add_pomodoro(), datetime.now(), True)),
+        ('add_category', models.add_category, lambda: (f'bench {next(counter)}',)),
+        ('get_categories', models.get_categories, lambda: ()),
+        ('add_task_template', models.add_task_template, lambda: ('bench', None)),
+        ('get_task_templates', models.get_task_templates, lambda: ()),
+        ('deactivate_task_template', models.deactivate_task_template,
+         lambda: (models.add_task_template('bench', None),)),
+        ('add_task', models.add_task, lambda: ('bench', 1)),
+        ('switch_task', models.switch_task, lambda: ('bench', 1)),
+        ('update_task', models.update_task, lambda: (models.add_task('bench', 1), datetime.now())),
+        ('add_note', models.add_note, lambda: (task_ids[0], 'bench')),
+        ('get_daily_summary', models.get_daily_summary, lambda: (today,)),
+        ('get_today_pomodoros', models.get_today_pomodoros, lambda: ()),
+        ('get_today_tasks', models.get_today_tasks, lambda: ()),
+        ('get_active_task', models.get_active_task, lambda: ()),
+        ('get_task_notes', models.get_task_notes, lambda: (task_ids[0],)),
+        ('get_notes_for_tasks', models.get_notes_for_tasks, lambda: (task_ids,)),
+        ('add_timer', models.add_timer, lambda: (models.add_pomodoro(), datetime.now() + timedelta(hours=1))),
+        ('cancel_timer', models.cancel_timer, lambda: (pending_timer(),)),
+        ('claim_due_timers', models.claim_due_timers, lambda: (datetime.now(),)),
+        ('count_pending_timers', models.count_pending_timers, lambda: ()),
+        ('ping', models.ping, lambda: ()),
+        ('acquire_lease', models.acquire_lease, lambda: ('bench', 'bench', 10)),
+        ('get_pomodoros_by_date', models.get_pomodoros_by_date, lambda: (today,)),
+        ('get_tasks_by_date', models.get_tasks_by_date, lambda: (today,)),
+        ('get_all_notes_by_date', models.get_all_notes_by_date, lambda: (today,)),
+        ('iter_pomodoros (7 days)', lambda *a: list(models.iter_pomodoros(*a)), lambda: (week_ago, today)),
+        ('iter_tasks (7 days)', lambda *a: list(models.iter_tasks(*a)), lambda: (week_ago, today)),
+        ('iter_notes (7 days)', lambda *a: list(models.iter_notes(*a)), lambda: (week_ago, today)),
+        ('get_task_history', models.get_task_history, lambda: (50,)),
+        ('get_task_history (cursor)', models.get_task_history,
+         lambda: (50, (latest.start_at, latest.id), 1, 'completed')),
+        ('get_pomodoro_history', models.get_pomodoro_history, lambda: (50, None, True)),
+        ('import_records (1000 records)', models.import_records, import_batch),
+        ('add_event', models.add_event, lambda: ('bench', '{}')),
+        ('get_daily_rollups (all days)', models.get_daily_rollups, lambda: (first_day, today)),
+        ('rebuild_daily_rollups (7 days)', models.rebuild_daily_rollups, lambda: (week_ago, today)),
+        ('get_stats (all days)', models.get_stats, lambda: (first_day, today, 'day')),
+        ('get_stats (by category)', models.get_stats, lambda: (first_day, today, 'category')),
+    ]
+
+def run_case(func, make_args, min_seconds, max_calls):
+    """min_seconds秒またはmax_calls回に達するまで呼び、1回ごとの所要秒を返す"""
+    latencies = []
+    total = 0.0
+    while total < min_seconds and len(latencies) < max_calls:
+        args = make_args()
+        started = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - started
+        latencies.append(elapsed)
+        total += elapsed
+    return latencies
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--days', type=int, default=365, help='投入する履歴の日数')
+    parser.add_argument('--tasks-per-day', type=int, default=8, help='1日あたりのタスク数')
+    parser.add_argument('--notes-per-task', type=int, default=2, help='タスクあたりのメモ数')
+    parser.add_argument('--seed', type=int, default=0, help='履歴生成の乱数シード')
+    parser.add_argument('--min-seconds', type=float, default=0.5, help='関数ごとの最低計測秒数')
+    parser.add_argument('--max-calls', type=int, default=5000, help='関数ごとの最大呼び出し回数')
+    parser.add_argument('--only', action='append', help='計測する関数名（前方一致、複数指定可）')
+    parser.add_argument('--output', help='結果を保存するJSONファイル')
+    parser.add_argument('--compare', help='比較する以前の結果JSON')
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        counts = seed_history(os.path.join(workdir, 'bench.db'), args.days,
+                              args.tasks_per_day, args.notes_per_task, args.seed)
+        print(f'seeded: {counts}')
+        models.DATABASE = os.path.join(workdir, 'bench.db')
+        cases = build_cases(args.days)
+        for name, func, make_args in cases:
+            if args.only and not any(name.startswith(prefix) for prefix in args.only):
+                continue
+            latencies = run_case(func, make_args, args.min_seconds, args.max_calls)
+            results[name] = summarize(latencies)
+        models.close_db_connection()
+
+    print_table(results)
+    covered = {name.split(' ')[0] for name, _, _ in cases}
+    public = {name for name, value in inspect.getmembers(models, inspect.isfunction)
+              if not name.startswith('_') and value.__module__ == models.__name__}
+    missing = sorted(public - covered - SKIPPED)
+    if missing:
+        print(f'\nnot benchmarked: {", ".join(missing)}')
+
+    params = {key: value for key, value in vars(args).items() if key not in ('output', 'compare')}
+    if args.output:
+        write_results(args.output, 'models', params, results)
+        print(f'\nsaved: {args.output}')
+    if args.compare:
+        print_comparison(args.compare, results)
+
+if __name__ == '__main__':
+    main()
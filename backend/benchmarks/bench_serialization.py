@@ -0,0 +1,121 @@
+"""大きなエクスポートのシリアライズ時間のベンチマーク
+
+generate_history.py で --years 年分の履歴を作り、/api/export/data（json・ndjson・csv）で
+全期間を書き出す時間と、同じ行をストレージから読むだけの時間（iter_*）を --runs 回ずつ計測する。
+両者の差がレコードをJSON・CSVにする時間になる。履歴のページ（limit=200）も計測する。
+--baseline にgitのrefを渡すと、その時点の backend/ も同じデータで計測して並べる。
+
+    python benchmarks/bench_serialization.py --years 1 --runs 5 --baseline HEAD~1 --output serialization.json
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date
+
+from bench_connections import export_backend
+from common import BACKEND_DIR, print_comparison, print_table, summarize, write_results
+
+EXPORT_FORMATS = ('json', 'ndjson', 'csv')
+
+def run_worker(args):
+    """--source のツリーで計測し、{名前: [秒, ...]} とメタ情報をJSONで標準出力に書く
+
+    サブプロセスで実行するので、ツリーごとに別のモジュールを読み込める。
+    """
+    sys.path.insert(0, args.source)
+    os.environ.pop('K_SERVICE', None)
+    os.environ['DISCORD_WEBHOOK_URL'] = ''
+    import app
+    import models
+
+    client = app.app.test_client()
+    start, end = date(2000, 1, 1), date(2100, 12, 31)
+    query = f'from={start}&to={end}'
+    latencies = {}
+    meta = {}
+
+    def measure(name, func):
+        latencies[name] = []
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            result = func()
+            latencies[name].append(time.perf_counter() - started)
+        return result
+
+    # 履歴のページは小さいので、大きなエクスポートでヒープが膨らむ前に計測する
+    for resource in ('tasks', 'pomodoros'):
+        measure(f'history {resource} (limit=200)',
+                lambda: client.get(f'/api/history/{resource}?limit=200').get_data())
+    rows = measure('fetch only (iter_*)', lambda: sum(
+        1 for iter_rows in (models.iter_pomodoros, models.iter_tasks, models.iter_notes)
+        for _ in iter_rows(start, end)
+    ))
+    meta['rows'] = rows
+    for export_format in EXPORT_FORMATS:
+        def export():
+            response = client.get(f'/api/export/data?format={export_format}&{query}')
+            assert response.status_code == 200, response.status_code
+            return len(response.get_data())
+        meta[f'{export_format}_bytes'] = measure(f'export {export_format}', export)
+    json.dump({'latencies': latencies, 'meta': meta}, sys.stdout)
+
+def bench_tree(label, source_dir, database, args, results):
+    """1つのソースツリーをサブプロセスで計測して results に追加"""
+    suffix = '' if label == 'working tree' else f' ({label})'
+    with tempfile.TemporaryDirectory() as workdir:
+        shutil.copy(database, os.path.join(workdir, 'pomo_hub.db'))
+        output = subprocess.check_output(
+            [sys.executable, os.path.abspath(__file__), '--worker', '--source', source_dir, '--runs', str(args.runs)],
+            cwd=workdir, text=True
+        )
+    measured = json.loads(output)
+    meta = measured['meta']
+    print(f"{label}: {meta['rows']} rows, " + ', '.join(
+        f"{export_format} {meta[f'{export_format}_bytes'] / 1e6:.1f}MB" for export_format in EXPORT_FORMATS
+    ))
+    for name, values in measured['latencies'].items():
+        results[name + suffix] = summarize(values)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--years', type=float, default=1.0, help='生成する履歴の年数')
+    parser.add_argument('--users', type=int, default=1, help='生成するユーザー数')
+    parser.add_argument('--runs', type=int, default=5, help='計測回数')
+    parser.add_argument('--baseline', help='比較対象のgit ref（例: HEAD~1）')
+    parser.add_argument('--output', help='結果を保存するJSONファイル')
+    parser.add_argument('--compare', help='比較する以前の結果JSON')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--source', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        database = os.path.join(tmp, 'history.db')
+        subprocess.run(
+            [sys.executable, os.path.join(BACKEND_DIR, 'benchmarks', 'generate_history.py'),
+             '--database', database, '--years', str(args.years), '--users', str(args.users)],
+            check=True, stdout=subprocess.DEVNULL
+        )
+        if args.baseline:
+            bench_tree(args.baseline, export_backend(args.baseline, tmp), database, args, results)
+        bench_tree('working tree', BACKEND_DIR, database, args, results)
+
+    print_table(results)
+    params = {key: value for key, value in vars(args).items() if key not in ('output', 'compare', 'worker', 'source')}
+    if args.output:
+        write_results(args.output, 'serialization', params, results)
+        print(f'\nsaved: {args.output}')
+    if args.compare:
+        print_comparison(args.compare, results)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,16 @@
+"""models.py の日付検索がフルスキャンしていないかを確認
+
+確認の本体は tests/test_query_plans.py（pytestのテスト）で、これはそれを実行するだけのラッパー。
+フルスキャンがあれば終了コード1で終了する。
+
+    python benchmarks/check_query_plans.py
+"""
+import os
+import sys
+
+import pytest
+
+TEST_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests', 'test_query_plans.py')
+
+if __name__ == '__main__':
+    sys.exit(pytest.main(['-v', TEST_FILE] + sys.argv[1:]))
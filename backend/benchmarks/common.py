@@ -0,0 +1,134 @@
+"""ベンチマーク共通の処理（データ投入・集計・結果のJSON保存と比較）"""
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(BACKEND_DIR)
+
+def seed_history(path, days=30, tasks_per_day=8, notes_per_task=2, seed=0):
+    """今日までdays日分のタスク・メモ・ポモドーロを一括投入（同じseedなら同じ内容）"""
+    sys.path.insert(0, BACKEND_DIR)
+    import models
+    models.DATABASE = path
+    models.init_db()
+    category_ids = [models.add_category(name, color) for name, color in
+                    (('dev', '#3b82f6'), ('review', '#10b981'), ('meeting', '#f59e0b'))]
+
+    rng = random.Random(seed)
+    today = datetime.combine(datetime.now().date(), datetime.min.time())
+
+    def records():
+        for day in range(days - 1, -1, -1):
+            started = today - timedelta(days=day) + timedelta(hours=9)
+            for i in range(tasks_per_day):
+                task_id = f'{day}-{i}'
+                minutes = rng.randint(10, 50)
+                yield 'task', {
+                    'id': task_id,
+                    'category_id': rng.choice(category_ids),
+                    'name': f'task {task_id}',
+                    'start_at': started,
+                    'end_at': started + timedelta(minutes=minutes)
+                }
+                yield 'pomodoro', {
+                    'start_at': started,
+                    'end_at': started + timedelta(minutes=25),
+                    'completed': rng.random() < 0.8
+                }
+                for j in range(notes_per_task):
+                    yield 'note', {
+                        'task_id': task_id,
+                        'body': f'note {j}',
+                        'created_at': started + timedelta(minutes=j)
+                    }
+                started += timedelta(minutes=minutes + 5)
+
+    counts = models.import_records(records())
+    models.close_db_connection()
+    return counts
+
+def percentile(sorted_values, p):
+    """ソート済みの値のpパーセンタイル（最近傍順位）"""
+    if not sorted_values:
+        return None
+    index = max(0, math.ceil(p / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+def summarize(latencies, duration=None, errors=0):
+    """レイテンシ（秒）の一覧から件数・パーセンタイル（ミリ秒）・スループットを求める"""
+    values = sorted(latencies)
+    summary = {
+        'count': len(values),
+        'errors': errors,
+        'p50_ms': None,
+        'p95_ms': None,
+        'p99_ms': None,
+        'max_ms': None,
+        'per_sec': None,
+    }
+    if values:
+        for p in (50, 95, 99):
+            summary[f'p{p}_ms'] = round(percentile(values, p) * 1000, 3)
+        summary['max_ms'] = round(values[-1] * 1000, 3)
+        elapsed = duration if duration is not None else sum(values)
+        summary['per_sec'] = round(len(values) / elapsed, 1) if elapsed else None
+    return summary
+
+def git_revision():
+    """現在のコミットと未コミットの変更の有無"""
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR, text=True).strip()
+        dirty = bool(subprocess.check_output(['git', 'status', '--porcelain', '--', 'backend'],
+                                             cwd=REPO_DIR, text=True).strip())
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': None, 'dirty': None}
+    return {'commit': commit, 'dirty': dirty}
+
+def write_results(path, suite, params, results):
+    """結果をコミット情報・実行環境と一緒にJSONで保存"""
+    document = {
+        'suite': suite,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'git': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': params,
+        'results': results,
+    }
+    with open(path, 'w') as f:
+        json.dump(document, f, indent=2, ensure_ascii=False)
+    return document
+
+def print_table(results):
+    """名前ごとの集計を表で表示"""
+    print(f"{'name':<36} {'count':>8} {'err':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'per sec':>10}")
+    for name, summary in results.items():
+        print(f"{name:<36} {summary['count']:>8} {summary['errors']:>5} "
+              f"{summary['p50_ms'] if summary['p50_ms'] is not None else '-':>9} "
+              f"{summary['p95_ms'] if summary['p95_ms'] is not None else '-':>9} "
+              f"{summary['p99_ms'] if summary['p99_ms'] is not None else '-':>9} "
+              f"{summary['per_sec'] if summary['per_sec'] is not None else '-':>10}")
+
+def print_comparison(baseline_path, results):
+    """以前の結果JSONと比べてp50・p95・スループットの変化率を表示"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nbaseline: {baseline_path} ({(baseline['git']['commit'] or '?')[:10]})")
+    print(f"{'name':<36} {'p50':>9} {'p95':>9} {'per sec':>9}")
+    for name, summary in results.items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        changes = []
+        for key in ('p50_ms', 'p95_ms', 'per_sec'):
+            if before.get(key) and summary.get(key) is not None:
+                changes.append(f'{(summary[key] / before[key] - 1) * 100:+.1f}%')
+            else:
+                changes.append('-')
+        print(f'{name:<36} {changes[0]:>9} {changes[1]:>9} {changes[2]:>9}')
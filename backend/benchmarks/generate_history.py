@@ -0,0 +1,152 @@
+"""規模の検証用に、それらしい履歴データを生成して一括投入する
+
+ユーザーごとにカテゴリ・タスクテンプレートを作り、平日は始業から終業まで
+タスクを切り替えながらポモドーロを回し、タスクにメモを残す生活を --years 年分作る
+（週末や休暇もある）。同じ --seed と --end なら、作成日時を除いて同じ内容になる。
+
+書き込みはストレージの import_records（SQLiteはexecutemany、Firestoreは
+WriteBatchの並行コミット）で行うため、数百万行でも数分で投入できる。
+スキーマにユーザーの区別はないので、複数ユーザーの記録は同じストアに入り、
+カテゴリ・テンプレート名の接頭辞（u1, u2, ...）で見分けられる。
+
+    python benchmarks/generate_history.py --database big.db --years 3 --users 5 --seed 1
+    FIRESTORE_EMULATOR_HOST=localhost:8080 python benchmarks/generate_history.py --target firestore --years 1
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CATEGORIES = [
+    ('開発', '#3b82f6'), ('レビュー', '#10b981'), ('会議', '#f59e0b'), ('調査', '#8b5cf6'),
+    ('ドキュメント', '#ec4899'), ('運用', '#ef4444'), ('学習', '#14b8a6'), ('事務', '#6b7280'),
+]
+TASK_VERBS = ['実装', '修正', '確認', '調査', '設計', '整理', '対応', '検証', 'リファクタリング', '見積もり']
+TASK_SUBJECTS = [
+    'ログイン画面', 'APIのエラー処理', '集計クエリ', 'CI設定', '通知', '検索機能', 'デプロイ手順',
+    'データ移行', 'キャッシュ', '権限チェック', '設定画面', 'パフォーマンス', 'テスト', '依存ライブラリ',
+]
+NOTE_PHRASES = [
+    '方針を決めた', '原因がわかった', 'レビュー待ち', '再現手順をまとめた', '想定より時間がかかりそう',
+    '仕様を確認する', '一旦ここまで', '別タスクに切り出す', '関係者に共有した', 'テストを追加',
+]
+
+POMODORO_MINUTES = 25
+BREAK_MINUTES = 5
+LONG_BREAK_MINUTES = 15
+
+def create_user_resources(backend, user, rng):
+    """ユーザーのカテゴリとテンプレートを作成し、(カテゴリIDの一覧, [(テンプレートID, 名前, カテゴリID)]) を返す"""
+    prefix = f'u{user} '
+    categories = [(backend.add_category(prefix + name, color), name)
+                  for name, color in rng.sample(CATEGORIES, rng.randint(4, 6))]
+    templates = []
+    for _ in range(rng.randint(5, 10)):
+        category_id, _ = rng.choice(categories)
+        name = f'{rng.choice(TASK_SUBJECTS)}の{rng.choice(TASK_VERBS)}'
+        templates.append((backend.add_task_template(prefix + name, category_id), prefix + name, category_id))
+    return [category_id for category_id, _ in categories], templates
+
+def generate_day(rng, user, day, category_ids, templates, counter):
+    """1ユーザー・1日分の (種別, 項目) レコードを返す（働かない日は空）"""
+    weekend = day.weekday() >= 5
+    if rng.random() < (0.85 if weekend else 0.05):
+        return []
+
+    records = []
+    now = datetime.combine(day, datetime.min.time()) + timedelta(minutes=rng.randint(8 * 60, 10 * 60))
+    day_end = now + timedelta(hours=rng.uniform(1.5, 4) if weekend else rng.uniform(6.5, 9.5))
+    pomodoros_in_row = 0
+
+    while now < day_end:
+        # テンプレートから選ぶことが多く、たまに単発のタスク名を付ける
+        task_id = f'{user}-{next(counter)}'
+        if templates and rng.random() < 0.6:
+            template_id, name, category_id = rng.choice(templates)
+        else:
+            template_id, category_id = None, rng.choice(category_ids)
+            name = f'{rng.choice(TASK_SUBJECTS)}の{rng.choice(TASK_VERBS)}'
+        task_start = now
+        task_end = min(now + timedelta(minutes=rng.lognormvariate(3.6, 0.6)), day_end)
+
+        # タスク中はポモドーロと休憩を繰り返す（途中で中断することもある）
+        notes = []
+        while now < task_end:
+            if rng.random() < 0.15:
+                length = rng.randint(2, POMODORO_MINUTES - 1)
+                completed = False
+            else:
+                length = POMODORO_MINUTES
+                completed = True
+            end = now + timedelta(minutes=length, seconds=rng.randint(0, 59))
+            records.append(('pomodoro', {'start_at': now, 'end_at': end, 'completed': completed}))
+            if rng.random() < 0.3:
+                notes.append(now + timedelta(minutes=rng.randint(0, length)))
+            pomodoros_in_row = pomodoros_in_row + 1 if completed else 0
+            now = end + timedelta(minutes=LONG_BREAK_MINUTES if pomodoros_in_row % 4 == 0 else BREAK_MINUTES)
+        task_end = max(task_end, min(now, day_end))
+
+        records.append(('task', {
+            'id': task_id,
+            'template_id': template_id,
+            'category_id': category_id,
+            'name': name,
+            'start_at': task_start,
+            'end_at': task_end
+        }))
+        for created_at in notes:
+            records.append(('note', {'task_id': task_id, 'body': rng.choice(NOTE_PHRASES), 'created_at': created_at}))
+        now = task_end + timedelta(minutes=rng.randint(0, 10))
+    return records
+
+def generate_records(users, start, end, seed):
+    """ユーザーごとに (カテゴリIDの一覧, テンプレート) を受け取り、start〜endの記録を日付順に返すジェネレーター"""
+    rngs = {user: random.Random(f'{seed}:{user}:days') for user in users}
+    counters = {user: iter(range(1, 10 ** 12)) for user in users}
+    day = start
+    while day <= end:
+        for user, (category_ids, templates) in users.items():
+            yield from generate_day(rngs[user], user, day, category_ids, templates, counters[user])
+        day += timedelta(days=1)
+
+def load_backend(args):
+    """書き込み先のストレージを準備"""
+    if args.target == 'firestore':
+        if not os.getenv('FIRESTORE_EMULATOR_HOST'):
+            sys.exit('FIRESTORE_EMULATOR_HOST が未設定です（本番のFirestoreには書き込みません）')
+        import firestore_models as backend
+    else:
+        import models as backend
+        backend.DATABASE = args.database
+    backend.init_db()
+    return backend
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--target', choices=('sqlite', 'firestore'), default='sqlite', help='書き込み先')
+    parser.add_argument('--database', default='pomo_hub.db', help='SQLiteのファイル（--target sqlite）')
+    parser.add_argument('--users', type=int, default=1, help='生成するユーザー数')
+    parser.add_argument('--years', type=float, default=1.0, help='生成する年数')
+    parser.add_argument('--end', type=date.fromisoformat, default=date.today(), help='最終日（省略時は今日）')
+    parser.add_argument('--seed', type=int, default=0, help='乱数シード')
+    args = parser.parse_args()
+
+    backend = load_backend(args)
+    start = args.end - timedelta(days=round(args.years * 365) - 1)
+    users = {}
+    for user in range(1, args.users + 1):
+        users[user] = create_user_resources(backend, user, random.Random(f'{args.seed}:{user}:resources'))
+
+    started = time.perf_counter()
+    counts = backend.import_records(generate_records(users, start, args.end, args.seed))
+    elapsed = time.perf_counter() - started
+    total = sum(counts.values())
+    print(f'{start} 〜 {args.end}, {args.users}ユーザー: {counts}')
+    print(f'{total}件を{elapsed:.1f}秒で投入しました（{total / elapsed:.0f}件/秒）')
+
+if __name__ == '__main__':
+    main()
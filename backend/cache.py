@@ -0,0 +1,54 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+class VersionedCache:
+    """バージョンスタンプで無効化される、TTL・件数上限付きのプロセス内キャッシュ
+
+    値はバージョンと一緒に保存し、呼び出し側が渡したバージョン（ストレージ上の
+    共有スタンプ）と異なれば読み直す。他のワーカーやインスタンスでの書き込みも
+    スタンプが進むことで反映される。
+    """
+
+    def __init__(self, max_entries: int = 128, ttl_seconds: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_load(self, key, version, loader):
+        """キャッシュが有効ならその値を、無効ならloaderの結果を返す"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version and now - entry[1] < self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+
+        value = loader()
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = (version, now, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, *keys):
+        """指定キー（省略時は全て）を削除"""
+        with self._lock:
+            if not keys:
+                self._entries.clear()
+            for key in keys:
+                self._entries.pop(key, None)
+
+def create_cache() -> VersionedCache:
+    """環境変数の設定でキャッシュを作成"""
+    return VersionedCache(
+        max_entries=int(os.getenv('CACHE_MAX_ENTRIES', '128')),
+        ttl_seconds=float(os.getenv('CACHE_TTL_SECONDS', '300'))
+    )
@@ -0,0 +1,187 @@
+import atexit
+import json
+import os
+import queue
+import threading
+from collections import deque
+from typing import Optional
+
+# このプロセスで作成したブローカー（終了時に接続をまとめて閉じるため）
+_brokers = []
+
+class Subscriber:
+    """1つのSSE接続に配る送信待ちのフレーム"""
+
+    __slots__ = ('queue', 'closed')
+
+    def __init__(self, queue_size: int):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.closed = False
+
+class EventBroker:
+    """ストレージに記録されたイベントを1本のスレッドで受け取り、接続中の全クライアントへ配る
+
+    - どのワーカー・インスタンスで起きたイベントも、ストレージ経由で全プロセスに届く
+    - SSEのフレームはイベントごとに1回だけ組み立て、各接続のキューには同じ文字列を積む
+    - 受け取りの遅いクライアントはキューが溢れた時点で切断する（Last-Event-IDで再接続できる）
+    - 直近history_size件を保持し、再接続時に取りこぼした分を送り直す
+    """
+
+    def __init__(self, add_event, watch_events, max_clients: int = 8, queue_size: int = 100,
+                 history_size: int = 256, retry_seconds: float = 5.0):
+        self.add_event = add_event
+        self.watch_events = watch_events
+        self.max_clients = max_clients
+        self.queue_size = queue_size
+        self.retry_seconds = retry_seconds
+        self.dropped = 0
+        self._subscribers = set()
+        self._history = deque(maxlen=history_size)
+        self._thread = None
+        self._pid = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+
+    def publish(self, event_type: str, data: dict):
+        """イベントをストレージに記録（配信は各プロセスの受信スレッドが行う）"""
+        try:
+            self.add_event(event_type, json.dumps(data, ensure_ascii=False, default=str))
+        except Exception as e:
+            print(f"イベント記録エラー: {e}")
+
+    def subscribe(self, last_event_id: Optional[str] = None) -> Optional[Subscriber]:
+        """接続を登録（上限に達していればNone）"""
+        self._ensure_started()
+        subscriber = Subscriber(self.queue_size)
+        with self._lock:
+            if len(self._subscribers) >= self.max_clients:
+                return None
+            if last_event_id:
+                # 取りこぼした分が履歴に残っていれば先に積んでおく
+                event_ids = [str(event_id) for event_id, _ in self._history]
+                if last_event_id in event_ids:
+                    missed = list(self._history)[event_ids.index(last_event_id) + 1:]
+                    for _, frame in missed[-self.queue_size:]:
+                        subscriber.queue.put_nowait(frame)
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        """接続の登録を解除"""
+        subscriber.closed = True
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def client_count(self) -> int:
+        """接続中のクライアント数"""
+        return len(self._subscribers)
+
+    def stream(self, subscriber: Subscriber, heartbeat_seconds: float = 15.0):
+        """SSEのフレームを順に返す（一定時間イベントがなければコメント行で接続を維持）"""
+        try:
+            yield f'retry: {int(self.retry_seconds * 1000)}\n\n'
+            while not subscriber.closed:
+                try:
+                    frame = subscriber.queue.get(timeout=heartbeat_seconds)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                if frame is None:
+                    break
+                yield frame
+        finally:
+            self.unsubscribe(subscriber)
+
+    def close_streams(self):
+        """全接続を閉じる（クライアントはLast-Event-IDを付けて再接続する）"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.closed = True
+            try:
+                subscriber.queue.put_nowait(None)
+            except queue.Full:
+                pass
+
+    def is_alive(self) -> bool:
+        """受信スレッドが動いているか"""
+        return self._thread is not None and self._thread.is_alive() and self._pid == os.getpid()
+
+    def thread_state(self) -> str:
+        """受信スレッドの状態（このプロセスで未起動: idle / 動作中: running / 止まっている: dead）"""
+        if self._thread is None or self._pid != os.getpid():
+            return 'idle'
+        return 'running' if self._thread.is_alive() else 'dead'
+
+    def shutdown(self, timeout: float = 5.0):
+        """受信スレッドを止める"""
+        if not self.is_alive():
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+
+    def _ensure_started(self):
+        """受信スレッドを起動（fork後の子プロセスでは作り直す）"""
+        if self.is_alive():
+            return
+        with self._lock:
+            if self.is_alive():
+                return
+            # fork後の子プロセスでは親の接続を引き継がない
+            # （同じプロセスで再起動するときは、開いたままの接続に新しいスレッドから配り続ける）
+            if self._pid != os.getpid():
+                self._subscribers = set()
+            self._stopping.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='event-broker', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        """ストレージの新しいイベントを待ち受けるループ（エラー時は少し待って再接続）"""
+        while not self._stopping.is_set():
+            try:
+                self.watch_events(self._dispatch, self._stopping)
+            except Exception as e:
+                print(f"イベント受信エラー: {e}")
+                self._stopping.wait(1.0)
+
+    def _dispatch(self, event_id, event_type: str, payload: str):
+        """1件のイベントを全接続のキューに積む"""
+        frame = f'id: {event_id}\nevent: {event_type}\ndata: {payload}\n\n'
+        with self._lock:
+            self._history.append((event_id, frame))
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.queue.put_nowait(frame)
+            except queue.Full:
+                self.dropped += 1
+                self.unsubscribe(subscriber)
+
+# gunicornのスレッドのうち、SSEに使わず通常のAPI・ヘルスチェックに残す数
+EVENTS_RESERVED_THREADS = 2
+
+def _default_max_clients():
+    """SSEの同時接続数の既定値（gunicornのスレッド数から EVENTS_RESERVED_THREADS を引いた数）"""
+    threads = os.getenv('GUNICORN_THREADS')
+    if threads is None:
+        # 開発用サーバーはリクエストごとにスレッドを作るので、スレッド数の上限はない
+        return 8
+    return max(1, int(threads) - EVENTS_RESERVED_THREADS)
+
+def create_event_broker(add_event, watch_events) -> EventBroker:
+    """環境変数の設定でブローカーを作成し、終了時の停止を登録"""
+    broker = EventBroker(
+        add_event,
+        watch_events,
+        max_clients=int(os.getenv('EVENTS_MAX_CLIENTS') or _default_max_clients()),
+        queue_size=int(os.getenv('EVENTS_QUEUE_SIZE', '100'))
+    )
+    atexit.register(broker.shutdown)
+    _brokers.append(broker)
+    return broker
+
+def close_all_streams():
+    """このプロセスの全SSE接続を閉じる（ワーカー終了時に使う）"""
+    for broker in _brokers:
+        broker.close_streams()
@@ -1,49 +1,281 @@
-from datetime import datetime, date, timedelta
+import bisect
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, date, timedelta, timezone
 import firebase_admin
 from firebase_admin import credentials, firestore
+from google.api_core.exceptions import AlreadyExists, NotFound
+from google.auth.credentials import AnonymousCredentials
 import os
-from typing import List, Dict, Optional
+import time
+from typing import List, Dict, Optional, Iterator
+
+from cache import create_cache
+from records import DailySummary, Note, Pomodoro, Task, TaskSummary
 
 # Firebase初期化
-if not firebase_admin._apps:
-    if os.getenv('GOOGLE_APPLICATION_CREDENTIALS'):
-        cred = credentials.ApplicationDefault()
-    else:
-        # ローカル開発用
-        cred = credentials.Certificate('serviceAccountKey.json')
+if os.getenv('FIRESTORE_EMULATOR_HOST'):
+    # ローカルのエミュレーター（認証は不要で、プロジェクトIDだけ指定する）
+    db = firestore.Client(project=os.getenv('GOOGLE_CLOUD_PROJECT', 'pomo-hub-local'),
+                          credentials=AnonymousCredentials())
+else:
+    if not firebase_admin._apps:
+        if os.getenv('GOOGLE_APPLICATION_CREDENTIALS'):
+            cred = credentials.ApplicationDefault()
+        else:
+            # ローカル開発用
+            cred = credentials.Certificate('serviceAccountKey.json')
+        
+        firebase_admin.initialize_app(cred)
     
-    firebase_admin.initialize_app(cred)
+    db = firestore.client()
+
+# レディネスプローブの読み取りを待つ上限（秒）
+PING_TIMEOUT_SECONDS = 5
+
+# Firestoreの'in'クエリで指定できる値の上限
+IN_QUERY_LIMIT = 30
+
+# WriteBatch 1回あたりの書き込み上限と、インポート時に同時にコミットするバッチ数
+BATCH_WRITE_LIMIT = 500
+IMPORT_COMMIT_WORKERS = 8
+
+# イベント（SSE配信用）の保持期間（firestore.indexes.json で expire_at をTTLポリシーの対象にして削除する）
+EVENT_RETENTION_SECONDS = 3600
+
+# リソースごとのバージョン（ETag用）を保持するドキュメントとプロセス内キャッシュ
+VERSION_CACHE_SECONDS = float(os.getenv('VERSION_CACHE_SECONDS', '1'))
+_versions_cache = {'fetched_at': 0.0, 'versions': None}
 
-db = firestore.client()
+# カテゴリ・テンプレート一覧のキャッシュ（meta/resource_versionsのバージョンで無効化）
+_cache = create_cache()
 
 def init_db():
-    """Firestoreの初期化（特に必要なし）"""
-    pass
+    """Firestoreの初期化（進行中タスクのドキュメントがなければ既存データから作成）"""
+    if _active_task_ref().get().exists:
+        return
+    latest = None
+    for task in db.collection('tasks').where('status', '==', 'active').stream():
+        data = task.to_dict()
+        if data.get('start_at') and (latest is None or data['start_at'] > latest[1]['start_at']):
+            latest = (task.id, data)
+    if latest is None:
+        return
+    task_id, data = latest
+    try:
+        _active_task_ref().create({
+            'task_id': task_id,
+            'name': data.get('name'),
+            'category_id': data.get('category_id'),
+            'template_id': data.get('template_id'),
+            'start_at': data['start_at']
+        })
+    except AlreadyExists:
+        pass  # 他のインスタンスが先に作成した
+
+def _versions_ref():
+    """リソースバージョンのドキュメント参照"""
+    return db.collection('meta').document('resource_versions')
+
+def _bump_versions(writer, *resources):
+    """リソースのバージョンを進める（書き込みと同じバッチ・トランザクションに積む）"""
+    writer.set(_versions_ref(), {
+        resource: {'version': firestore.Increment(1), 'updated_at': firestore.SERVER_TIMESTAMP}
+        for resource in resources
+    }, merge=True)
+
+def _commit(batch):
+    """バッチをコミットし、自プロセスの書き込み直後は必ずバージョンを読み直す"""
+    batch.commit()
+    _versions_cache['versions'] = None
+
+def get_resource_version(resource: str):
+    """リソースのバージョンと更新時刻（epoch秒）を取得
+
+    1ドキュメントの読み取りをVERSION_CACHE_SECONDSの間キャッシュする。
+    """
+    now = time.time()
+    versions = _versions_cache['versions']
+    if versions is None or now - _versions_cache['fetched_at'] > VERSION_CACHE_SECONDS:
+        snapshot = _versions_ref().get()
+        versions = snapshot.to_dict() or {}
+        _versions_cache['versions'] = versions
+        _versions_cache['fetched_at'] = now
+    entry = versions.get(resource)
+    if not entry:
+        return 0, None
+    updated_at = entry.get('updated_at')
+    return entry.get('version', 0), updated_at.timestamp() if updated_at else None
 
 def add_pomodoro() -> str:
     """ポモドーロを追加"""
     doc_ref = db.collection('pomodoros').document()
-    doc_ref.set({
+    batch = db.batch()
+    batch.set(doc_ref, {
         'start_at': firestore.SERVER_TIMESTAMP,
         'end_at': None,
         'completed': False,
         'created_at': firestore.SERVER_TIMESTAMP
     })
+    _set_summary(batch, datetime.now(timezone.utc).strftime('%Y-%m-%d'), 'pomodoros', doc_ref.id, {
+        'start_at': firestore.SERVER_TIMESTAMP,
+        'end_at': None,
+        'completed': False
+    })
+    _bump_versions(batch, 'today')
+    _commit(batch)
     return doc_ref.id
 
+def _as_utc(value: datetime) -> datetime:
+    """タイムゾーンなしのdatetimeをUTCとして扱う（Firestoreの保存形式に合わせる）"""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+def _rollup_ref(day: str, category_id: Optional[str]):
+    """日・カテゴリ別集計ドキュメントの参照"""
+    return db.collection('daily_rollups').document(f'{day}_{category_id or "none"}')
+
+def _apply_rollup(transaction, day: str, category_id: Optional[str],
+                  completed: int = 0, aborted: int = 0, minutes: float = 0.0):
+    """daily_rollupsに差分を加算"""
+    transaction.set(_rollup_ref(day, category_id), {
+        'day': day,
+        'category_id': category_id,
+        'completed_pomodoros': firestore.Increment(completed),
+        'aborted_pomodoros': firestore.Increment(aborted),
+        'focused_minutes': firestore.Increment(minutes)
+    }, merge=True)
+
+def _hourly_rollup_ref(day: str, hour: int):
+    """日・時間帯別集計ドキュメントの参照"""
+    return db.collection('hourly_rollups').document(f'{day}_{hour:02d}')
+
+def _apply_hourly_rollup(transaction, day: str, hour: int,
+                         completed: int = 0, aborted: int = 0, minutes: float = 0.0):
+    """hourly_rollupsに差分を加算"""
+    transaction.set(_hourly_rollup_ref(day, hour), {
+        'day': day,
+        'hour': hour,
+        'completed_pomodoros': firestore.Increment(completed),
+        'aborted_pomodoros': firestore.Increment(aborted),
+        'focused_minutes': firestore.Increment(minutes)
+    }, merge=True)
+
+def _hour_pieces(start: datetime, end: datetime) -> List:
+    """[start, end) を1時間ごとに分割して (日, 時, 分数) の一覧を返す"""
+    pieces = []
+    while start < end:
+        boundary = start.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+        piece_end = min(end, boundary)
+        pieces.append((start.strftime('%Y-%m-%d'), start.hour, (piece_end - start).total_seconds() / 60))
+        start = piece_end
+    return pieces
+
+def _summary_ref(day: str):
+    """日別サマリー（/api/today用の非正規化ドキュメント）の参照"""
+    return db.collection('daily_summaries').document(day)
+
+def _set_summary(writer, day: str, kind: str, item_id: str, fields: Dict):
+    """日別サマリーの1件分をマージ書き込みする（書き込みと同じバッチ・トランザクションに積む）"""
+    writer.set(_summary_ref(day), {'date': day, kind: {item_id: fields}}, merge=True)
+
+def _task_summary_fields(task: Dict) -> Dict:
+    """タスクドキュメントから日別サマリーに載せる項目を取り出す"""
+    return {field: task.get(field) for field in
+            ('name', 'category_id', 'template_id', 'start_at', 'end_at', 'status')}
+
+def _pomodoro_category(transaction, start_at: datetime) -> Optional[str]:
+    """ポモドーロ開始時点で進行中だったタスクのカテゴリを取得"""
+    query = db.collection('tasks')\
+        .where('start_at', '<=', start_at)\
+        .order_by('start_at', direction=firestore.Query.DESCENDING)\
+        .limit(1)
+    for task in transaction.get(query):
+        data = task.to_dict()
+        if data.get('end_at') is None or _as_utc(data['end_at']) > _as_utc(start_at):
+            return data.get('category_id')
+    return None
+
+@firestore.transactional
+def _update_pomodoro(transaction, doc_ref, end_time: datetime, completed: bool):
+    """ポモドーロと集計を同じトランザクションで更新（存在しなければNotFound）"""
+    snapshot = doc_ref.get(transaction=transaction)
+    if not snapshot.exists:
+        raise NotFound(f'pomodoro {doc_ref.id} が見つかりません')
+    before = snapshot.to_dict()
+    category_id = _pomodoro_category(transaction, before['start_at'])
+    _pomodoro_update_writes(transaction, doc_ref, before, category_id, end_time, completed)
+
+def _pomodoro_update_writes(transaction, doc_ref, before: Dict, category_id: Optional[str],
+                            end_time: datetime, completed: bool):
+    """ポモドーロの終了と集計の差分をトランザクションに積む（読み取りは済ませておく）"""
+    day = before['start_at'].strftime('%Y-%m-%d')
+    completed_delta = int(bool(completed))
+    aborted_delta = 1 - completed_delta
+    if before.get('end_at') is not None:
+        completed_delta -= int(bool(before.get('completed')))
+        aborted_delta -= 1 - int(bool(before.get('completed')))
+    
+    transaction.update(doc_ref, {
+        'end_at': end_time,
+        'completed': completed,
+        'updated_at': firestore.SERVER_TIMESTAMP
+    })
+    _apply_rollup(transaction, day, category_id, completed=completed_delta, aborted=aborted_delta)
+    _set_summary(transaction, day, 'pomodoros', doc_ref.id,
+                 {'start_at': before['start_at'], 'end_at': end_time, 'completed': completed})
+    _bump_versions(transaction, 'today')
+    _apply_hourly_rollup(transaction, day, before['start_at'].hour,
+                         completed=completed_delta, aborted=aborted_delta)
+
 def update_pomodoro(pomodoro_id: str, end_time: datetime, completed: bool = False):
-    """ポモドーロを更新"""
+    """ポモドーロを更新（集計も同じトランザクションで更新）"""
     doc_ref = db.collection('pomodoros').document(pomodoro_id)
-    doc_ref.update({
+    _update_pomodoro(db.transaction(), doc_ref, end_time, completed)
+    _versions_cache['versions'] = None
+
+def _active_task_ref():
+    """進行中タスクのドキュメント参照（常に最大1件）"""
+    return db.collection('meta').document('active_task')
+
+def _task_update_writes(transaction, doc_ref, before: Dict, end_time: datetime, status: str):
+    """タスクの終了と集計の差分をトランザクションに積む（読み取りは済ませておく）"""
+    start_at = _as_utc(before['start_at'])
+    minutes = (_as_utc(end_time) - start_at).total_seconds() / 60
+    hourly = {}
+    for day, hour, piece in _hour_pieces(start_at, _as_utc(end_time)):
+        hourly[(day, hour)] = hourly.get((day, hour), 0.0) + piece
+    if before.get('end_at') is not None:
+        minutes -= (_as_utc(before['end_at']) - start_at).total_seconds() / 60
+        for day, hour, piece in _hour_pieces(start_at, _as_utc(before['end_at'])):
+            hourly[(day, hour)] = hourly.get((day, hour), 0.0) - piece
+    
+    transaction.update(doc_ref, {
         'end_at': end_time,
-        'completed': completed,
+        'status': status,
         'updated_at': firestore.SERVER_TIMESTAMP
     })
+    _apply_rollup(transaction, start_at.strftime('%Y-%m-%d'), before.get('category_id'), minutes=minutes)
+    _set_summary(transaction, start_at.strftime('%Y-%m-%d'), 'tasks', doc_ref.id,
+                 dict(_task_summary_fields(before), end_at=end_time, status=status))
+    for (day, hour), piece in hourly.items():
+        _apply_hourly_rollup(transaction, day, hour, minutes=piece)
 
-def add_task(name: str, category_id: Optional[str] = None, template_id: Optional[str] = None) -> str:
-    """タスクを追加"""
-    doc_ref = db.collection('tasks').document()
-    doc_ref.set({
+@firestore.transactional
+def _switch_task(transaction, doc_ref, name: str, category_id: Optional[str],
+                 template_id: Optional[str]) -> Optional[str]:
+    """進行中のタスクを終了し、新しいタスクを進行中として登録（終了したタスクのIDを返す）"""
+    active = _active_task_ref().get(transaction=transaction).to_dict()
+    previous_id = None
+    if active and active.get('task_id'):
+        previous_ref = db.collection('tasks').document(active['task_id'])
+        previous = previous_ref.get(transaction=transaction).to_dict()
+        if previous is not None:
+            previous_id = previous_ref.id
+            _task_update_writes(transaction, previous_ref, previous,
+                                datetime.now(timezone.utc), 'completed')
+    
+    transaction.set(doc_ref, {
         'name': name,
         'category_id': category_id,
         'template_id': template_id,
@@ -52,28 +284,120 @@ def add_task(name: str, category_id: Optional[str] = None, template_id: Optional
         'status': 'active',
         'created_at': firestore.SERVER_TIMESTAMP
     })
-    return doc_ref.id
+    _set_summary(transaction, datetime.now(timezone.utc).strftime('%Y-%m-%d'), 'tasks', doc_ref.id, {
+        'name': name,
+        'category_id': category_id,
+        'template_id': template_id,
+        'start_at': firestore.SERVER_TIMESTAMP,
+        'end_at': None,
+        'status': 'active'
+    })
+    # get_active_taskが1回の読み取りで済むよう、表示に必要な項目を複製しておく
+    transaction.set(_active_task_ref(), {
+        'task_id': doc_ref.id,
+        'name': name,
+        'category_id': category_id,
+        'template_id': template_id,
+        'start_at': firestore.SERVER_TIMESTAMP
+    })
+    _bump_versions(transaction, 'today')
+    return previous_id
+
+def switch_task(name: str, category_id: Optional[str] = None, template_id: Optional[str] = None):
+    """進行中のタスクを終了して新しいタスクを開始（1トランザクション）
+
+    (新しいタスクのID, 終了したタスクのID または None) を返す。
+    """
+    doc_ref = db.collection('tasks').document()
+    previous_id = _switch_task(db.transaction(), doc_ref, name, category_id, template_id)
+    _versions_cache['versions'] = None
+    return doc_ref.id, previous_id
+
+def add_task(name: str, category_id: Optional[str] = None, template_id: Optional[str] = None) -> str:
+    """タスクを追加（進行中のタスクがあれば同じトランザクションで終了）"""
+    task_id, _ = switch_task(name, category_id, template_id)
+    return task_id
+
+@firestore.transactional
+def _update_task(transaction, doc_ref, end_time: datetime, status: str):
+    """タスクと集計を同じトランザクションで更新（存在しなければNotFound）"""
+    snapshot = doc_ref.get(transaction=transaction)
+    if not snapshot.exists:
+        raise NotFound(f'task {doc_ref.id} が見つかりません')
+    before = snapshot.to_dict()
+    active = _active_task_ref().get(transaction=transaction).to_dict()
+    _task_update_writes(transaction, doc_ref, before, end_time, status)
+    if active and active.get('task_id') == doc_ref.id:
+        transaction.delete(_active_task_ref())
+    _bump_versions(transaction, 'today')
 
 def update_task(task_id: str, end_time: datetime, status: str = 'completed'):
-    """タスクを更新"""
+    """タスクを更新（集計も同じトランザクションで更新）"""
     doc_ref = db.collection('tasks').document(task_id)
-    doc_ref.update({
-        'end_at': end_time,
-        'status': status,
-        'updated_at': firestore.SERVER_TIMESTAMP
-    })
+    _update_task(db.transaction(), doc_ref, end_time, status)
+    _versions_cache['versions'] = None
 
-def add_note(task_id: str, note: str) -> str:
-    """メモを追加"""
-    doc_ref = db.collection('notes').document()
-    doc_ref.set({
+@firestore.transactional
+def _add_note(transaction, doc_ref, task_id: str, note: str):
+    """メモとタスク開始日の日別サマリーを同じトランザクションで書き込む"""
+    task = db.collection('tasks').document(task_id).get(transaction=transaction).to_dict()
+    transaction.set(doc_ref, {
         'task_id': task_id,
         'note': note,
         'created_at': firestore.SERVER_TIMESTAMP
     })
+    if task is not None and task.get('start_at'):
+        # タスクの項目も書き直しておき、サマリーにない古いタスクでも欠けないようにする
+        fields = _task_summary_fields(task)
+        fields['notes'] = {doc_ref.id: {'note': note, 'created_at': firestore.SERVER_TIMESTAMP}}
+        _set_summary(transaction, _as_utc(task['start_at']).strftime('%Y-%m-%d'), 'tasks', task_id, fields)
+    _bump_versions(transaction, 'today')
+
+def add_note(task_id: str, note: str) -> str:
+    """メモを追加"""
+    doc_ref = db.collection('notes').document()
+    _add_note(db.transaction(), doc_ref, task_id, note)
+    _versions_cache['versions'] = None
     return doc_ref.id
 
-def get_today_pomodoros() -> List[Dict]:
+def _timestamp(value) -> Optional[str]:
+    """Firestoreの時刻をSQLite版と同じ 'YYYY-MM-DD HH:MM:SS.ffffff'（UTC）の文字列に変換"""
+    return value.isoformat(' ', 'microseconds')[:26] if value else None
+
+def _pomodoro_record(doc_id: str, data: Dict) -> Pomodoro:
+    return Pomodoro(doc_id, _timestamp(data.get('start_at')), _timestamp(data.get('end_at')),
+                    data.get('completed', False))
+
+def _task_record(doc_id: str, data: Dict) -> Task:
+    return Task(doc_id, data.get('category_id'), data.get('name'), _timestamp(data.get('start_at')),
+                _timestamp(data.get('end_at')), data.get('status'))
+
+def _note_record(doc_id: str, data: Dict, task_id: Optional[str] = None, name: Optional[str] = None) -> Note:
+    return Note(doc_id, data.get('task_id', task_id), data.get('note'), _timestamp(data.get('created_at')), name)
+
+def get_daily_summary(target_date: date) -> DailySummary:
+    """指定日のポモドーロ・タスク・メモを日別サマリー1ドキュメントから取得"""
+    snapshot = _summary_ref(str(target_date)).get()
+    data = snapshot.to_dict() if snapshot.exists else {}
+    
+    pomodoros = sorted(
+        ((pomo_id, pomo) for pomo_id, pomo in data.get('pomodoros', {}).items() if pomo.get('start_at')),
+        key=lambda item: item[1]['start_at'], reverse=True
+    )
+    tasks = sorted(
+        ((task_id, task) for task_id, task in data.get('tasks', {}).items() if task.get('start_at')),
+        key=lambda item: item[1]['start_at'], reverse=True
+    )
+    return DailySummary(
+        str(target_date),
+        [_pomodoro_record(pomo_id, pomo) for pomo_id, pomo in pomodoros],
+        [TaskSummary(*_task_record(task_id, task), [
+            _note_record(note_id, note, task_id, task.get('name'))
+            for note_id, note in sorted(task.get('notes', {}).items(), key=lambda item: item[1].get('created_at'))
+        ]) for task_id, task in tasks]
+    )
+
+def get_today_pomodoros() -> List[Pomodoro]:
     """今日のポモドーロを取得"""
     today_start = datetime.combine(date.today(), datetime.min.time())
     
@@ -81,21 +405,9 @@ def get_today_pomodoros() -> List[Dict]:
         .where('start_at', '>=', today_start)\
         .order_by('start_at', direction=firestore.Query.DESCENDING)\
         .stream()
-    
-    results = []
-    for pomo in pomodoros:
-        data = pomo.to_dict()
-        data['id'] = pomo.id
-        # Timestampを文字列に変換
-        if data.get('start_at'):
-            data['start_at'] = data['start_at'].strftime('%Y-%m-%d %H:%M:%S.%f')
-        if data.get('end_at'):
-            data['end_at'] = data['end_at'].strftime('%Y-%m-%d %H:%M:%S.%f')
-        results.append(data)
-    
-    return results
+    return [_pomodoro_record(pomo.id, pomo.to_dict()) for pomo in pomodoros]
 
-def get_today_tasks() -> List[Dict]:
+def get_today_tasks() -> List[Task]:
     """今日のタスクを取得"""
     today_start = datetime.combine(date.today(), datetime.min.time())
     
@@ -103,65 +415,72 @@ def get_today_tasks() -> List[Dict]:
         .where('start_at', '>=', today_start)\
         .order_by('start_at', direction=firestore.Query.DESCENDING)\
         .stream()
-    
-    results = []
-    for task in tasks:
-        data = task.to_dict()
-        data['id'] = task.id
-        # Timestampを文字列に変換
-        if data.get('start_at'):
-            data['start_at'] = data['start_at'].strftime('%Y-%m-%d %H:%M:%S.%f')
-        if data.get('end_at'):
-            data['end_at'] = data['end_at'].strftime('%Y-%m-%d %H:%M:%S.%f')
-        results.append(data)
-    
-    return results
+    return [_task_record(task.id, task.to_dict()) for task in tasks]
 
-def get_task_notes(task_id: str) -> List[Dict]:
+def get_task_notes(task_id: str) -> List[Note]:
     """タスクのメモを取得"""
     notes = db.collection('notes')\
         .where('task_id', '==', task_id)\
         .order_by('created_at')\
         .stream()
+    return [_note_record(note.id, note.to_dict()) for note in notes]
+
+def _get_notes_chunk(task_ids: List[str]) -> List:
+    """task_idのチャンクに対するメモを取得"""
+    return list(db.collection('notes')
+        .where('task_id', 'in', task_ids)
+        .order_by('created_at')
+        .stream())
+
+def get_notes_for_tasks(task_ids: List[str]) -> Dict[str, List[Note]]:
+    """複数タスクのメモをまとめて取得（task_id -> メモ一覧）"""
+    notes_by_task = {task_id: [] for task_id in task_ids}
+    ids = list(notes_by_task)
+    chunks = [ids[i:i + IN_QUERY_LIMIT] for i in range(0, len(ids), IN_QUERY_LIMIT)]
+    if not chunks:
+        return notes_by_task
     
-    results = []
-    for note in notes:
-        data = note.to_dict()
-        data['id'] = note.id
-        if data.get('created_at'):
-            data['created_at'] = data['created_at'].strftime('%Y-%m-%d %H:%M:%S')
-        results.append(data)
+    # チャンクごとの'in'クエリを並行実行
+    with ThreadPoolExecutor(max_workers=min(len(chunks), 8)) as executor:
+        for notes in executor.map(_get_notes_chunk, chunks):
+            for note in notes:
+                record = _note_record(note.id, note.to_dict())
+                notes_by_task[record.task_id].append(record)
     
-    return results
+    return notes_by_task
 
 def get_active_task() -> Optional[Dict]:
-    """アクティブなタスクを取得"""
-    tasks = db.collection('tasks')\
-        .where('status', '==', 'active')\
-        .limit(1)\
-        .stream()
-    
-    for task in tasks:
-        data = task.to_dict()
-        data['id'] = task.id
-        if data.get('start_at'):
-            data['start_at'] = data['start_at'].strftime('%Y-%m-%d %H:%M:%S.%f')
-        return data
+    """アクティブなタスクを取得（meta/active_taskの1ドキュメント読み取り）"""
+    snapshot = _active_task_ref().get()
+    if not snapshot.exists:
+        return None
     
-    return None
+    data = snapshot.to_dict()
+    data['id'] = data.pop('task_id')
+    data['start_at'] = _timestamp(data.get('start_at'))
+    return data
 
 def add_category(name: str, color: str = '#3b82f6') -> str:
     """カテゴリを追加"""
     doc_ref = db.collection('categories').document()
-    doc_ref.set({
+    batch = db.batch()
+    batch.set(doc_ref, {
         'name': name,
         'color': color,
         'created_at': firestore.SERVER_TIMESTAMP
     })
+    _bump_versions(batch, 'categories', 'task_templates')
+    _commit(batch)
+    _cache.invalidate('categories', 'task_templates')
     return doc_ref.id
 
 def get_categories() -> List[Dict]:
-    """カテゴリ一覧を取得"""
+    """カテゴリ一覧を取得（キャッシュ付き）"""
+    version, _ = get_resource_version('categories')
+    return _cache.get_or_load('categories', version, _load_categories)
+
+def _load_categories() -> List[Dict]:
+    """カテゴリ一覧をFirestoreから取得"""
     categories = db.collection('categories')\
         .order_by('created_at')\
         .stream()
@@ -177,16 +496,25 @@ def get_categories() -> List[Dict]:
 def add_task_template(name: str, category_id: Optional[str] = None) -> str:
     """タスクテンプレートを追加"""
     doc_ref = db.collection('task_templates').document()
-    doc_ref.set({
+    batch = db.batch()
+    batch.set(doc_ref, {
         'name': name,
         'category_id': category_id,
         'is_active': True,
         'created_at': firestore.SERVER_TIMESTAMP
     })
+    _bump_versions(batch, 'task_templates')
+    _commit(batch)
+    _cache.invalidate('task_templates')
     return doc_ref.id
 
 def get_task_templates() -> List[Dict]:
-    """タスクテンプレート一覧を取得"""
+    """タスクテンプレート一覧を取得（キャッシュ付き）"""
+    version, _ = get_resource_version('task_templates')
+    return _cache.get_or_load('task_templates', version, _load_task_templates)
+
+def _load_task_templates() -> List[Dict]:
+    """タスクテンプレート一覧をFirestoreから取得"""
     templates = db.collection('task_templates')\
         .where('is_active', '==', True)\
         .order_by('created_at')\
@@ -203,15 +531,133 @@ def get_task_templates() -> List[Dict]:
 def deactivate_task_template(template_id: str):
     """タスクテンプレートを無効化"""
     doc_ref = db.collection('task_templates').document(template_id)
-    doc_ref.update({
+    batch = db.batch()
+    batch.update(doc_ref, {
         'is_active': False,
         'updated_at': firestore.SERVER_TIMESTAMP
     })
+    _bump_versions(batch, 'task_templates')
+    _commit(batch)
+    _cache.invalidate('task_templates')
+
+def add_timer(pomodoro_id: str, fire_at: datetime) -> str:
+    """ポモドーロ終了タイマーを登録（ドキュメントIDはポモドーロID）"""
+    doc_ref = db.collection('timers').document(pomodoro_id)
+    doc_ref.set({
+        'pomodoro_id': pomodoro_id,
+        'fire_at': fire_at,
+        'status': 'pending',
+        'created_at': firestore.SERVER_TIMESTAMP
+    })
+    return doc_ref.id
+
+@firestore.transactional
+def _transition_timer(transaction, doc_ref, status: str) -> Optional[Dict]:
+    """pendingのタイマーを指定状態に切り替え、切り替えた場合はデータを返す"""
+    snapshot = doc_ref.get(transaction=transaction)
+    if not snapshot.exists or snapshot.get('status') != 'pending':
+        return None
+    changes = {'status': status}
+    if status == 'fired':
+        changes['fired_at'] = firestore.SERVER_TIMESTAMP
+    transaction.update(doc_ref, changes)
+    return snapshot.to_dict()
+
+def cancel_timer(pomodoro_id: str) -> bool:
+    """未発火のタイマーをキャンセル（キャンセルできたらTrue）"""
+    doc_ref = db.collection('timers').document(pomodoro_id)
+    return _transition_timer(db.transaction(), doc_ref, 'cancelled') is not None
+
+@firestore.transactional
+def _fire_timer(transaction, doc_ref, now: datetime) -> Optional[Dict]:
+    """pendingのタイマーを発火済みにし、同じトランザクションでポモドーロを完了にする"""
+    snapshot = doc_ref.get(transaction=transaction)
+    if not snapshot.exists or snapshot.get('status') != 'pending':
+        return None
+    pomodoro_ref = db.collection('pomodoros').document(snapshot.get('pomodoro_id'))
+    pomodoro = pomodoro_ref.get(transaction=transaction)
+    before = pomodoro.to_dict() if pomodoro.exists else None
+    # トランザクションでは書き込みの前にすべて読んでおく
+    category_id = None
+    if before is not None and before.get('end_at') is None:
+        category_id = _pomodoro_category(transaction, before['start_at'])
+    transaction.update(doc_ref, {'status': 'fired', 'fired_at': firestore.SERVER_TIMESTAMP})
+    if before is not None and before.get('end_at') is None:
+        _pomodoro_update_writes(transaction, pomodoro_ref, before, category_id, now, True)
+    return snapshot.to_dict()
+
+def claim_due_timers(now: datetime, limit: int = 100) -> List[Dict]:
+    """期限の来たタイマーを発火済みにし、そのポモドーロを now で完了にして返す
+
+    タイマーごとに1つのトランザクションで行うので、各タイマーは1回だけ返され、
+    途中で失敗・停止したタイマーは発火待ちのまま次の呼び出しでやり直される。
+    """
+    due = db.collection('timers')\
+        .where('status', '==', 'pending')\
+        .where('fire_at', '<=', now)\
+        .order_by('fire_at')\
+        .limit(limit)\
+        .stream()
+    
+    results = []
+    for timer in due:
+        data = _fire_timer(db.transaction(), timer.reference, now)
+        if data is not None:
+            data['id'] = timer.id
+            results.append(data)
+    if results:
+        _versions_cache['versions'] = None
+    
+    return results
+
+def count_pending_timers() -> int:
+    """発火待ちのタイマー数（集計クエリで数える）"""
+    result = db.collection('timers').where('status', '==', 'pending').count().get()
+    return int(result[0][0].value)
+
+def ping() -> bool:
+    """Firestoreを読めるか確認（レディネスプローブ用、ドキュメント1件の読み取り）"""
+    _active_task_ref().get(timeout=PING_TIMEOUT_SECONDS)
+    return True
+
+@firestore.transactional
+def _acquire_lease(transaction, doc_ref, owner: str, ttl_seconds: float) -> bool:
+    """リースを取得・更新"""
+    now = time.time()
+    snapshot = doc_ref.get(transaction=transaction)
+    if snapshot.exists:
+        lease = snapshot.to_dict()
+        if lease['owner'] != owner and lease['expires_at'] >= now:
+            return False
+    transaction.set(doc_ref, {'owner': owner, 'expires_at': now + ttl_seconds})
+    return True
+
+def acquire_lease(name: str, owner: str, ttl_seconds: float) -> bool:
+    """リースを取得・更新（取得できたらTrue）"""
+    doc_ref = db.collection('scheduler_leases').document(name)
+    return _acquire_lease(db.transaction(), doc_ref, owner, ttl_seconds)
+
+def _date_range(start_date: date, end_date: date):
+    """start_date〜end_date（両端含む）を [0時, 翌日0時) の範囲で返す"""
+    start_time = datetime.combine(start_date, datetime.min.time())
+    end_time = datetime.combine(end_date, datetime.min.time()) + timedelta(days=1)
+    return start_time, end_time
 
-def get_pomodoros_by_date(target_date: date) -> List[Dict]:
+def get_pomodoros_by_date(target_date: date) -> List[Pomodoro]:
     """指定日のポモドーロを取得"""
-    start_time = datetime.combine(target_date, datetime.min.time())
-    end_time = start_time + timedelta(days=1)
+    return list(iter_pomodoros(target_date, target_date))
+
+def get_tasks_by_date(target_date: date) -> List[Task]:
+    """指定日のタスクを取得"""
+    return list(iter_tasks(target_date, target_date))
+
+def get_all_notes_by_date(target_date: date) -> List[Note]:
+    """指定日のメモを取得"""
+    return list(iter_notes(target_date, target_date))
+
+def iter_pomodoros(start_date: date, end_date: date) -> Iterator[Pomodoro]:
+    """期間内のポモドーロを開始時刻順に逐次取得"""
+    start_time, end_time = _date_range(start_date, end_date)
     
     pomodoros = db.collection('pomodoros')\
         .where('start_at', '>=', start_time)\
@@ -219,22 +665,12 @@ def get_pomodoros_by_date(target_date: date) -> List[Dict]:
         .order_by('start_at')\
         .stream()
     
-    results = []
     for pomo in pomodoros:
-        data = pomo.to_dict()
-        data['id'] = pomo.id
-        if data.get('start_at'):
-            data['start_at'] = data['start_at'].strftime('%Y-%m-%d %H:%M:%S')
-        if data.get('end_at'):
-            data['end_at'] = data['end_at'].strftime('%Y-%m-%d %H:%M:%S')
-        results.append(data)
-    
-    return results
+        yield _pomodoro_record(pomo.id, pomo.to_dict())
 
-def get_tasks_by_date(target_date: date) -> List[Dict]:
-    """指定日のタスクを取得"""
-    start_time = datetime.combine(target_date, datetime.min.time())
-    end_time = start_time + timedelta(days=1)
+def iter_tasks(start_date: date, end_date: date) -> Iterator[Task]:
+    """期間内のタスクを開始時刻順に逐次取得"""
+    start_time, end_time = _date_range(start_date, end_date)
     
     tasks = db.collection('tasks')\
         .where('start_at', '>=', start_time)\
@@ -242,22 +678,12 @@ def get_tasks_by_date(target_date: date) -> List[Dict]:
         .order_by('start_at')\
         .stream()
     
-    results = []
     for task in tasks:
-        data = task.to_dict()
-        data['id'] = task.id
-        if data.get('start_at'):
-            data['start_at'] = data['start_at'].strftime('%Y-%m-%d %H:%M:%S')
-        if data.get('end_at'):
-            data['end_at'] = data['end_at'].strftime('%Y-%m-%d %H:%M:%S')
-        results.append(data)
-    
-    return results
+        yield _task_record(task.id, task.to_dict())
 
-def get_all_notes_by_date(target_date: date) -> List[Dict]:
-    """指定日のメモを取得"""
-    start_time = datetime.combine(target_date, datetime.min.time())
-    end_time = start_time + timedelta(days=1)
+def iter_notes(start_date: date, end_date: date) -> Iterator[Note]:
+    """期間内のメモを作成順に逐次取得（メモにはタスク名がないので name はNone）"""
+    start_time, end_time = _date_range(start_date, end_date)
     
     notes = db.collection('notes')\
         .where('created_at', '>=', start_time)\
@@ -265,12 +691,365 @@ def get_all_notes_by_date(target_date: date) -> List[Dict]:
         .order_by('created_at')\
         .stream()
     
-    results = []
     for note in notes:
-        data = note.to_dict()
-        data['id'] = note.id
-        if data.get('created_at'):
-            data['created_at'] = data['created_at'].strftime('%Y-%m-%d %H:%M:%S')
-        results.append(data)
+        yield _note_record(note.id, note.to_dict())
+
+def _history_page(query, collection: str, to_record, after, limit: int) -> List:
+    """(start_at, ドキュメントID) の降順で、after より後のドキュメントを最大limit件レコードで取得"""
+    query = query\
+        .order_by('start_at', direction=firestore.Query.DESCENDING)\
+        .order_by(firestore.FieldPath.document_id(), direction=firestore.Query.DESCENDING)
+    if after is not None:
+        # カーソルの値だけで続きから読む（前ページ最後のドキュメントを読み直さない）
+        start_at, doc_id = after
+        start_at = datetime.strptime(start_at, '%Y-%m-%d %H:%M:%S.%f').replace(tzinfo=timezone.utc)
+        query = query.start_after({
+            'start_at': start_at,
+            firestore.FieldPath.document_id(): db.collection(collection).document(doc_id)
+        })
+    return [to_record(doc.id, doc.to_dict()) for doc in query.limit(limit).stream()]
+
+def get_task_history(limit: int, after=None, category_id: Optional[str] = None,
+                     status: Optional[str] = None) -> List[Task]:
+    """タスク履歴を新しい順に取得（after には前ページ最後の (start_at, id) を渡す）"""
+    query = db.collection('tasks')
+    if category_id is not None:
+        query = query.where('category_id', '==', category_id)
+    if status is not None:
+        query = query.where('status', '==', status)
+    return _history_page(query, 'tasks', _task_record, after, limit)
+
+def get_pomodoro_history(limit: int, after=None, completed: Optional[bool] = None) -> List[Pomodoro]:
+    """ポモドーロ履歴を新しい順に取得（after には前ページ最後の (start_at, id) を渡す）"""
+    query = db.collection('pomodoros')
+    if completed is not None:
+        query = query.where('completed', '==', bool(completed))
+    return _history_page(query, 'pomodoros', _pomodoro_record, after, limit)
+
+def import_records(records) -> Dict[str, int]:
+    """(種別, 項目) のレコード列を一括登録し、種別ごとの件数を返す
+
+    BATCH_WRITE_LIMIT件ごとのWriteBatchを、最大IMPORT_COMMIT_WORKERS個並行してコミットする。
+    同じインポート内のメモのtask_idは新しいタスクのドキュメントIDに付け替える
+    （インポートしたタスクにないtask_idのメモは登録しない）。
+    集計と日別サマリーは最後に取り込んだ期間だけ作り直す。
+    """
+    counts = {'pomodoro': 0, 'task': 0, 'note': 0}
+    task_ids = {}
+    first_day = last_day = None
+    pending = []
+    
+    with ThreadPoolExecutor(max_workers=IMPORT_COMMIT_WORKERS) as executor:
+        batch, size = db.batch(), 0
+        for record_type, fields in records:
+            if record_type == 'pomodoro':
+                doc_ref = db.collection('pomodoros').document()
+                data = {
+                    'start_at': fields['start_at'],
+                    'end_at': fields['end_at'],
+                    'completed': fields['completed'],
+                    'created_at': fields['start_at']
+                }
+            elif record_type == 'task':
+                doc_ref = db.collection('tasks').document()
+                if fields.get('id') is not None:
+                    task_ids[str(fields['id'])] = doc_ref.id
+                data = {
+                    'name': fields['name'],
+                    'category_id': fields.get('category_id'),
+                    'template_id': fields.get('template_id'),
+                    'start_at': fields['start_at'],
+                    'end_at': fields['end_at'],
+                    'status': 'completed',
+                    'created_at': fields['start_at']
+                }
+            else:
+                task_id = task_ids.get(str(fields['task_id']))
+                if task_id is None:
+                    continue
+                doc_ref = db.collection('notes').document()
+                data = {
+                    'task_id': task_id,
+                    'note': fields['body'],
+                    'created_at': fields.get('created_at') or firestore.SERVER_TIMESTAMP
+                }
+            if record_type != 'note':
+                day = fields['start_at'].date()
+                first_day = day if first_day is None else min(first_day, day)
+                last_day = day if last_day is None else max(last_day, day)
+            
+            batch.set(doc_ref, data)
+            counts[record_type] += 1
+            size += 1
+            if size == BATCH_WRITE_LIMIT:
+                pending.append(executor.submit(batch.commit))
+                batch, size = db.batch(), 0
+                # コミット待ちのバッチを抱えすぎないよう、古いものから完了を待つ
+                while len(pending) >= IMPORT_COMMIT_WORKERS * 2:
+                    pending.pop(0).result()
+        _bump_versions(batch, 'today')
+        pending.append(executor.submit(batch.commit))
+        for future in pending:
+            future.result()
+    _versions_cache['versions'] = None
+    
+    if first_day is not None:
+        rebuild_daily_rollups(first_day, last_day)
+        rebuild_daily_summaries(first_day, last_day)
+    return counts
+
+def add_event(event_type: str, payload: str) -> str:
+    """イベントを記録（payloadはJSON文字列）"""
+    doc_ref = db.collection('events').document()
+    doc_ref.set({
+        'type': event_type,
+        'payload': payload,
+        'created_at': firestore.SERVER_TIMESTAMP,
+        'expire_at': datetime.now(timezone.utc) + timedelta(seconds=EVENT_RETENTION_SECONDS)
+    })
+    return doc_ref.id
+
+def watch_events(callback, stop):
+    """stopがセットされるまで、新しいイベントを (id, 種別, payload) でcallbackに渡し続ける
+
+    eventsのリスナーを1本張り、追加されたドキュメントだけを受け取る（ポーリングの読み取りは発生しない）。
+    """
+    query = db.collection('events')\
+        .where('created_at', '>', datetime.now(timezone.utc))\
+        .order_by('created_at')
+    
+    def on_snapshot(snapshots, changes, read_time):
+        for change in changes:
+            if change.type.name == 'ADDED':
+                data = change.document.to_dict()
+                callback(change.document.id, data['type'], data['payload'])
+    
+    watch = query.on_snapshot(on_snapshot)
+    try:
+        stop.wait()
+    finally:
+        watch.unsubscribe()
+
+def get_daily_rollups(start_date: date, end_date: date) -> List[Dict]:
+    """期間内（両端含む）の日・カテゴリ別集計を取得"""
+    rollups = db.collection('daily_rollups')\
+        .where('day', '>=', str(start_date))\
+        .where('day', '<=', str(end_date))\
+        .order_by('day')\
+        .stream()
+    
+    return [rollup.to_dict() for rollup in rollups]
+
+def rebuild_daily_rollups(start_date: Optional[date] = None, end_date: Optional[date] = None) -> int:
+    """pomodoros・tasksから集計を作り直す（期間省略時は全期間）"""
+    start_time, end_time = _date_range(start_date or date(1970, 1, 1), end_date or date.today())
+    
+    def stream(collection):
+        return db.collection(collection)\
+            .where('start_at', '>=', start_time)\
+            .where('start_at', '<', end_time)\
+            .order_by('start_at')\
+            .stream()
+    
+    rollups, hourly_rollups = {}, {}
+    def add(day, category_id, field, value):
+        key = (day, category_id)
+        rollup = rollups.setdefault(key, {
+            'day': day, 'category_id': category_id,
+            'completed_pomodoros': 0, 'aborted_pomodoros': 0, 'focused_minutes': 0.0
+        })
+        rollup[field] += value
+    
+    def add_hourly(day, hour, field, value):
+        rollup = hourly_rollups.setdefault((day, hour), {
+            'day': day, 'hour': hour,
+            'completed_pomodoros': 0, 'aborted_pomodoros': 0, 'focused_minutes': 0.0
+        })
+        rollup[field] += value
+    
+    # タスクの集中時間（開始時刻順に保持してポモドーロのカテゴリ判定にも使う）
+    task_starts, task_spans = [], []
+    for task in stream('tasks'):
+        data = task.to_dict()
+        start_at = _as_utc(data['start_at'])
+        end_at = _as_utc(data['end_at']) if data.get('end_at') else None
+        task_starts.append(start_at)
+        task_spans.append((end_at, data.get('category_id')))
+        if end_at is not None:
+            add(start_at.strftime('%Y-%m-%d'), data.get('category_id'),
+                'focused_minutes', (end_at - start_at).total_seconds() / 60)
+            for day, hour, minutes in _hour_pieces(start_at, end_at):
+                add_hourly(day, hour, 'focused_minutes', minutes)
+    
+    for pomo in stream('pomodoros'):
+        data = pomo.to_dict()
+        if data.get('end_at') is None:
+            continue
+        start_at = _as_utc(data['start_at'])
+        category_id = None
+        i = bisect.bisect_right(task_starts, start_at) - 1
+        if i >= 0 and (task_spans[i][0] is None or task_spans[i][0] > start_at):
+            category_id = task_spans[i][1]
+        field = 'completed_pomodoros' if data.get('completed') else 'aborted_pomodoros'
+        add(start_at.strftime('%Y-%m-%d'), category_id, field, 1)
+        add_hourly(start_at.strftime('%Y-%m-%d'), start_at.hour, field, 1)
+    
+    # 既存の集計を削除してから書き込む（500件ごとにコミット）
+    first_day, last_day = start_time.strftime('%Y-%m-%d'), (end_time - timedelta(days=1)).strftime('%Y-%m-%d')
+    batch, pending = db.batch(), 0
+    for collection in ('daily_rollups', 'hourly_rollups'):
+        stale = db.collection(collection)\
+            .where('day', '>=', first_day)\
+            .where('day', '<=', last_day)\
+            .stream()
+        for doc in stale:
+            batch.delete(doc.reference)
+            pending += 1
+            if pending == 500:
+                batch.commit()
+                batch, pending = db.batch(), 0
+    batch.commit()
+    
+    writes = [(_rollup_ref(day, category_id), rollup) for (day, category_id), rollup in rollups.items()]
+    writes += [(_hourly_rollup_ref(day, hour), rollup) for (day, hour), rollup in hourly_rollups.items()]
+    batch, pending = db.batch(), 0
+    for doc_ref, rollup in writes:
+        batch.set(doc_ref, rollup)
+        pending += 1
+        if pending == 500:
+            batch.commit()
+            batch, pending = db.batch(), 0
+    batch.commit()
+    
+    return len(rollups)
+
+def rebuild_daily_summaries(start_date: Optional[date] = None, end_date: Optional[date] = None) -> int:
+    """pomodoros・tasks・notesから日別サマリーを作り直す（期間省略時は全期間）"""
+    start_time, end_time = _date_range(start_date or date(1970, 1, 1), end_date or date.today())
+    
+    def stream(collection):
+        return db.collection(collection)\
+            .where('start_at', '>=', start_time)\
+            .where('start_at', '<', end_time)\
+            .stream()
+    
+    summaries = {}
+    def summary(start_at):
+        day = _as_utc(start_at).strftime('%Y-%m-%d')
+        return summaries.setdefault(day, {'date': day, 'pomodoros': {}, 'tasks': {}})
+    
+    for pomo in stream('pomodoros'):
+        data = pomo.to_dict()
+        summary(data['start_at'])['pomodoros'][pomo.id] = {
+            'start_at': data['start_at'],
+            'end_at': data.get('end_at'),
+            'completed': data.get('completed', False)
+        }
+    
+    tasks = {}
+    for task in stream('tasks'):
+        data = task.to_dict()
+        fields = _task_summary_fields(data)
+        fields['notes'] = {}
+        summary(data['start_at'])['tasks'][task.id] = fields
+        tasks[task.id] = fields
+    
+    # メモはタスクIDの'in'クエリを並行実行して取得
+    ids = list(tasks)
+    chunks = [ids[i:i + IN_QUERY_LIMIT] for i in range(0, len(ids), IN_QUERY_LIMIT)]
+    if chunks:
+        with ThreadPoolExecutor(max_workers=min(len(chunks), 8)) as executor:
+            for notes in executor.map(_get_notes_chunk, chunks):
+                for note in notes:
+                    data = note.to_dict()
+                    tasks[data['task_id']]['notes'][note.id] = {
+                        'note': data.get('note'),
+                        'created_at': data.get('created_at')
+                    }
+    
+    # 期間内のサマリーを削除してから書き込む（500件ごとにコミット）
+    first_day, last_day = start_time.strftime('%Y-%m-%d'), (end_time - timedelta(days=1)).strftime('%Y-%m-%d')
+    stale = db.collection('daily_summaries')\
+        .where('date', '>=', first_day)\
+        .where('date', '<=', last_day)\
+        .stream()
+    batch, pending = db.batch(), 0
+    for doc in stale:
+        if doc.id not in summaries:
+            batch.delete(doc.reference)
+            pending += 1
+            if pending == 500:
+                batch.commit()
+                batch, pending = db.batch(), 0
+    for day, data in summaries.items():
+        batch.set(_summary_ref(day), data)
+        pending += 1
+        if pending == 500:
+            batch.commit()
+            batch, pending = db.batch(), 0
+    batch.commit()
+    
+    return len(summaries)
+
+def get_stats(start_date: date, end_date: date, group_by: str = 'day') -> Dict:
+    """期間内の集中時間・完了率・ヒートマップ・連続日数を集計
+
+    日別・時間帯別の集計ドキュメントだけを読むため、読み取り件数は日数に比例する。
+    """
+    def read(collection):
+        return [doc.to_dict() for doc in db.collection(collection)
+                .where('day', '>=', str(start_date))
+                .where('day', '<=', str(end_date))
+                .stream()]
+    
+    daily = read('daily_rollups')
+    hourly = read('hourly_rollups')
+    fields = ('focused_minutes', 'completed_pomodoros', 'aborted_pomodoros')
+    
+    def aggregate(rows, key):
+        groups = {}
+        for row in rows:
+            group = groups.setdefault(key(row), dict.fromkeys(fields, 0))
+            for field in fields:
+                group[field] += row.get(field, 0)
+        return groups
+    
+    totals = aggregate(daily, lambda row: None).get(None, dict.fromkeys(fields, 0))
+    if group_by == 'hour':
+        groups = aggregate(hourly, lambda row: row['hour'])
+    elif group_by == 'week':
+        groups = aggregate(daily, lambda row: str(
+            date.fromisoformat(row['day']) - timedelta(days=date.fromisoformat(row['day']).weekday())))
+    elif group_by == 'category':
+        groups = aggregate(daily, lambda row: row.get('category_id'))
+        categories = {cat['id']: cat for cat in get_categories()}
+        for category_id, group in groups.items():
+            group['category_name'] = categories.get(category_id, {}).get('name')
+            group['category_color'] = categories.get(category_id, {}).get('color')
+    else:
+        groups = aggregate(daily, lambda row: row['day'])
+    
+    # 曜日（0=日曜）×時間帯の集中時間
+    heatmap = aggregate(hourly, lambda row: (
+        (date.fromisoformat(row['day']).weekday() + 1) % 7, row['hour']))
+    
+    # 活動のあった日の連続区間
+    active_days = sorted(day for day, group in aggregate(daily, lambda row: row['day']).items()
+                         if group['completed_pomodoros'] > 0 or group['focused_minutes'] > 0)
+    streaks = []
+    for day in active_days:
+        current = date.fromisoformat(day)
+        if streaks and date.fromisoformat(streaks[-1]['last_day']) + timedelta(days=1) == current:
+            streaks[-1]['last_day'] = day
+            streaks[-1]['days'] += 1
+        else:
+            streaks.append({'first_day': day, 'last_day': day, 'days': 1})
     
-    return results
\ No newline at end of file
+    return {
+        'totals': totals,
+        # 未分類（None）はSQLiteと同じく先頭に並べる
+        'groups': [dict(group, key=key) for key, group in sorted(
+            groups.items(), key=lambda item: (item[0] is not None, str(item[0])))],
+        'heatmap': [(weekday, hour, cell['focused_minutes']) for (weekday, hour), cell in heatmap.items()],
+        'streaks': streaks,
+    }
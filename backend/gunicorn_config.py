@@ -1,13 +1,28 @@
 import multiprocessing
+import os
+import tempfile
 
 # Gunicorn configuration
-bind = "0.0.0.0:5001"
-workers = multiprocessing.cpu_count() * 2 + 1
-worker_class = "sync"
+# Cloud Run は PORT で待ち受けるポートを渡す
+bind = f"0.0.0.0:{os.getenv('PORT', '5001')}"
+workers = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+# /api/events の接続がワーカーを占有しないようスレッドで処理する
+# （EVENTS_MAX_CLIENTS は threads より小さくし、通常のAPI用のスレッドを残す。
+#   未設定なら events.py が GUNICORN_THREADS から決めるので、ワーカーにもスレッド数を渡す）
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.getenv("GUNICORN_THREADS", "16"))
+os.environ["GUNICORN_THREADS"] = str(threads)
 worker_connections = 1000
-timeout = 120
+# app は import時にストレージへの接続やスレッドの起動をしないので、親プロセスで読み込んでおける
+# （有効にするとワーカーの起動が速くなり、読み込んだコードのメモリも共有される）
+preload_app = os.getenv("GUNICORN_PRELOAD", "false").lower() == "true"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
 keepalive = 5
 
+# /metrics で全ワーカーの値を合算するため、prometheus_clientのマルチプロセスモードを使う
+# （ワーカーより先に設定し、値はこのディレクトリのファイルに書き出される）
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "pomo-hub-metrics"))
+
 # Logging
 accesslog = "-"
 errorlog = "-"
@@ -22,4 +37,36 @@ pidfile = None
 umask = 0
 user = None
 group = None
-tmp_upload_dir = None
\ No newline at end of file
+tmp_upload_dir = None
+
+# Server hooks
+def on_starting(server):
+    """前回の起動で残ったメトリクスのファイルを消す"""
+    import shutil
+    directory = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory, exist_ok=True)
+
+def child_exit(server, worker):
+    """終了したワーカーのゲージを集計から外す"""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+def post_worker_init(worker):
+    """SIGTERMで先にSSEの接続を閉じ、終了がgraceful_timeoutまで待たされないようにする
+
+    あわせて、このワーカーのスケジューラーを起動する。
+    """
+    import signal
+    handle_exit = worker.handle_exit
+
+    def handle_term(sig, frame):
+        import events
+        events.close_all_streams()
+        handle_exit(sig, frame)
+
+    signal.signal(signal.SIGTERM, handle_term)
+
+    # リクエストを待たずに、期限切れのタイマーの回収を始める（起動は別スレッド）
+    import app
+    app.ensure_scheduler_started()
@@ -0,0 +1,53 @@
+import os
+import threading
+import time
+
+class CachedCheck:
+    """ストレージへの疎通確認などを一定間隔でだけ実行し、その間は前回の結果を返す
+
+    - 期限が切れたら1つのスレッドだけが確認し、他のスレッドは前回の結果をすぐに返す
+    - 失敗も同じ間隔で覚えておくので、障害中にプローブが確認を連打しない
+    - 結果は {'ok', 'checked_at'(epoch秒), 'ms', 'error'} の辞書
+    """
+
+    def __init__(self, check, interval: float = 10.0):
+        self.check = check
+        self.interval = interval
+        self._result = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def result(self) -> dict:
+        """前回の結果（期限切れなら確認し直した結果）"""
+        if self._result is not None and time.monotonic() - self._checked_at < self.interval:
+            return self._result
+        # 最初の1回だけは結果が出るまで待つ。以降は確認中なら前回の結果を返す
+        if not self._lock.acquire(blocking=self._result is None):
+            return self._result
+        try:
+            if self._result is None or time.monotonic() - self._checked_at >= self.interval:
+                self._result = self._run()
+                self._checked_at = time.monotonic()
+            return self._result
+        finally:
+            self._lock.release()
+
+    def _run(self) -> dict:
+        """確認を1回実行"""
+        started = time.perf_counter()
+        error = None
+        try:
+            self.check()
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+            print(f"ヘルスチェックエラー: {error}")
+        return {
+            'ok': error is None,
+            'checked_at': round(time.time(), 3),
+            'ms': round((time.perf_counter() - started) * 1000, 3),
+            'error': error
+        }
+
+def create_cached_check(check) -> CachedCheck:
+    """環境変数の間隔（HEALTH_CHECK_INTERVAL_SECONDS）で確認する CachedCheck を作成"""
+    return CachedCheck(check, interval=float(os.getenv('HEALTH_CHECK_INTERVAL_SECONDS', '10')))
@@ -0,0 +1,157 @@
+"""PomoHub 管理コマンド
+
+    python manage.py rebuild-rollups [--from YYYY-MM-DD] [--to YYYY-MM-DD]
+    python manage.py rebuild-summaries [--from YYYY-MM-DD] [--to YYYY-MM-DD]
+    python manage.py slow-queries [--log PATH] [--top N]
+    python manage.py migrate [--status]
+    python manage.py archive [--keep-months N] [--vacuum] [--status]
+"""
+import argparse
+from datetime import date, datetime
+
+def load_backend():
+    """app.pyと同じ判定でストレージを選択"""
+    from storage import LazyBackend
+    return LazyBackend().load()
+
+def rebuild_rollups(args):
+    """日・カテゴリ別集計を作り直す"""
+    backend = load_backend()
+    count = backend.rebuild_daily_rollups(args.start_date, args.end_date)
+    print(f"daily_rollups を再構築しました: {count}件")
+
+def rebuild_summaries(args):
+    """日別サマリー（Firestoreのみ）を作り直す"""
+    backend = load_backend()
+    if not hasattr(backend, 'rebuild_daily_summaries'):
+        print("日別サマリーはFirestore（K_SERVICE設定時）でのみ使用します")
+        return
+    count = backend.rebuild_daily_summaries(args.start_date, args.end_date)
+    print(f"daily_summaries を再構築しました: {count}件")
+
+def slow_queries(args):
+    """SQLITE_QUERY_LOG の記録から、合計時間の多いSQLを順に表示"""
+    import query_log
+    path = args.log or query_log.QUERY_LOG_PATH
+    if not path:
+        print("--log か SQLITE_QUERY_LOG でログファイルを指定してください")
+        return
+    ranked = query_log.summarize(query_log.read_entries(path))
+    if not ranked:
+        print(f"{path} に記録がありません")
+        return
+
+    print(f"{'total ms':>12} {'count':>8} {'avg ms':>9} {'max ms':>9} {'slow':>6}  sql")
+    for stats in ranked[:args.top]:
+        print(f"{stats['total_ms']:>12.1f} {stats['count']:>8} {stats['total_ms'] / stats['count']:>9.3f} "
+              f"{stats['max_ms']:>9.3f} {stats['slow']:>6}  {stats['sql'][:120]}")
+
+    for rank, stats in enumerate(ranked[:args.top], 1):
+        callers = sorted(stats['callers'].items(), key=lambda item: item[1], reverse=True)
+        print(f"\n#{rank} {stats['sql']}")
+        print(f"  呼び出し元: {', '.join(f'{caller} x{count}' for caller, count in callers[:3])}")
+        if stats['plan'] is not None:
+            print(f"  引数: {stats['params']}")
+            for line in stats['plan']:
+                print(f"  計画: {line}")
+
+def migrate(args):
+    """SQLiteのスキーマを最新にする（デプロイ前に実行しておくとワーカーの起動時は確認だけになる）"""
+    from storage import LazyBackend
+    if LazyBackend().uses_firestore():
+        print("Firestore（K_SERVICE設定時）にはスキーマのマイグレーションはありません")
+        return
+    import migrations
+    import models
+    conn = models.get_db_connection()
+    if args.status:
+        for version, description, applied_at in migrations.get_applied_migrations(conn):
+            print(f"  {version:>3} {datetime.fromtimestamp(applied_at):%Y-%m-%d %H:%M:%S}  {description}")
+        for version, description, _ in migrations.pending_migrations(conn):
+            print(f"  {version:>3} {'未適用':<19}  {description}")
+        return
+    applied = migrations.migrate(
+        conn, on_apply=lambda version, description: print(f"適用中: {version} {description}")
+    )
+    version = migrations.get_schema_version(conn)
+    if applied:
+        print(f"{models.DATABASE} をバージョン {version} にしました（{len(applied)}件適用）")
+    else:
+        print(f"{models.DATABASE} は最新です（バージョン {version}）")
+
+def archive_months(args):
+    """締まった月の記録をアーカイブDBへ移す（月に1回、cronなどで実行する）"""
+    from storage import LazyBackend
+    if LazyBackend().uses_firestore():
+        print("Firestore（K_SERVICE設定時）にはアーカイブはありません")
+        return
+    import archive
+    import models
+    models.init_db()
+    conn = models.get_db_connection()
+    if args.status:
+        for month, pomodoros, tasks, notes, archived_at in archive.get_archived_months(conn):
+            print(f"  {month}  {datetime.fromtimestamp(archived_at):%Y-%m-%d %H:%M:%S}  "
+                  f"ポモドーロ {pomodoros}件, タスク {tasks}件, メモ {notes}件")
+        print(f"アーカイブ: {archive.archive_path(models.DATABASE)}（境界: {archive.get_boundary(conn) or 'なし'}）")
+        left = archive.count_left_behind(conn)
+        if left and any(left.values()):
+            print(f"境界より前で本体に残っている行: ポモドーロ {left['pomodoros']}件, "
+                  f"タスク {left['tasks']}件, メモ {left['notes']}件")
+            print("  （移したときに進行中だった行・翌月以降に終わったタスク・後からインポートした行は"
+                  "以後のアーカイブでも移さない。本体から読むので表示・集計には含まれる）")
+        return
+    keep_months = archive.ARCHIVE_KEEP_MONTHS if args.keep_months is None else args.keep_months
+    if keep_months < 0:
+        print("--keep-months には0以上を指定してください")
+        return
+    archived = archive.archive_closed_months(
+        conn, models.DATABASE, keep_months,
+        on_archive=lambda month_start, counts: print(
+            f"{month_start:%Y-%m}: ポモドーロ {counts['pomodoros']}件, "
+            f"タスク {counts['tasks']}件, メモ {counts['notes']}件を移しました"
+        )
+    )
+    if not archived:
+        print("アーカイブする月はありません")
+        return
+    if args.vacuum:
+        # 移した行の空き領域を返してファイルを小さくする（実行中は書き込みが待たされる）
+        conn.execute('VACUUM')
+        print(f"{models.DATABASE} をVACUUMしました")
+
+def main():
+    parser = argparse.ArgumentParser(description='PomoHub 管理コマンド')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    rebuild = subparsers.add_parser('rebuild-rollups', help='日・カテゴリ別集計を作り直す')
+    rebuild.add_argument('--from', dest='start_date', type=date.fromisoformat, help='開始日（省略時は全期間）')
+    rebuild.add_argument('--to', dest='end_date', type=date.fromisoformat, help='終了日（省略時は全期間）')
+    rebuild.set_defaults(handler=rebuild_rollups)
+
+    summaries = subparsers.add_parser('rebuild-summaries', help='日別サマリーを作り直す（Firestore）')
+    summaries.add_argument('--from', dest='start_date', type=date.fromisoformat, help='開始日（省略時は全期間）')
+    summaries.add_argument('--to', dest='end_date', type=date.fromisoformat, help='終了日（省略時は全期間）')
+    summaries.set_defaults(handler=rebuild_summaries)
+
+    slow = subparsers.add_parser('slow-queries', help='SQLiteのクエリログを合計時間順に集計する')
+    slow.add_argument('--log', help='ログファイル（省略時は SQLITE_QUERY_LOG）')
+    slow.add_argument('--top', type=int, default=20, help='表示する件数')
+    slow.set_defaults(handler=slow_queries)
+
+    migrate_parser = subparsers.add_parser('migrate', help='SQLiteのスキーマを最新にする')
+    migrate_parser.add_argument('--status', action='store_true', help='適用せずに適用済み・未適用の一覧を表示')
+    migrate_parser.set_defaults(handler=migrate)
+
+    archive_parser = subparsers.add_parser('archive', help='締まった月の記録をアーカイブDBへ移す')
+    archive_parser.add_argument('--keep-months', type=int, default=None,
+                                help='今月に加えて本体に残す月数（省略時は ARCHIVE_KEEP_MONTHS）')
+    archive_parser.add_argument('--vacuum', action='store_true', help='移した後に本体のDBをVACUUMする')
+    archive_parser.add_argument('--status', action='store_true', help='移さずにアーカイブ済みの月を表示')
+    archive_parser.set_defaults(handler=archive_months)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+import functools
+import inspect
+import os
+import time
+from datetime import datetime
+
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Gauge, Histogram,
+                               generate_latest, multiprocess)
+
+# 計測しないストレージ関数（接続の取得・後始末と、stopまで戻らない待ち受けループ）
+STORAGE_EXCLUDE = {'get_db_connection', 'close_db_connection', 'watch_events'}
+
+STORAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+TIMER_LAG_BUCKETS = (0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'pomohub_http_request_duration_seconds',
+    'リクエストの処理時間（ストリーミング応答は本文の送信開始まで）',
+    ['method', 'route', 'status']
+)
+STORAGE_CALL_SECONDS = Histogram(
+    'pomohub_storage_call_duration_seconds',
+    'ストレージ関数の所要時間（ジェネレーターは最後まで読み終えるまで）',
+    ['function'],
+    buckets=STORAGE_BUCKETS
+)
+NOTIFICATION_ENQUEUE_SECONDS = Histogram(
+    'pomohub_notification_enqueue_duration_seconds',
+    'send_discord_notification の所要時間（キューに積むまで）',
+    buckets=STORAGE_BUCKETS
+)
+NOTIFICATION_SEND_SECONDS = Histogram(
+    'pomohub_notification_send_duration_seconds',
+    'Discord Webhookへの送信時間（再送を含む）',
+    ['result']
+)
+NOTIFICATION_BACKLOG = Gauge(
+    'pomohub_notification_backlog',
+    '未送信のDiscord通知の数',
+    multiprocess_mode='livesum'
+)
+SCHEDULER_PENDING_TIMERS = Gauge(
+    'pomohub_scheduler_pending_timers',
+    '発火待ちのタイマー数（リースを持つプロセスが更新）',
+    multiprocess_mode='livesum'
+)
+TIMER_FIRE_LAG_SECONDS = Histogram(
+    'pomohub_timer_fire_lag_seconds',
+    'タイマーの予定時刻から発火までの遅れ',
+    buckets=TIMER_LAG_BUCKETS
+)
+SSE_CLIENTS = Gauge(
+    'pomohub_sse_clients',
+    '接続中のSSEクライアント数',
+    multiprocess_mode='livesum'
+)
+
+def _timed_storage_call(name, func):
+    """ストレージ関数を所要時間の計測付きで包む"""
+    histogram = STORAGE_CALL_SECONDS.labels(name)
+
+    if inspect.isgeneratorfunction(func):
+        @functools.wraps(func)
+        def generator_wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                yield from func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started)
+        return generator_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - started)
+    return wrapper
+
+def instrument_storage(module):
+    """ストレージモジュールの公開関数を計測付きに置き換える（importより前に呼ぶ）"""
+    for name, func in inspect.getmembers(module, inspect.isfunction):
+        if name.startswith('_') or name in STORAGE_EXCLUDE or func.__module__ != module.__name__:
+            continue
+        if hasattr(func, '__wrapped__'):
+            continue
+        setattr(module, name, _timed_storage_call(name, func))
+
+def observe_timer_lag(fire_at, now):
+    """タイマーの予定時刻（文字列・naive・aware のいずれか）からの遅れを記録"""
+    if isinstance(fire_at, str):
+        fire_at = datetime.fromisoformat(fire_at)
+    if fire_at.tzinfo is not None:
+        fire_at = fire_at.astimezone().replace(tzinfo=None)
+    TIMER_FIRE_LAG_SECONDS.observe(max(0.0, (now - fire_at).total_seconds()))
+
+def observe_notification_send(seconds, sent):
+    """Discordへの1通の送信時間を記録（DiscordNotifierのon_send）"""
+    NOTIFICATION_SEND_SECONDS.labels('ok' if sent else 'error').observe(seconds)
+
+def observe_request(method, route, status, seconds):
+    """1リクエストの処理時間を記録"""
+    HTTP_REQUEST_SECONDS.labels(method, route, str(status)).observe(seconds)
+
+def render():
+    """Prometheusのテキスト形式で (本文, Content-Type) を返す
+
+    PROMETHEUS_MULTIPROC_DIR が設定されていれば（gunicorn）全ワーカーの値を合算する。
+    """
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
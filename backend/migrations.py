@@ -0,0 +1,287 @@
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+# 適用済みのバージョンを待つ間の busy_timeout（他のワーカーが索引を作っている間など）
+MIGRATION_LOCK_TIMEOUT_MS = 60000
+
+def _create_base_tables(conn):
+    # categoriesテーブル（カテゴリ管理）
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS categories (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            color TEXT DEFAULT '#3b82f6',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # pomodorosテーブル（ポモドーロタイマー専用）
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS pomodoros (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            start_at TIMESTAMP NOT NULL,
+            end_at TIMESTAMP,
+            completed BOOLEAN DEFAULT FALSE
+        )
+    ''')
+
+    # task_templatesテーブル（タスクテンプレート）
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS task_templates (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            category_id INTEGER,
+            name TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            is_active BOOLEAN DEFAULT TRUE,
+            FOREIGN KEY (category_id) REFERENCES categories (id)
+        )
+    ''')
+
+    # tasksテーブル（実際の作業記録）
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            template_id INTEGER,
+            category_id INTEGER,
+            name TEXT NOT NULL,
+            start_at TIMESTAMP NOT NULL,
+            end_at TIMESTAMP,
+            status TEXT DEFAULT 'active',
+            FOREIGN KEY (template_id) REFERENCES task_templates (id),
+            FOREIGN KEY (category_id) REFERENCES categories (id)
+        )
+    ''')
+
+    # notesテーブル（タスクに紐づくメモ）
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS notes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            task_id INTEGER NOT NULL,
+            body TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (task_id) REFERENCES tasks (id)
+        )
+    ''')
+
+    # 開発初期のテーブル
+    conn.execute('DROP TABLE IF EXISTS sessions')
+
+def _create_date_indexes(conn):
+    # 日付範囲検索用のインデックス
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_pomodoros_start_at ON pomodoros (start_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_tasks_start_at ON tasks (start_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_tasks_status_start_at ON tasks (status, start_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_tasks_category_id_start_at ON tasks (category_id, start_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_pomodoros_completed_start_at ON pomodoros (completed, start_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_notes_task_id_created_at ON notes (task_id, created_at)')
+
+def _create_timer_tables(conn):
+    # timersテーブル（ポモドーロ終了タイマー、全ワーカーで共有）
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS timers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            pomodoro_id INTEGER NOT NULL,
+            fire_at TIMESTAMP NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            fired_at TIMESTAMP,
+            FOREIGN KEY (pomodoro_id) REFERENCES pomodoros (id)
+        )
+    ''')
+
+    # scheduler_leasesテーブル（タイマーを処理するプロセスのリース）
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS scheduler_leases (
+            name TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    ''')
+
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_timers_status_fire_at ON timers (status, fire_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_timers_pomodoro_id ON timers (pomodoro_id)')
+
+def _create_rollup_tables(conn):
+    # daily_rollupsテーブル（日・カテゴリごとの集計、category_id=0は未分類）
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS daily_rollups (
+            day TEXT NOT NULL,
+            category_id INTEGER NOT NULL DEFAULT 0,
+            completed_pomodoros INTEGER NOT NULL DEFAULT 0,
+            aborted_pomodoros INTEGER NOT NULL DEFAULT 0,
+            focused_minutes REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, category_id)
+        )
+    ''')
+
+    # hourly_rollupsテーブル（日・時間帯ごとの集計、ヒートマップ用）
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS hourly_rollups (
+            day TEXT NOT NULL,
+            hour INTEGER NOT NULL,
+            completed_pomodoros INTEGER NOT NULL DEFAULT 0,
+            aborted_pomodoros INTEGER NOT NULL DEFAULT 0,
+            focused_minutes REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, hour)
+        )
+    ''')
+
+def _create_resource_versions(conn):
+    # resource_versionsテーブル（ETag用のリソースごとのバージョン）
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS resource_versions (
+            resource TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            updated_at REAL NOT NULL
+        )
+    ''')
+
+def _create_active_task(conn):
+    # 進行中のタスク（常に最大1行）
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS active_task (
+            slot INTEGER PRIMARY KEY CHECK (slot = 1),
+            task_id INTEGER NOT NULL,
+            FOREIGN KEY (task_id) REFERENCES tasks (id)
+        )
+    ''')
+    # 既存DBでは最も新しい進行中タスクを登録し、それ以外の進行中のタスクは終了にする
+    conn.execute(
+        '''INSERT OR IGNORE INTO active_task (slot, task_id)
+           SELECT 1, id FROM tasks WHERE status = 'active' ORDER BY start_at DESC, id DESC LIMIT 1'''
+    )
+    _close_stale_active_tasks(conn)
+
+def _close_stale_active_tasks(conn):
+    # active_task にない進行中のタスク（以前は切り替え時に終了していなかった）を、
+    # 次のタスクの開始時刻で終了にして、その集中時間を日別・時間帯別の集計に加える
+    stale = conn.execute(
+        '''SELECT t.id, t.category_id, t.start_at,
+                  COALESCE((SELECT MIN(n.start_at) FROM tasks n WHERE n.start_at > t.start_at), t.start_at) AS end_at
+           FROM tasks t
+           WHERE t.status = 'active' AND t.id NOT IN (SELECT task_id FROM active_task)'''
+    ).fetchall()
+    for task_id, category_id, start_at, end_at in stale:
+        conn.execute(
+            "UPDATE tasks SET status = 'completed', end_at = ? WHERE id = ?",
+            (end_at, task_id)
+        )
+        start, end = datetime.fromisoformat(str(start_at)), datetime.fromisoformat(str(end_at))
+        conn.execute(
+            '''INSERT INTO daily_rollups (day, category_id, focused_minutes) VALUES (?, ?, ?)
+               ON CONFLICT(day, category_id) DO UPDATE SET
+                   focused_minutes = focused_minutes + excluded.focused_minutes''',
+            (start.strftime('%Y-%m-%d'), category_id or 0, (end - start).total_seconds() / 60)
+        )
+        while start < end:
+            piece_end = min(end, start.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1))
+            conn.execute(
+                '''INSERT INTO hourly_rollups (day, hour, focused_minutes) VALUES (?, ?, ?)
+                   ON CONFLICT(day, hour) DO UPDATE SET
+                       focused_minutes = focused_minutes + excluded.focused_minutes''',
+                (start.strftime('%Y-%m-%d'), start.hour, (piece_end - start).total_seconds() / 60)
+            )
+            start = piece_end
+
+def _create_events(conn):
+    # SSEで配信するイベント（全ワーカーが新着を読み取る）
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            type TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+    ''')
+
+def _create_archived_months(conn):
+    # アーカイブDBへ移した月（range_end の最大値より前の行はアーカイブにもある）
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS archived_months (
+            month TEXT PRIMARY KEY,
+            range_end TIMESTAMP NOT NULL,
+            pomodoros INTEGER NOT NULL,
+            tasks INTEGER NOT NULL,
+            notes INTEGER NOT NULL,
+            archived_at REAL NOT NULL
+        )
+    ''')
+
+# (バージョン, 説明, 適用する関数) を適用順に並べる。
+# 追加するときは末尾に次のバージョンで足す（適用済みのものは書き換えない）。
+# schema_version ができる前のDBにも安全に当てられるよう、各関数は IF NOT EXISTS で書く。
+MIGRATIONS = [
+    (1, '基本テーブル（categories, pomodoros, task_templates, tasks, notes）', _create_base_tables),
+    (2, '日付範囲検索用のインデックス', _create_date_indexes),
+    (3, 'タイマーとスケジューラーのリース', _create_timer_tables),
+    (4, '日別・時間帯別の集計テーブル', _create_rollup_tables),
+    (5, 'ETag用のリソースバージョン', _create_resource_versions),
+    (6, '進行中のタスク', _create_active_task),
+    (7, 'SSE配信用のイベント', _create_events),
+    (8, 'アーカイブ済みの月', _create_archived_months),
+    # 6 を当てたあとで、6 に足した終了処理を既存のDBにも当てる（進行中のタスクが1件なら何もしない）
+    (9, '残っていた進行中のタスクの終了', _close_stale_active_tasks),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version(conn):
+    """適用済みの最新バージョン（schema_version がなければ0）"""
+    try:
+        return conn.execute('SELECT MAX(version) FROM schema_version').fetchone()[0] or 0
+    except sqlite3.OperationalError:
+        return 0
+
+def pending_migrations(conn):
+    """未適用の (バージョン, 説明, 関数) の一覧"""
+    version = get_schema_version(conn)
+    return [migration for migration in MIGRATIONS if migration[0] > version]
+
+def get_applied_migrations(conn):
+    """適用済みの (バージョン, 説明, 適用日時のepoch秒) の一覧"""
+    try:
+        return [tuple(row) for row in conn.execute(
+            'SELECT version, description, applied_at FROM schema_version ORDER BY version'
+        )]
+    except sqlite3.OperationalError:
+        return []
+
+def migrate(conn, on_apply=None):
+    """未適用のマイグレーションを順に適用し、適用したバージョンの一覧を返す
+
+    スキーマが最新なら1回のバージョン確認だけで戻る。適用は1件ずつ
+    BEGIN IMMEDIATE で書き込みロックを取ってからバージョンを確認し直すので、
+    複数のワーカーが同時に起動しても各マイグレーションは1回だけ適用される。
+    on_apply(バージョン, 説明) は適用する直前に呼ばれる（CLIの進捗表示用）。
+    """
+    if get_schema_version(conn) >= LATEST_VERSION:
+        return []
+
+    applied = []
+    busy_timeout = conn.execute('PRAGMA busy_timeout').fetchone()[0]
+    conn.execute(f'PRAGMA busy_timeout={MIGRATION_LOCK_TIMEOUT_MS}')
+    try:
+        for version, description, apply in MIGRATIONS:
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS schema_version (
+                        version INTEGER PRIMARY KEY,
+                        description TEXT NOT NULL,
+                        applied_at REAL NOT NULL
+                    )
+                ''')
+                if get_schema_version(conn) >= version:
+                    continue
+                if on_apply is not None:
+                    on_apply(version, description)
+                apply(conn)
+                conn.execute(
+                    'INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)',
+                    (version, description, time.time())
+                )
+            applied.append(version)
+    finally:
+        conn.execute(f'PRAGMA busy_timeout={busy_timeout}')
+    return applied
@@ -1,143 +1,228 @@
+import os
 import sqlite3
-from datetime import datetime, date
+from itertools import islice
+import threading
+import time
+from datetime import datetime, date, timedelta
 
-DATABASE = 'pomo_hub.db'
+import archive
+import migrations
+from cache import create_cache
+from records import DailySummary, Note, Pomodoro, Task, TaskSummary, record_maker
+from query_log import connection_factory
 
-def get_db_connection():
-    """データベース接続を取得"""
-    conn = sqlite3.connect(DATABASE)
+# SQLiteのファイル（コンテナではボリュームに置くパスを指定する）
+DATABASE = os.getenv('SQLITE_DATABASE', 'pomo_hub.db')
+
+# 接続設定
+BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+STATEMENT_CACHE_SIZE = 256
+NOTES_IN_CHUNK_SIZE = 500
+EXPORT_FETCH_SIZE = 500
+IMPORT_TRANSACTION_SIZE = 50000
+
+# イベント（SSE配信用）の保持期間と、受信スレッドが新着を確認する間隔
+EVENT_RETENTION_SECONDS = 3600
+EVENT_POLL_SECONDS = float(os.getenv('EVENT_POLL_SECONDS', '0.5'))
+
+# スレッドごとに保持する接続
+_local = threading.local()
+
+# カテゴリ・テンプレート一覧のキャッシュ（resource_versionsのバージョンで無効化）
+_cache = create_cache()
+
+def _connect():
+    """新しい接続を作成してPRAGMAを設定"""
+    conn = sqlite3.connect(
+        DATABASE,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        # SQLITE_QUERY_LOG 設定時は文ごとの時間と遅い文の計画を記録する接続
+        factory=connection_factory(),
+        # アーカイブを読み取り専用（mode=ro のURI）でATTACHするため
+        uri=True
+    )
     conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+    return conn
+
+def get_db_connection():
+    """データベース接続を取得（スレッドごとに再利用）
+
+    接続は同一スレッド内で使い回すため、プリペアドステートメントも
+    sqlite3のステートメントキャッシュに残り続ける。
+    fork後の子プロセスやDATABASEの変更時は新しい接続を作り直す。
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.pid == os.getpid() and _local.database == DATABASE:
+        return conn
+    conn = _connect()
+    _local.conn = conn
+    _local.pid = os.getpid()
+    _local.database = DATABASE
+    _local.versions = None
+    _local.archive_attached = False
     return conn
 
+def _day_range(target_date):
+    """指定日の [0時, 翌日0時) を返す（インデックスが効く範囲条件用）"""
+    return _date_range(target_date, target_date)
+
+def _date_range(start_date, end_date):
+    """start_date〜end_date（両端含む）を [0時, 翌日0時) の範囲で返す"""
+    range_start = datetime.combine(start_date, datetime.min.time())
+    range_end = datetime.combine(end_date, datetime.min.time()) + timedelta(days=1)
+    return range_start, range_end
+
+def _iter_records(cursor, record_type):
+    """カーソルの結果をレコードで少しずつ読み出す"""
+    cursor.row_factory = None
+    make = record_maker(record_type)
+    while True:
+        rows = cursor.fetchmany(EXPORT_FETCH_SIZE)
+        if not rows:
+            return
+        yield from map(make, rows)
+
+def _fetch_records(cursor, record_type):
+    """カーソルの結果をレコード（namedtuple）の一覧で取得（sqlite3.Rowを経由しない）"""
+    cursor.row_factory = None
+    return list(map(record_maker(record_type), cursor.fetchall()))
+
+def _archive_sources(conn, boundary):
+    """アーカイブと合わせたFROM句（この接続で初めて使うときにアーカイブをATTACHする）"""
+    if not _local.archive_attached:
+        archive.attach(conn, archive.archive_path(DATABASE))
+        _local.archive_attached = True
+    return archive.union_sources(boundary)
+
+def _execute(conn, sql, params, range_start=None):
+    """sql の {pomodoros}・{tasks}・{notes} をFROM句に置き換えて実行したカーソルを返す
+
+    range_start（期間の始まり、Noneは期間の指定なし）がアーカイブの境界より前のときだけ
+    アーカイブと合わせて読み、最近の期間はアーカイブを開かずに本体のテーブルだけを読む。
+    実行後に読み直した境界（実行中の文と同じスナップショット）が使ったものと違えば、
+    その間に別のプロセスが月をアーカイブしたので、新しい境界で読み直す。
+    """
+    boundary = archive.get_boundary(conn)
+    while True:
+        if boundary is None or (range_start is not None and str(range_start) >= boundary):
+            sources = archive.HOT_SOURCES
+        else:
+            sources = _archive_sources(conn, boundary)
+        cursor = conn.execute(sql.format_map(sources), params)
+        current = archive.get_boundary(conn)
+        if current == boundary:
+            return cursor
+        cursor.close()
+        boundary = current
+
+def close_db_connection():
+    """現在のスレッドの接続を閉じる"""
+    conn = getattr(_local, 'conn', None)
+    _local.conn = None
+    if conn is not None and _local.pid == os.getpid():
+        conn.close()
+
 def init_db():
-    """データベースを初期化"""
+    """データベースのスキーマを最新にする（最新なら schema_version を1回読むだけ）"""
+    migrations.migrate(get_db_connection())
+
+def _bump_versions(conn, *resources):
+    """リソースのバージョンを進める（書き込みと同じトランザクション内で呼ぶ）"""
+    now = time.time()
+    conn.executemany(
+        '''INSERT INTO resource_versions (resource, version, updated_at) VALUES (?, 1, ?) 
+           ON CONFLICT(resource) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at''',
+        [(resource, now) for resource in resources]
+    )
+    # 自分の接続での書き込みは data_version に現れないのでキャッシュを捨てる
+    _local.versions = None
+
+def get_resource_version(resource):
+    """リソースのバージョンと更新時刻（epoch秒）を取得
+
+    PRAGMA data_version が前回から変わっていなければ他の接続は何も書き込んでいないので、
+    テーブルを読まずにスレッド内のキャッシュを返す。
+    """
     conn = get_db_connection()
-    
-    # categoriesテーブル（カテゴリ管理）
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS categories (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL UNIQUE,
-            color TEXT DEFAULT '#3b82f6',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # pomodorosテーブル（ポモドーロタイマー専用）
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS pomodoros (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            start_at TIMESTAMP NOT NULL,
-            end_at TIMESTAMP,
-            completed BOOLEAN DEFAULT FALSE
-        )
-    ''')
-    
-    # task_templatesテーブル（タスクテンプレート）
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS task_templates (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            category_id INTEGER,
-            name TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            is_active BOOLEAN DEFAULT TRUE,
-            FOREIGN KEY (category_id) REFERENCES categories (id)
-        )
-    ''')
-    
-    # tasksテーブル（実際の作業記録）
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS tasks (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            template_id INTEGER,
-            category_id INTEGER,
-            name TEXT NOT NULL,
-            start_at TIMESTAMP NOT NULL,
-            end_at TIMESTAMP,
-            status TEXT DEFAULT 'active',
-            FOREIGN KEY (template_id) REFERENCES task_templates (id),
-            FOREIGN KEY (category_id) REFERENCES categories (id)
-        )
-    ''')
-    
-    # notesテーブル（タスクに紐づくメモ）
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS notes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            task_id INTEGER NOT NULL,
-            body TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (task_id) REFERENCES tasks (id)
-        )
-    ''')
-    
-    # 既存のテーブルを削除（開発中のみ）
-    try:
-        conn.execute('DROP TABLE IF EXISTS sessions')
-    except:
-        pass
-    
-    conn.commit()
-    conn.close()
+    data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+    versions = getattr(_local, 'versions', None)
+    if versions is None or _local.data_version != data_version:
+        versions = {
+            row['resource']: (row['version'], row['updated_at'])
+            for row in conn.execute('SELECT resource, version, updated_at FROM resource_versions')
+        }
+        _local.versions = versions
+        _local.data_version = data_version
+    return versions.get(resource, (0, None))
 
 def add_pomodoro():
     """新しいポモドーロを開始"""
     conn = get_db_connection()
-    cursor = conn.execute(
-        'INSERT INTO pomodoros (start_at) VALUES (?)',
-        (datetime.now(),)
-    )
-    pomodoro_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return pomodoro_id
+    with conn:
+        cursor = conn.execute(
+            'INSERT INTO pomodoros (start_at) VALUES (?)',
+            (datetime.now(),)
+        )
+        _bump_versions(conn, 'today')
+    return cursor.lastrowid
 
 def add_category(name, color='#3b82f6'):
     """新しいカテゴリを追加"""
     conn = get_db_connection()
     try:
-        cursor = conn.execute(
-            'INSERT INTO categories (name, color) VALUES (?, ?)',
-            (name, color)
-        )
-        category_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return category_id
+        with conn:
+            cursor = conn.execute(
+                'INSERT INTO categories (name, color) VALUES (?, ?)',
+                (name, color)
+            )
+            _bump_versions(conn, 'categories', 'task_templates')
+        _cache.invalidate('categories', 'task_templates')
+        return cursor.lastrowid
     except sqlite3.IntegrityError:
         # 既に存在する場合は既存のIDを返す
         existing = conn.execute(
             'SELECT id FROM categories WHERE name = ?',
             (name,)
         ).fetchone()
-        conn.close()
         return existing[0] if existing else None
 
 def get_categories():
-    """全カテゴリを取得"""
+    """全カテゴリを取得（キャッシュ付き）"""
+    version, _ = get_resource_version('categories')
+    return _cache.get_or_load('categories', version, _load_categories)
+
+def _load_categories():
+    """全カテゴリをDBから取得"""
     conn = get_db_connection()
-    categories = conn.execute(
+    return conn.execute(
         'SELECT id, name, color FROM categories ORDER BY name'
     ).fetchall()
-    conn.close()
-    return categories
 
 def add_task_template(name, category_id=None):
     """新しいタスクテンプレートを追加"""
     conn = get_db_connection()
-    cursor = conn.execute(
-        'INSERT INTO task_templates (category_id, name) VALUES (?, ?)',
-        (category_id, name)
-    )
-    template_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return template_id
+    with conn:
+        cursor = conn.execute(
+            'INSERT INTO task_templates (category_id, name) VALUES (?, ?)',
+            (category_id, name)
+        )
+        _bump_versions(conn, 'task_templates')
+    _cache.invalidate('task_templates')
+    return cursor.lastrowid
 
 def get_task_templates():
-    """アクティブなタスクテンプレート一覧を取得"""
+    """アクティブなタスクテンプレート一覧を取得（キャッシュ付き）"""
+    version, _ = get_resource_version('task_templates')
+    return _cache.get_or_load('task_templates', version, _load_task_templates)
+
+def _load_task_templates():
+    """アクティブなタスクテンプレート一覧をDBから取得"""
     conn = get_db_connection()
-    templates = conn.execute(
+    return conn.execute(
         '''SELECT t.id, t.category_id, t.name, t.created_at,
                   c.name as category_name, c.color as category_color
            FROM task_templates t
@@ -145,157 +230,792 @@ def get_task_templates():
            WHERE t.is_active = TRUE
            ORDER BY t.created_at DESC'''
     ).fetchall()
-    conn.close()
-    return templates
 
 def deactivate_task_template(template_id):
     """タスクテンプレートを無効化"""
     conn = get_db_connection()
-    conn.execute(
-        'UPDATE task_templates SET is_active = FALSE WHERE id = ?',
-        (template_id,)
-    )
-    conn.commit()
-    conn.close()
+    with conn:
+        conn.execute(
+            'UPDATE task_templates SET is_active = FALSE WHERE id = ?',
+            (template_id,)
+        )
+        _bump_versions(conn, 'task_templates')
+    _cache.invalidate('task_templates')
 
 def add_task(task_name, category_id=None, template_id=None):
-    """新しいタスクを開始"""
-    conn = get_db_connection()
-    cursor = conn.execute(
-        'INSERT INTO tasks (template_id, category_id, name, start_at) VALUES (?, ?, ?, ?)',
-        (template_id, category_id, task_name, datetime.now())
-    )
-    task_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+    """新しいタスクを開始（進行中のタスクがあれば同じトランザクションで終了）"""
+    task_id, _ = switch_task(task_name, category_id, template_id)
     return task_id
 
-def update_pomodoro(pomodoro_id, end_time, completed=True):
-    """ポモドーロの終了時刻を更新"""
+def switch_task(task_name, category_id=None, template_id=None):
+    """進行中のタスクを終了して新しいタスクを開始（1トランザクション）
+
+    (新しいタスクのID, 終了したタスクのID または None) を返す。
+    """
     conn = get_db_connection()
+    now = datetime.now()
+    previous_id = None
+    with conn:
+        # 読み取りの時点で書き込みロックを取り、同時に切り替えても進行中が2件にならないようにする
+        conn.execute('BEGIN IMMEDIATE')
+        active = conn.execute('SELECT task_id FROM active_task WHERE slot = 1').fetchone()
+        if active is not None:
+            previous_id = active['task_id']
+            _finish_task(conn, previous_id, now)
+        cursor = conn.execute(
+            'INSERT INTO tasks (template_id, category_id, name, start_at) VALUES (?, ?, ?, ?)',
+            (template_id, category_id, task_name, now)
+        )
+        conn.execute(
+            '''INSERT INTO active_task (slot, task_id) VALUES (1, ?) 
+               ON CONFLICT(slot) DO UPDATE SET task_id = excluded.task_id''',
+            (cursor.lastrowid,)
+        )
+        _bump_versions(conn, 'today')
+    return cursor.lastrowid, previous_id
+
+def _parse_timestamp(value):
+    """DBに保存された時刻文字列をdatetimeに変換"""
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+def _apply_rollup(conn, day, category_id, completed=0, aborted=0, minutes=0.0):
+    """daily_rollupsに差分を加算"""
+    conn.execute(
+        '''INSERT INTO daily_rollups (day, category_id, completed_pomodoros, aborted_pomodoros, focused_minutes) 
+           VALUES (?, ?, ?, ?, ?) 
+           ON CONFLICT(day, category_id) DO UPDATE SET 
+               completed_pomodoros = completed_pomodoros + excluded.completed_pomodoros, 
+               aborted_pomodoros = aborted_pomodoros + excluded.aborted_pomodoros, 
+               focused_minutes = focused_minutes + excluded.focused_minutes''',
+        (day, category_id or 0, completed, aborted, minutes)
+    )
+
+def _apply_hourly_rollup(conn, day, hour, completed=0, aborted=0, minutes=0.0):
+    """hourly_rollupsに差分を加算"""
+    conn.execute(
+        '''INSERT INTO hourly_rollups (day, hour, completed_pomodoros, aborted_pomodoros, focused_minutes) 
+           VALUES (?, ?, ?, ?, ?) 
+           ON CONFLICT(day, hour) DO UPDATE SET 
+               completed_pomodoros = completed_pomodoros + excluded.completed_pomodoros, 
+               aborted_pomodoros = aborted_pomodoros + excluded.aborted_pomodoros, 
+               focused_minutes = focused_minutes + excluded.focused_minutes''',
+        (day, hour, completed, aborted, minutes)
+    )
+
+def _hour_pieces(start, end):
+    """[start, end) を1時間ごとに分割して (日, 時, 分数) の一覧を返す"""
+    pieces = []
+    while start < end:
+        boundary = start.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+        piece_end = min(end, boundary)
+        pieces.append((start.strftime('%Y-%m-%d'), start.hour, (piece_end - start).total_seconds() / 60))
+        start = piece_end
+    return pieces
+
+def _pomodoro_category(conn, start_at):
+    """ポモドーロ開始時点で進行中だったタスクのカテゴリを取得"""
+    task = conn.execute(
+        '''SELECT category_id FROM tasks 
+           WHERE start_at <= ? AND (end_at IS NULL OR end_at > ?) 
+           ORDER BY start_at DESC, id DESC 
+           LIMIT 1''',
+        (start_at, start_at)
+    ).fetchone()
+    return task['category_id'] if task else None
+
+def _rollup_pomodoro(conn, pomodoro, sign):
+    """ポモドーロ1件分の集計をdaily_rollupsに反映（sign=-1で取り消し）"""
+    if pomodoro['end_at'] is None:
+        return
+    completed = 1 if pomodoro['completed'] else 0
+    _apply_rollup(
+        conn,
+        str(pomodoro['start_at'])[:10],
+        _pomodoro_category(conn, pomodoro['start_at']),
+        completed=sign * completed,
+        aborted=sign * (1 - completed)
+    )
+    start_at = _parse_timestamp(pomodoro['start_at'])
+    _apply_hourly_rollup(
+        conn,
+        start_at.strftime('%Y-%m-%d'),
+        start_at.hour,
+        completed=sign * completed,
+        aborted=sign * (1 - completed)
+    )
+
+def _rollup_task(conn, task, sign):
+    """タスク1件分の集中時間をdaily_rollupsに反映（sign=-1で取り消し）"""
+    if task['end_at'] is None:
+        return
+    start_at = _parse_timestamp(task['start_at'])
+    end_at = _parse_timestamp(task['end_at'])
+    _apply_rollup(
+        conn,
+        str(task['start_at'])[:10],
+        task['category_id'],
+        minutes=sign * (end_at - start_at).total_seconds() / 60
+    )
+    for day, hour, minutes in _hour_pieces(start_at, end_at):
+        _apply_hourly_rollup(conn, day, hour, minutes=sign * minutes)
+
+def _update_pomodoro(conn, pomodoro_id, end_time, completed):
+    """ポモドーロの終了時刻と集計を更新（BEGIN IMMEDIATE のトランザクション内で呼ぶ）"""
+    before = conn.execute(
+        'SELECT start_at, end_at, completed FROM pomodoros WHERE id = ?',
+        (pomodoro_id,)
+    ).fetchone()
     conn.execute(
         'UPDATE pomodoros SET end_at = ?, completed = ? WHERE id = ?',
         (end_time, completed, pomodoro_id)
     )
-    conn.commit()
-    conn.close()
+    _bump_versions(conn, 'today')
+    if before is not None:
+        _rollup_pomodoro(conn, before, -1)
+        _rollup_pomodoro(conn, {'start_at': before['start_at'], 'end_at': end_time, 'completed': completed}, 1)
 
-def update_task(task_id, end_time):
-    """タスクの終了時刻を更新"""
+def update_pomodoro(pomodoro_id, end_time, completed=True):
+    """ポモドーロの終了時刻を更新（集計も同じトランザクションで更新）"""
     conn = get_db_connection()
+    with conn:
+        # 変更前の行を読む時点で書き込みロックを取り、同時に閉じても集計が二重に加算されないようにする
+        conn.execute('BEGIN IMMEDIATE')
+        _update_pomodoro(conn, pomodoro_id, end_time, completed)
+
+def _finish_task(conn, task_id, end_time):
+    """タスクを完了にし、集計と進行中タスクの行を更新（BEGIN IMMEDIATE のトランザクション内で呼ぶ）"""
+    before = conn.execute(
+        'SELECT category_id, start_at, end_at FROM tasks WHERE id = ?',
+        (task_id,)
+    ).fetchone()
     conn.execute(
         'UPDATE tasks SET end_at = ?, status = ? WHERE id = ?',
         (end_time, 'completed', task_id)
     )
-    conn.commit()
-    conn.close()
+    conn.execute('DELETE FROM active_task WHERE task_id = ?', (task_id,))
+    if before is not None:
+        _rollup_task(conn, before, -1)
+        _rollup_task(conn, {'category_id': before['category_id'], 'start_at': before['start_at'], 'end_at': end_time}, 1)
+
+def update_task(task_id, end_time):
+    """タスクの終了時刻を更新（集計も同じトランザクションで更新）"""
+    conn = get_db_connection()
+    with conn:
+        conn.execute('BEGIN IMMEDIATE')
+        _finish_task(conn, task_id, end_time)
+        _bump_versions(conn, 'today')
 
 def add_note(task_id, note_text):
     """タスクにメモを追加"""
     conn = get_db_connection()
-    cursor = conn.execute(
-        'INSERT INTO notes (task_id, body) VALUES (?, ?)',
-        (task_id, note_text)
+    with conn:
+        cursor = conn.execute(
+            'INSERT INTO notes (task_id, body) VALUES (?, ?)',
+            (task_id, note_text)
+        )
+        _bump_versions(conn, 'today')
+    return cursor.lastrowid
+
+def _get_day_pomodoros(conn, target_date):
+    """指定日のポモドーロを開始時刻の新しい順に取得"""
+    day_range = _day_range(target_date)
+    return _fetch_records(_execute(
+        conn,
+        '''SELECT id, start_at, end_at, completed 
+           FROM {pomodoros} p 
+           WHERE start_at >= ? AND start_at < ? 
+           ORDER BY start_at DESC''',
+        day_range, day_range[0]
+    ), Pomodoro)
+
+def _get_day_tasks(conn, target_date):
+    """指定日のタスクを開始時刻の新しい順に取得"""
+    day_range = _day_range(target_date)
+    return _fetch_records(_execute(
+        conn,
+        '''SELECT id, category_id, name, start_at, end_at, status 
+           FROM {tasks} t 
+           WHERE start_at >= ? AND start_at < ? 
+           ORDER BY start_at DESC''',
+        day_range, day_range[0]
+    ), Task)
+
+def get_daily_summary(target_date):
+    """指定日のポモドーロとタスク（メモ付き）を開始時刻の新しい順に取得"""
+    conn = get_db_connection()
+    pomodoros = _get_day_pomodoros(conn, target_date)
+    tasks = _get_day_tasks(conn, target_date)
+    # 全タスクのメモを一括取得してメモリ上で結合（メモはタスクと一緒にアーカイブされる）
+    notes_by_task = _get_notes_for_tasks(conn, [task.id for task in tasks], _day_range(target_date)[0])
+    return DailySummary(
+        str(target_date),
+        pomodoros,
+        [TaskSummary(*task, notes_by_task[task.id]) for task in tasks]
     )
-    note_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return note_id
 
 def get_today_pomodoros():
     """今日のポモドーロ一覧を取得"""
-    conn = get_db_connection()
-    today = date.today()
-    pomodoros = conn.execute(
-        '''SELECT id, start_at, end_at, completed 
-           FROM pomodoros 
-           WHERE date(start_at) = ? 
-           ORDER BY start_at DESC''',
-        (today,)
-    ).fetchall()
-    conn.close()
-    return pomodoros
+    return _get_day_pomodoros(get_db_connection(), date.today())
 
 def get_today_tasks():
     """今日のタスク一覧を取得"""
-    conn = get_db_connection()
-    today = date.today()
-    tasks = conn.execute(
-        '''SELECT t.id, t.category_id, t.name, t.start_at, t.end_at, t.status,
-                  c.name as category_name, c.color as category_color
-           FROM tasks t
-           LEFT JOIN categories c ON t.category_id = c.id
-           WHERE date(t.start_at) = ? 
-           ORDER BY t.start_at DESC''',
-        (today,)
-    ).fetchall()
-    conn.close()
-    return tasks
+    return _get_day_tasks(get_db_connection(), date.today())
 
 def get_active_task():
-    """現在進行中のタスクを取得"""
+    """現在進行中のタスクを取得（active_taskの主キー参照）"""
     conn = get_db_connection()
-    task = conn.execute(
+    return conn.execute(
         '''SELECT t.id, t.category_id, t.name, t.start_at,
                   c.name as category_name, c.color as category_color
-           FROM tasks t
+           FROM active_task a
+           JOIN tasks t ON t.id = a.task_id
            LEFT JOIN categories c ON t.category_id = c.id
-           WHERE t.status = 'active' 
-           ORDER BY t.start_at DESC 
-           LIMIT 1'''
+           WHERE a.slot = 1'''
     ).fetchone()
-    conn.close()
-    return task
 
 def get_task_notes(task_id):
     """指定タスクのメモ一覧を取得"""
     conn = get_db_connection()
-    notes = conn.execute(
-        '''SELECT id, body, created_at 
-           FROM notes 
-           WHERE task_id = ? 
-           ORDER BY created_at ASC''',
+    return _fetch_records(_execute(
+        conn,
+        '''SELECT n.id, n.task_id, n.body, n.created_at, t.name 
+           FROM {notes} n 
+           JOIN {tasks} t ON n.task_id = t.id 
+           WHERE n.task_id = ? 
+           ORDER BY n.created_at ASC''',
         (task_id,)
-    ).fetchall()
-    conn.close()
-    return [dict(note) for note in notes]
+    ), Note)
+
+def get_notes_for_tasks(task_ids):
+    """複数タスクのメモをまとめて取得（task_id -> メモ一覧）"""
+    return _get_notes_for_tasks(get_db_connection(), task_ids)
+
+def _get_notes_for_tasks(conn, task_ids, range_start=None):
+    """get_notes_for_tasks の本体（range_start はタスクの開始時刻の下限。分かればアーカイブを読まずに済む）"""
+    notes_by_task = {task_id: [] for task_id in task_ids}
+    if not notes_by_task:
+        return notes_by_task
+    ids = list(notes_by_task)
+    # SQLiteのバインド変数上限を超えないよう分割（通常は1クエリ）
+    for i in range(0, len(ids), NOTES_IN_CHUNK_SIZE):
+        chunk = ids[i:i + NOTES_IN_CHUNK_SIZE]
+        placeholders = ', '.join('?' * len(chunk))
+        notes = _fetch_records(_execute(
+            conn,
+            f'''SELECT n.id, n.task_id, n.body, n.created_at, t.name 
+               FROM {{notes}} n 
+               JOIN {{tasks}} t ON n.task_id = t.id 
+               WHERE n.task_id IN ({placeholders}) 
+               ORDER BY n.task_id, n.created_at ASC''',
+            chunk, range_start
+        ), Note)
+        for note in notes:
+            notes_by_task[note.task_id].append(note)
+    return notes_by_task
+
+def add_timer(pomodoro_id, fire_at):
+    """ポモドーロ終了タイマーを登録"""
+    conn = get_db_connection()
+    with conn:
+        cursor = conn.execute(
+            'INSERT INTO timers (pomodoro_id, fire_at) VALUES (?, ?)',
+            (pomodoro_id, fire_at)
+        )
+    return cursor.lastrowid
+
+def cancel_timer(pomodoro_id):
+    """未発火のタイマーをキャンセル（キャンセルできたらTrue）"""
+    conn = get_db_connection()
+    with conn:
+        cursor = conn.execute(
+            """UPDATE timers SET status = 'cancelled' 
+               WHERE pomodoro_id = ? AND status = 'pending'""",
+            (pomodoro_id,)
+        )
+    return cursor.rowcount > 0
+
+def claim_due_timers(now, limit=100):
+    """期限の来たタイマーを発火済みにし、そのポモドーロを now で完了にして返す
+
+    UPDATE ... RETURNING の1文で状態を切り替えるため、
+    複数プロセスが同時に呼んでも各タイマーは1回だけ返される。
+    ポモドーロの完了も同じトランザクションで行うので、途中で失敗・停止しても
+    タイマーは発火待ちに戻り、次の呼び出しでやり直される。
+    """
+    conn = get_db_connection()
+    with conn:
+        conn.execute('BEGIN IMMEDIATE')
+        timers = conn.execute(
+            '''UPDATE timers SET status = 'fired', fired_at = ? 
+               WHERE id IN (
+                   SELECT id FROM timers 
+                   WHERE status = 'pending' AND fire_at <= ? 
+                   ORDER BY fire_at 
+                   LIMIT ?
+               ) 
+               RETURNING id, pomodoro_id, fire_at''',
+            (now, now, limit)
+        ).fetchall()
+        for timer in timers:
+            pomodoro = conn.execute(
+                'SELECT end_at FROM pomodoros WHERE id = ?', (timer['pomodoro_id'],)
+            ).fetchone()
+            if pomodoro is not None and pomodoro['end_at'] is None:
+                _update_pomodoro(conn, timer['pomodoro_id'], now, True)
+    return timers
+
+def count_pending_timers():
+    """発火待ちのタイマー数"""
+    conn = get_db_connection()
+    return conn.execute("SELECT COUNT(*) FROM timers WHERE status = 'pending'").fetchone()[0]
+
+def ping():
+    """データベースを読めるか確認（レディネスプローブ用）"""
+    conn = get_db_connection()
+    conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return True
+
+def acquire_lease(name, owner, ttl_seconds):
+    """リースを取得・更新（取得できたらTrue）"""
+    conn = get_db_connection()
+    now = time.time()
+    with conn:
+        conn.execute(
+            '''INSERT INTO scheduler_leases (name, owner, expires_at) VALUES (?, ?, ?) 
+               ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at 
+               WHERE scheduler_leases.owner = excluded.owner OR scheduler_leases.expires_at < ?''',
+            (name, owner, now + ttl_seconds, now)
+        )
+        lease = conn.execute(
+            'SELECT owner FROM scheduler_leases WHERE name = ?',
+            (name,)
+        ).fetchone()
+    return lease is not None and lease['owner'] == owner
 
 def get_pomodoros_by_date(target_date):
     """指定日のポモドーロ一覧を取得"""
+    return list(iter_pomodoros(target_date, target_date))
+
+def get_tasks_by_date(target_date):
+    """指定日のタスク一覧を取得"""
+    return list(iter_tasks(target_date, target_date))
+
+def get_all_notes_by_date(target_date):
+    """指定日の全メモを取得"""
+    return list(iter_notes(target_date, target_date))
+
+def iter_pomodoros(start_date, end_date):
+    """期間内のポモドーロを開始時刻順に逐次取得"""
     conn = get_db_connection()
-    pomodoros = conn.execute(
+    date_range = _date_range(start_date, end_date)
+    cursor = _execute(
+        conn,
         '''SELECT id, start_at, end_at, completed 
-           FROM pomodoros 
-           WHERE date(start_at) = ? 
+           FROM {pomodoros} p 
+           WHERE start_at >= ? AND start_at < ? 
            ORDER BY start_at ASC''',
-        (target_date,)
-    ).fetchall()
-    conn.close()
-    return pomodoros
+        date_range, date_range[0]
+    )
+    return _iter_records(cursor, Pomodoro)
 
-def get_tasks_by_date(target_date):
-    """指定日のタスク一覧を取得"""
+def iter_tasks(start_date, end_date):
+    """期間内のタスクを開始時刻順に逐次取得"""
     conn = get_db_connection()
-    tasks = conn.execute(
-        '''SELECT id, name, start_at, end_at, status 
-           FROM tasks 
-           WHERE date(start_at) = ? 
+    date_range = _date_range(start_date, end_date)
+    cursor = _execute(
+        conn,
+        '''SELECT id, category_id, name, start_at, end_at, status 
+           FROM {tasks} t 
+           WHERE start_at >= ? AND start_at < ? 
            ORDER BY start_at ASC''',
-        (target_date,)
-    ).fetchall()
-    conn.close()
-    return tasks
+        date_range, date_range[0]
+    )
+    return _iter_records(cursor, Task)
 
-def get_all_notes_by_date(target_date):
-    """指定日の全メモを取得"""
+def iter_notes(start_date, end_date):
+    """期間内に開始したタスクのメモを作成順に逐次取得"""
     conn = get_db_connection()
-    notes = conn.execute(
+    date_range = _date_range(start_date, end_date)
+    cursor = _execute(
+        conn,
         '''SELECT n.id, n.task_id, n.body, n.created_at, t.name
-           FROM notes n
-           JOIN tasks t ON n.task_id = t.id
-           WHERE date(t.start_at) = ?
+           FROM {notes} n
+           JOIN {tasks} t ON n.task_id = t.id
+           WHERE t.start_at >= ? AND t.start_at < ?
            ORDER BY n.created_at ASC''',
-        (target_date,)
+        date_range, date_range[0]
+    )
+    return _iter_records(cursor, Note)
+
+def _history_page(table, record_type, conditions, params, after, limit):
+    """(start_at, id) の降順で、after より後の行を最大limit件レコードで取得
+
+    アーカイブの行はすべて境界より前なので、本体のテーブルだけで1ページが埋まり
+    最後の行が境界以後ならアーカイブは読まない。それ以外は両方を合わせて読み直す。
+    """
+    if after is not None:
+        conditions.append('(start_at, id) < (?, ?)')
+        params.extend(after)
+    where = 'WHERE ' + ' AND '.join(conditions) if conditions else ''
+    conn = get_db_connection()
+
+    def fetch(sources):
+        return _fetch_records(conn.execute(
+            f"SELECT {', '.join(record_type._fields)} FROM {sources[table]} h {where} ORDER BY start_at DESC, id DESC LIMIT ?",
+            (*params, limit)
+        ), record_type)
+
+    boundary = archive.get_boundary(conn)
+    while True:
+        page = None
+        if boundary is None or after is None or after[0] >= boundary:
+            page = fetch(archive.HOT_SOURCES)
+            if boundary is not None and (len(page) < limit or page[-1].start_at < boundary):
+                page = None
+        if page is None:
+            page = fetch(_archive_sources(conn, boundary))
+        # 読んでいる間に別のプロセスが月をアーカイブしていたら、新しい境界で読み直す
+        current = archive.get_boundary(conn)
+        if current == boundary:
+            return page
+        boundary = current
+
+def get_task_history(limit, after=None, category_id=None, status=None):
+    """タスク履歴を新しい順に取得（after には前ページ最後の (start_at, id) を渡す）"""
+    conditions, params = [], []
+    if category_id is not None:
+        conditions.append('category_id = ?')
+        params.append(category_id)
+    if status is not None:
+        conditions.append('status = ?')
+        params.append(status)
+    return _history_page('tasks', Task, conditions, params, after, limit)
+
+def get_pomodoro_history(limit, after=None, completed=None):
+    """ポモドーロ履歴を新しい順に取得（after には前ページ最後の (start_at, id) を渡す）"""
+    conditions, params = [], []
+    if completed is not None:
+        conditions.append('completed = ?')
+        params.append(bool(completed))
+    return _history_page('pomodoros', Pomodoro, conditions, params, after, limit)
+
+def import_records(records):
+    """(種別, 項目) のレコード列を一括登録し、種別ごとの件数を返す
+
+    IMPORT_TRANSACTION_SIZE件ごとに1トランザクションとし、種別ごとにexecutemanyで書き込む。
+    タスクにはこちらでIDを振り、同じインポート内のメモのtask_idを付け替える
+    （インポートしたタスクにないtask_idのメモは登録しない）。
+    集計は最後に取り込んだ期間だけ作り直す。
+    """
+    conn = get_db_connection()
+    counts = {'pomodoro': 0, 'task': 0, 'note': 0}
+    task_ids = {}
+    first_day = last_day = None
+    records = iter(records)
+    
+    while True:
+        chunk = list(islice(records, IMPORT_TRANSACTION_SIZE))
+        if not chunk:
+            break
+        pomodoros, tasks, notes = [], [], []
+        with conn:
+            # IDの採番とINSERTの間に他の書き込みが入らないよう、先に書き込みロックを取る
+            conn.execute('BEGIN IMMEDIATE')
+            # アーカイブへ移したタスクのIDも使わないよう、AUTOINCREMENTの最大値から振る
+            next_id = conn.execute(
+                "SELECT COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'tasks'), 0) + 1"
+            ).fetchone()[0]
+            for record_type, fields in chunk:
+                if record_type == 'pomodoro':
+                    pomodoros.append((fields['start_at'], fields['end_at'], fields['completed']))
+                elif record_type == 'task':
+                    if fields.get('id') is not None:
+                        task_ids[str(fields['id'])] = next_id
+                    tasks.append((next_id, fields.get('template_id'), fields.get('category_id'), fields['name'],
+                                  fields['start_at'], fields['end_at'], 'completed'))
+                    next_id += 1
+                else:
+                    task_id = task_ids.get(str(fields['task_id']))
+                    if task_id is None:
+                        continue
+                    created_at = fields.get('created_at')
+                    notes.append((task_id, fields['body'],
+                                  created_at.strftime('%Y-%m-%d %H:%M:%S') if created_at else None))
+                if record_type != 'note':
+                    day = fields['start_at'].date()
+                    first_day = day if first_day is None else min(first_day, day)
+                    last_day = day if last_day is None else max(last_day, day)
+            
+            conn.executemany(
+                'INSERT INTO pomodoros (start_at, end_at, completed) VALUES (?, ?, ?)',
+                pomodoros
+            )
+            conn.executemany(
+                '''INSERT INTO tasks (id, template_id, category_id, name, start_at, end_at, status) 
+                   VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                tasks
+            )
+            conn.executemany(
+                'INSERT INTO notes (task_id, body, created_at) VALUES (?, ?, COALESCE(?, CURRENT_TIMESTAMP))',
+                notes
+            )
+            _bump_versions(conn, 'today')
+        counts['pomodoro'] += len(pomodoros)
+        counts['task'] += len(tasks)
+        counts['note'] += len(notes)
+    
+    if first_day is not None:
+        rebuild_daily_rollups(first_day, last_day)
+    return counts
+
+def add_event(event_type, payload):
+    """イベントを記録（payloadはJSON文字列）"""
+    conn = get_db_connection()
+    now = time.time()
+    with conn:
+        cursor = conn.execute(
+            'INSERT INTO events (type, payload, created_at) VALUES (?, ?, ?)',
+            (event_type, payload, now)
+        )
+        # 100件ごとに保持期間を過ぎたものを削除
+        if cursor.lastrowid % 100 == 0:
+            conn.execute('DELETE FROM events WHERE created_at < ?', (now - EVENT_RETENTION_SECONDS,))
+    return cursor.lastrowid
+
+def watch_events(callback, stop):
+    """stopがセットされるまで、新しいイベントを (id, 種別, payload) でcallbackに渡し続ける
+
+    他の接続のコミットで変わる PRAGMA data_version を見て、変化したときだけ events を読む。
+    """
+    conn = get_db_connection()
+    last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM events').fetchone()[0]
+    data_version = None
+    while not stop.wait(EVENT_POLL_SECONDS):
+        current = conn.execute('PRAGMA data_version').fetchone()[0]
+        if current == data_version:
+            continue
+        data_version = current
+        rows = conn.execute(
+            'SELECT id, type, payload FROM events WHERE id > ? ORDER BY id',
+            (last_id,)
+        ).fetchall()
+        for row in rows:
+            last_id = row['id']
+            callback(row['id'], row['type'], row['payload'])
+
+def get_daily_rollups(start_date, end_date):
+    """期間内（両端含む）の日・カテゴリ別集計を取得"""
+    conn = get_db_connection()
+    return conn.execute(
+        '''SELECT r.day, r.category_id, r.completed_pomodoros, r.aborted_pomodoros, r.focused_minutes,
+                  c.name as category_name, c.color as category_color
+           FROM daily_rollups r
+           LEFT JOIN categories c ON r.category_id = c.id
+           WHERE r.day >= ? AND r.day <= ?
+           ORDER BY r.day ASC, r.category_id ASC''',
+        (str(start_date), str(end_date))
     ).fetchall()
-    conn.close()
-    return notes
\ No newline at end of file
+
+def _covering_task_category(sources):
+    """ポモドーロ p の開始時点で進行中だったタスクのカテゴリを求めるSQL式（なければ0）
+
+    開始時刻が同じタスクはIDの大きい方にする。アーカイブと合わせて読むときは、
+    本体・アーカイブ（境界より前のポモドーロだけ）からそれぞれ1件ずつ引いてから新しい方を選ぶ。
+    """
+    lookups = ' UNION ALL '.join(
+        f'''SELECT * FROM (SELECT t.category_id, t.start_at, t.id FROM {part} t
+                             WHERE t.start_at <= p.start_at AND (t.end_at IS NULL OR t.end_at > p.start_at) {condition}
+                             ORDER BY t.start_at DESC, t.id DESC LIMIT 1)'''
+        for part, condition in sources['task_parts']
+    )
+    return f'COALESCE((SELECT category_id FROM ({lookups}) ORDER BY start_at DESC, id DESC LIMIT 1), 0)'
+
+def rebuild_daily_rollups(start_date=None, end_date=None):
+    """pomodoros・tasksから日別・時間帯別の集計を作り直す（期間省略時は全期間、アーカイブも含む）"""
+    conn = get_db_connection()
+    while True:
+        # 保守用の処理なので、アーカイブがあれば期間によらず合わせて読む（ATTACHはトランザクションの前に済ませる）
+        boundary = archive.get_boundary(conn)
+        sources = archive.HOT_SOURCES if boundary is None else _archive_sources(conn, boundary)
+        count = _rebuild_daily_rollups(conn, boundary, sources, start_date, end_date)
+        if count is not None:
+            return count
+
+def _rebuild_daily_rollups(conn, boundary, sources, start_date, end_date):
+    """rebuild_daily_rollups の本体（書き込みロックを取るまでに境界が進んでいたら何もせずNone）"""
+    if start_date is None or end_date is None:
+        bounds = conn.execute(
+            f'''SELECT MIN(day) AS first_day, MAX(day) AS last_day FROM (
+                   SELECT substr(start_at, 1, 10) AS day FROM {sources['pomodoros']} p 
+                   UNION ALL 
+                   SELECT substr(start_at, 1, 10) AS day FROM {sources['tasks']} t
+               )'''
+        ).fetchone()
+        if bounds['first_day'] is None:
+            return 0
+        start_date = start_date or date.fromisoformat(bounds['first_day'])
+        end_date = end_date or date.fromisoformat(bounds['last_day'])
+    range_start, range_end = _date_range(start_date, end_date)
+    
+    with conn:
+        # 書き込みロックの間は別のプロセスが月をアーカイブできないので、境界はここで確かめれば足りる
+        conn.execute('BEGIN IMMEDIATE')
+        if archive.get_boundary(conn) != boundary:
+            return None
+        conn.execute(
+            'DELETE FROM daily_rollups WHERE day >= ? AND day <= ?',
+            (str(start_date), str(end_date))
+        )
+        conn.execute(
+            f'''INSERT INTO daily_rollups (day, category_id, focused_minutes)
+               SELECT substr(start_at, 1, 10), COALESCE(category_id, 0),
+                      SUM((julianday(end_at) - julianday(start_at)) * 1440)
+               FROM {sources['tasks']} t
+               WHERE start_at >= ? AND start_at < ? AND end_at IS NOT NULL
+               GROUP BY 1, 2''',
+            (range_start, range_end)
+        )
+        conn.execute(
+            f'''INSERT INTO daily_rollups (day, category_id, completed_pomodoros, aborted_pomodoros)
+               SELECT day, category_id, SUM(completed), SUM(1 - completed) FROM (
+                   SELECT substr(p.start_at, 1, 10) AS day,
+                          CASE WHEN p.completed THEN 1 ELSE 0 END AS completed,
+                          {_covering_task_category(sources)} AS category_id
+                   FROM {sources['pomodoros']} p
+                   WHERE p.start_at >= ? AND p.start_at < ? AND p.end_at IS NOT NULL
+               )
+               GROUP BY day, category_id
+               ON CONFLICT(day, category_id) DO UPDATE SET
+                   completed_pomodoros = excluded.completed_pomodoros,
+                   aborted_pomodoros = excluded.aborted_pomodoros''',
+            (range_start, range_end)
+        )
+        conn.execute(
+            'DELETE FROM hourly_rollups WHERE day >= ? AND day <= ?',
+            (str(start_date), str(end_date))
+        )
+        # タスクを1時間ごとの区間に分割して集計
+        conn.execute(
+            f'''INSERT INTO hourly_rollups (day, hour, focused_minutes)
+               WITH RECURSIVE pieces(piece_start, piece_end, task_end) AS (
+                   SELECT start_at, MIN(end_at, strftime('%Y-%m-%d %H:00:00', start_at, '+1 hour')), end_at
+                   FROM {sources['tasks']} t
+                   WHERE start_at >= ? AND start_at < ? AND end_at IS NOT NULL AND end_at > start_at
+                   UNION ALL
+                   SELECT piece_end, MIN(task_end, strftime('%Y-%m-%d %H:00:00', piece_end, '+1 hour')), task_end
+                   FROM pieces
+                   WHERE piece_end < task_end
+               )
+               SELECT substr(piece_start, 1, 10), CAST(substr(piece_start, 12, 2) AS INTEGER),
+                      SUM((julianday(piece_end) - julianday(piece_start)) * 1440)
+               FROM pieces
+               GROUP BY 1, 2
+               ON CONFLICT(day, hour) DO UPDATE SET
+                   focused_minutes = focused_minutes + excluded.focused_minutes''',
+            (range_start, range_end)
+        )
+        conn.execute(
+            f'''INSERT INTO hourly_rollups (day, hour, completed_pomodoros, aborted_pomodoros)
+               SELECT substr(start_at, 1, 10), CAST(substr(start_at, 12, 2) AS INTEGER),
+                      SUM(CASE WHEN completed THEN 1 ELSE 0 END), SUM(CASE WHEN completed THEN 0 ELSE 1 END)
+               FROM {sources['pomodoros']} p
+               WHERE start_at >= ? AND start_at < ? AND end_at IS NOT NULL
+               GROUP BY 1, 2
+               ON CONFLICT(day, hour) DO UPDATE SET
+                   completed_pomodoros = excluded.completed_pomodoros,
+                   aborted_pomodoros = excluded.aborted_pomodoros''',
+            (range_start, range_end)
+        )
+        count = conn.execute(
+            'SELECT COUNT(*) FROM daily_rollups WHERE day >= ? AND day <= ?',
+            (str(start_date), str(end_date))
+        ).fetchone()[0]
+    return count
+
+# 集計単位ごとのキー（daily_rollupsの列に対するSQL式）
+STATS_GROUP_KEYS = {
+    'day': 'r.day',
+    'week': "date(r.day, 'weekday 0', '-6 days')",
+    # 集計テーブルでは未分類を0で持つが、返すときはタスクと同じNoneにする
+    'category': 'NULLIF(r.category_id, 0)',
+}
+
+def get_stats(start_date, end_date, group_by='day'):
+    """期間内の集中時間・完了率・ヒートマップ・連続日数を集計
+
+    生のポモドーロ・タスクではなく日別・時間帯別の集計テーブルだけを読むため、
+    期間が数年に及んでも読む行数は日数に比例する。
+    """
+    conn = get_db_connection()
+    day_range = (str(start_date), str(end_date))
+    
+    totals = conn.execute(
+        '''SELECT COALESCE(SUM(focused_minutes), 0) AS focused_minutes,
+                  COALESCE(SUM(completed_pomodoros), 0) AS completed_pomodoros,
+                  COALESCE(SUM(aborted_pomodoros), 0) AS aborted_pomodoros
+           FROM daily_rollups
+           WHERE day >= ? AND day <= ?''',
+        day_range
+    ).fetchone()
+    
+    if group_by == 'hour':
+        groups = conn.execute(
+            '''SELECT hour AS key, SUM(focused_minutes) AS focused_minutes,
+                      SUM(completed_pomodoros) AS completed_pomodoros,
+                      SUM(aborted_pomodoros) AS aborted_pomodoros
+               FROM hourly_rollups
+               WHERE day >= ? AND day <= ?
+               GROUP BY hour
+               ORDER BY hour''',
+            day_range
+        ).fetchall()
+    else:
+        key = STATS_GROUP_KEYS[group_by]
+        category_columns = ''
+        if group_by == 'category':
+            category_columns = ', MAX(c.name) AS category_name, MAX(c.color) AS category_color'
+        groups = conn.execute(
+            f'''SELECT {key} AS key, SUM(r.focused_minutes) AS focused_minutes,
+                       SUM(r.completed_pomodoros) AS completed_pomodoros,
+                       SUM(r.aborted_pomodoros) AS aborted_pomodoros{category_columns}
+                FROM daily_rollups r
+                LEFT JOIN categories c ON r.category_id = c.id
+                WHERE r.day >= ? AND r.day <= ?
+                GROUP BY 1
+                ORDER BY 1''',
+            day_range
+        ).fetchall()
+    
+    # 曜日（0=日曜）×時間帯の集中時間
+    heatmap = conn.execute(
+        '''SELECT CAST(strftime('%w', day) AS INTEGER) AS weekday, hour,
+                  SUM(focused_minutes) AS focused_minutes
+           FROM hourly_rollups
+           WHERE day >= ? AND day <= ?
+           GROUP BY 1, 2''',
+        day_range
+    ).fetchall()
+    
+    # 活動のあった日の連続区間（日付 - 行番号 が同じ日は連続している）
+    streaks = conn.execute(
+        '''SELECT MIN(day) AS first_day, MAX(day) AS last_day, COUNT(*) AS days
+           FROM (
+               SELECT day, julianday(day) - ROW_NUMBER() OVER (ORDER BY day) AS island
+               FROM daily_rollups
+               WHERE day >= ? AND day <= ?
+               GROUP BY day
+               HAVING SUM(completed_pomodoros) > 0 OR SUM(focused_minutes) > 0
+           )
+           GROUP BY island
+           ORDER BY last_day''',
+        day_range
+    ).fetchall()
+    
+    return {
+        'totals': dict(totals),
+        'groups': [dict(group) for group in groups],
+        'heatmap': [tuple(cell) for cell in heatmap],
+        'streaks': [dict(streak) for streak in streaks],
+    }
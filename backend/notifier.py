@@ -0,0 +1,188 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from typing import Optional
+
+# Discordのメッセージ本文の上限
+DISCORD_CONTENT_LIMIT = 2000
+
+class DiscordNotifier:
+    """Discord Webhookへの通知をバックグラウンドで送信するディスパッチャー
+
+    - 有界キューに積むだけなので、リクエスト処理はWebhookの応答を待たない
+    - keep-aliveのセッションを使い回す
+    - batch_window秒以内に積まれたメッセージは1通にまとめて送る
+    - 429はretry_afterに従い、5xxや通信エラーは指数バックオフで再送する
+    - プロセス終了時に残りを送信してから止まる
+    - on_sendを渡すと、1通ごとに (所要秒, 成功したか) で呼ぶ
+    """
+
+    def __init__(self, webhook_url: str, username: str = 'PomoHub', max_queue: int = 1000,
+                 batch_window: float = 1.0, timeout: float = 10.0, max_retries: int = 5,
+                 backoff_base: float = 0.5, backoff_max: float = 30.0, on_send=None):
+        self.webhook_url = webhook_url
+        self.username = username
+        self.max_queue = max_queue
+        self.batch_window = batch_window
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.on_send = on_send
+        self.dropped = 0
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+
+    def notify(self, message: str) -> bool:
+        """メッセージをキューに追加（キューが満杯なら捨ててFalse）"""
+        if not self.webhook_url:
+            return False
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(message)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            print(f"Discord通知キューが満杯のため破棄しました: {message}")
+            return False
+
+    def backlog(self) -> int:
+        """未送信のメッセージ数"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def is_alive(self) -> bool:
+        """送信スレッドが動いているか"""
+        return self._thread is not None and self._thread.is_alive() and self._pid == os.getpid()
+
+    def thread_state(self) -> str:
+        """送信スレッドの状態（このプロセスで未起動: idle / 動作中: running / 止まっている: dead）"""
+        if self._thread is None or self._pid != os.getpid():
+            return 'idle'
+        return 'running' if self._thread.is_alive() else 'dead'
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """キューが空になるまで待つ（タイムアウトしたらFalse）"""
+        if self._queue is None:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def shutdown(self, timeout: float = 5.0):
+        """残りを送信してから送信スレッドを止める"""
+        if not self.is_alive():
+            return
+        self.flush(timeout)
+        self._stopping.set()
+        self._thread.join(timeout)
+
+    def _ensure_started(self):
+        """送信スレッドを起動（fork後の子プロセスでは作り直す）"""
+        if self.is_alive():
+            return
+        with self._lock:
+            if self.is_alive():
+                return
+            # requestsは最初の通知まで読み込まない（起動時間を短くするため）
+            import requests
+            from requests.adapters import HTTPAdapter
+            self._queue = queue.Queue(maxsize=self.max_queue)
+            self._session = requests.Session()
+            self._session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+            self._session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+            self._stopping.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='discord-notifier', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        """キューからメッセージを取り出して送信するループ"""
+        carry = None
+        while not (self._stopping.is_set() and self._queue.empty() and carry is None):
+            if carry is None:
+                try:
+                    first = self._queue.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+            else:
+                first, carry = carry, None
+            batch = [first]
+            length = len(first)
+            deadline = time.monotonic() + self.batch_window
+            # batch_window内に届いたものを上限文字数までまとめる
+            while not self._stopping.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    message = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if length + 1 + len(message) > DISCORD_CONTENT_LIMIT:
+                    carry = message  # 次の1通に回す
+                    break
+                batch.append(message)
+                length += 1 + len(message)
+            started = time.monotonic()
+            sent = False
+            try:
+                sent = self._send('\n'.join(batch)[:DISCORD_CONTENT_LIMIT])
+            finally:
+                if self.on_send is not None:
+                    self.on_send(time.monotonic() - started, sent)
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _send(self, content: str) -> bool:
+        """Webhookに送信（レート制限・一時的なエラーは再送）"""
+        import requests
+        payload = {'content': content, 'username': self.username}
+        for attempt in range(self.max_retries + 1):
+            delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+            try:
+                response = self._session.post(self.webhook_url, json=payload, timeout=self.timeout)
+            except requests.RequestException as e:
+                print(f"Discord通知エラー: {e}")
+            else:
+                if response.status_code < 300:
+                    return True
+                if response.status_code == 429:
+                    delay = self._retry_after(response, delay)
+                elif response.status_code < 500:
+                    print(f"Discord通知エラー: HTTP {response.status_code} {response.text[:200]}")
+                    return False
+            if attempt < self.max_retries:
+                time.sleep(delay)
+        print("Discord通知エラー: 再送回数の上限に達しました")
+        return False
+
+    @staticmethod
+    def _retry_after(response, default: float) -> float:
+        """429応答から待ち時間（秒）を取得"""
+        try:
+            return float(response.json()['retry_after'])
+        except (ValueError, KeyError, TypeError):
+            pass
+        try:
+            return float(response.headers['Retry-After'])
+        except (KeyError, ValueError):
+            return default
+
+def create_notifier(webhook_url: str, on_send=None) -> DiscordNotifier:
+    """環境変数の設定でディスパッチャーを作成し、終了時のフラッシュを登録"""
+    notifier = DiscordNotifier(
+        webhook_url,
+        max_queue=int(os.getenv('DISCORD_QUEUE_SIZE', '1000')),
+        batch_window=float(os.getenv('DISCORD_BATCH_SECONDS', '1.0')),
+        on_send=on_send
+    )
+    atexit.register(notifier.shutdown)
+    return notifier
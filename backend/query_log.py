@@ -0,0 +1,215 @@
+import json
+import logging
+import logging.handlers
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+# 有効にするには SQLITE_QUERY_LOG にログファイルのパスを設定する
+QUERY_LOG_PATH = os.getenv('SQLITE_QUERY_LOG', '')
+SLOW_QUERY_MS = float(os.getenv('SQLITE_SLOW_QUERY_MS', '50'))
+QUERY_LOG_MAX_BYTES = int(os.getenv('SQLITE_QUERY_LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+QUERY_LOG_BACKUPS = int(os.getenv('SQLITE_QUERY_LOG_BACKUPS', '5'))
+
+# 記録するパラメータの文字数上限
+PARAM_REPR_LIMIT = 200
+
+# 計画を取らない文（トランザクション制御やPRAGMA）
+_UNPLANNED = re.compile(r'\s*(BEGIN|COMMIT|ROLLBACK|SAVEPOINT|RELEASE|PRAGMA)\b', re.IGNORECASE)
+# IN (?, ?, ...) の個数違いを同じ文として集計するため
+_PLACEHOLDER_LIST = re.compile(r'\?(\s*,\s*\?)+')
+
+_logger = None
+_logger_lock = threading.Lock()
+
+def _get_logger():
+    """ローテーションするファイルへ1行1件のJSONで書き出すロガー
+
+    複数のワーカーが同じファイルに追記する。ローテーションがプロセスごとに
+    ずれても、行は .1, .2 ... のいずれかに残り、レポートは全てを読む。
+    """
+    global _logger
+    with _logger_lock:
+        if _logger is not None:
+            return _logger
+        logger = logging.getLogger('pomohub.query_log')
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        handler = logging.handlers.RotatingFileHandler(
+            QUERY_LOG_PATH, maxBytes=QUERY_LOG_MAX_BYTES, backupCount=QUERY_LOG_BACKUPS, encoding='utf-8'
+        )
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        _logger = logger
+        return _logger
+
+def normalize_sql(sql):
+    """集計用に空白とIN句のプレースホルダー数をそろえる"""
+    return _PLACEHOLDER_LIST.sub('?, ...', ' '.join(sql.split()))
+
+def _caller():
+    """SQLを発行した関数（このモジュールの外で最初のフレーム）"""
+    frame = sys._getframe(2)
+    while frame is not None and frame.f_code.co_filename == __file__:
+        frame = frame.f_back
+    if frame is None:
+        return None
+    return f'{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno})'
+
+def _param_repr(value):
+    """JSONに書ける形に変換（長い文字列は切り詰める）"""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    text = value if isinstance(value, str) else str(value)
+    return text if len(text) <= PARAM_REPR_LIMIT else text[:PARAM_REPR_LIMIT] + '...'
+
+def _params_repr(parameters):
+    """バインドした引数（位置・名前付き）をJSONに書ける形に変換"""
+    if isinstance(parameters, dict):
+        return {key: _param_repr(value) for key, value in parameters.items()}
+    return [_param_repr(value) for value in parameters]
+
+class ProfilingCursor(sqlite3.Cursor):
+    """実行から読み終えるまでの時間を測り、終わった時点でログに書くカーソル"""
+
+    def _start(self, sql, parameters, executemany=False):
+        self._sql = sql
+        self._parameters = parameters
+        self._executemany = executemany
+        self._caller = _caller()
+        self._elapsed = 0.0
+        self._recorded = False
+
+    def _timed(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self._elapsed += time.perf_counter() - started
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(super().fetchmany, self.arraysize if size is None else size)
+        if len(rows) < (self.arraysize if size is None else size):
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        try:
+            return self._timed(super().__next__)
+        except StopIteration:
+            self._finish()
+            raise
+
+    def __del__(self):
+        self._finish()
+
+    def _finish(self):
+        """1文の記録を書き出す（途中で読むのをやめたカーソルは破棄時に書く）"""
+        if getattr(self, '_recorded', True):
+            return
+        self._recorded = True
+        ms = self._elapsed * 1000
+        entry = {
+            'at': round(time.time(), 3),
+            'pid': os.getpid(),
+            'ms': round(ms, 3),
+            'sql': normalize_sql(self._sql),
+            'caller': self._caller,
+        }
+        if ms >= SLOW_QUERY_MS:
+            entry['slow'] = True
+            if self._executemany:
+                # executemanyは件数と最初の1件の引数を残す
+                entry['batch_size'] = len(self._parameters)
+                self._parameters = self._parameters[0] if self._parameters else ()
+            entry['params'] = _params_repr(self._parameters)
+            entry['plan'] = self._explain()
+        try:
+            _get_logger().info(json.dumps(entry, ensure_ascii=False))
+        except Exception as e:
+            print(f"クエリログの書き込みエラー: {e}")
+
+    def _explain(self):
+        """EXPLAIN QUERY PLAN の各行（取得できなければNone）"""
+        if _UNPLANNED.match(self._sql):
+            return None
+        try:
+            rows = sqlite3.Cursor(self.connection).execute(
+                'EXPLAIN QUERY PLAN ' + self._sql, self._parameters
+            ).fetchall()
+        except sqlite3.Error:
+            return None
+        return [row[3] for row in rows]
+
+class ProfilingConnection(sqlite3.Connection):
+    """execute/executemanyをProfilingCursorで実行する接続"""
+
+    def cursor(self, factory=ProfilingCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        cursor = self.cursor()
+        cursor._start(sql, parameters)
+        cursor._timed(super(ProfilingCursor, cursor).execute, sql, parameters)
+        if cursor.description is None:
+            # 結果を返さない文は実行した時点で終わり
+            cursor._finish()
+        return cursor
+
+    def executemany(self, sql, seq_of_parameters):
+        seq_of_parameters = list(seq_of_parameters)
+        cursor = self.cursor()
+        cursor._start(sql, seq_of_parameters, executemany=True)
+        cursor._timed(super(ProfilingCursor, cursor).executemany, sql, seq_of_parameters)
+        cursor._finish()
+        return cursor
+
+def connection_factory():
+    """sqlite3.connect の factory（SQLITE_QUERY_LOG が未設定なら通常の接続）"""
+    return ProfilingConnection if QUERY_LOG_PATH else sqlite3.Connection
+
+def read_entries(path):
+    """ローテーション済みのファイルも含めて記録を古い順に返す"""
+    paths = [f'{path}.{i}' for i in range(QUERY_LOG_BACKUPS, 0, -1)] + [path]
+    for log_path in paths:
+        if not os.path.exists(log_path):
+            continue
+        with open(log_path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+def summarize(entries):
+    """文ごとの件数・合計・最大時間を合計時間の多い順に返す（遅い文は最後の計画と引数も）"""
+    by_sql = {}
+    for entry in entries:
+        stats = by_sql.setdefault(entry['sql'], {
+            'sql': entry['sql'], 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'slow': 0,
+            'callers': {}, 'plan': None, 'params': None
+        })
+        stats['count'] += 1
+        stats['total_ms'] += entry['ms']
+        stats['max_ms'] = max(stats['max_ms'], entry['ms'])
+        caller = entry.get('caller')
+        stats['callers'][caller] = stats['callers'].get(caller, 0) + 1
+        if entry.get('slow'):
+            stats['slow'] += 1
+            stats['plan'] = entry.get('plan')
+            stats['params'] = entry.get('params')
+    return sorted(by_sql.values(), key=lambda stats: stats['total_ms'], reverse=True)
@@ -0,0 +1,61 @@
+import functools
+import math
+from collections import namedtuple
+from json.encoder import encode_basestring
+
+# ストレージ（SQLite / Firestore）が返すレコード
+# タプルなので1件ごとに辞書を作らず、SQLiteでは行をそのままレコードにする。
+# 時刻はどちらのストレージも 'YYYY-MM-DD HH:MM:SS[.ffffff]' の文字列。
+Pomodoro = namedtuple('Pomodoro', ['id', 'start_at', 'end_at', 'completed'])
+Task = namedtuple('Task', ['id', 'category_id', 'name', 'start_at', 'end_at', 'status'])
+# name はメモを付けたタスクの名前（分からないときはNone）
+Note = namedtuple('Note', ['id', 'task_id', 'body', 'created_at', 'name'])
+# 日別サマリーのタスク（notes はそのタスクの Note の一覧）
+TaskSummary = namedtuple('TaskSummary', Task._fields + ('notes',))
+DailySummary = namedtuple('DailySummary', ['date', 'pomodoros', 'tasks'])
+
+# エクスポート・インポートの種別ごとのレコード
+RECORD_TYPES = {'pomodoro': Pomodoro, 'task': Task, 'note': Note}
+
+def record_maker(record_type):
+    """値のタプル（sqlite3の素の行など）をそのままレコードにする関数（フィールド順に並べておく）"""
+    return functools.partial(tuple.__new__, record_type)
+
+def _encode_float(value):
+    return float.__repr__(value) if math.isfinite(value) else 'null'
+
+# 型ごとのJSONへの変換（ensure_ascii=False の json.dumps と同じ文字列）
+_ENCODERS = {
+    str: encode_basestring,
+    int: int.__repr__,
+    float: _encode_float,
+    bool: lambda value: 'true' if value else 'false',
+    type(None): lambda value: 'null',
+}
+
+def _record_encoder(record_type):
+    """レコード型の '{"id": %s, ...}' の書式に値を埋め込む関数（型ごとに1回だけ作る）"""
+    template = '{' + ', '.join(f'{encode_basestring(field)}: %s' for field in record_type._fields) + '}'
+    encoders = _ENCODERS
+
+    def encode(record):
+        return template % tuple([(encoders.get(type(value)) or _encode_other)(value) for value in record])
+    return encode
+
+def _encode_other(value):
+    """レコード・リスト・辞書と、その他の値（str()した文字列）"""
+    if isinstance(value, tuple) and hasattr(value, '_fields'):
+        encoder = _ENCODERS[type(value)] = _record_encoder(type(value))
+        return encoder(value)
+    if isinstance(value, (list, tuple)):
+        return '[' + ', '.join([dumps(item) for item in value]) + ']'
+    if isinstance(value, dict):
+        return '{' + ', '.join([f'{encode_basestring(str(key))}: {dumps(item)}' for key, item in value.items()]) + '}'
+    return encode_basestring(str(value))
+
+def dumps(value):
+    """レコード（入れ子のリスト・辞書も可）をJSON文字列にする
+
+    レコードはフィールド順に値を書式へ埋め込むだけで、途中で辞書を作らない。
+    """
+    return (_ENCODERS.get(type(value)) or _encode_other)(value)
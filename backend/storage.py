@@ -0,0 +1,105 @@
+import os
+import threading
+from datetime import date, datetime
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Protocol, Tuple
+
+from records import DailySummary, Note, Pomodoro, Task
+
+class StorageBackend(Protocol):
+    """models（SQLite）と firestore_models（Firestore）が実装するストレージの関数
+
+    IDはSQLiteでは整数、Firestoreではドキュメントの文字列。
+    一覧系は records のレコード（namedtuple）を返し、そのまま records.dumps でJSONにできる。
+    """
+
+    def init_db(self) -> None: ...
+    def ping(self) -> bool: ...
+    def get_resource_version(self, resource: str) -> Tuple[int, Optional[float]]: ...
+
+    def add_pomodoro(self): ...
+    def update_pomodoro(self, pomodoro_id, end_time: datetime, completed: bool = True) -> None: ...
+    def add_category(self, name: str, color: str = '#3b82f6'): ...
+    def get_categories(self) -> List[Mapping]: ...
+    def add_task_template(self, name: str, category_id=None): ...
+    def get_task_templates(self) -> List[Mapping]: ...
+    def deactivate_task_template(self, template_id) -> None: ...
+    def add_task(self, task_name: str, category_id=None, template_id=None): ...
+    def switch_task(self, task_name: str, category_id=None, template_id=None) -> Tuple: ...
+    def update_task(self, task_id, end_time: datetime) -> None: ...
+    def add_note(self, task_id, note_text: str): ...
+    def get_active_task(self) -> Optional[Mapping]: ...
+
+    def get_daily_summary(self, target_date: date) -> DailySummary: ...
+    def get_today_pomodoros(self) -> List[Pomodoro]: ...
+    def get_today_tasks(self) -> List[Task]: ...
+    def get_task_notes(self, task_id) -> List[Note]: ...
+    def get_notes_for_tasks(self, task_ids) -> Dict[object, List[Note]]: ...
+    def get_pomodoros_by_date(self, target_date: date) -> List[Pomodoro]: ...
+    def get_tasks_by_date(self, target_date: date) -> List[Task]: ...
+    def get_all_notes_by_date(self, target_date: date) -> List[Note]: ...
+    def iter_pomodoros(self, start_date: date, end_date: date) -> Iterator[Pomodoro]: ...
+    def iter_tasks(self, start_date: date, end_date: date) -> Iterator[Task]: ...
+    def iter_notes(self, start_date: date, end_date: date) -> Iterator[Note]: ...
+    def get_task_history(self, limit: int, after=None, category_id=None, status=None) -> List[Task]: ...
+    def get_pomodoro_history(self, limit: int, after=None, completed=None) -> List[Pomodoro]: ...
+    def import_records(self, records: Iterable[Tuple[str, Dict]]) -> Dict[str, int]: ...
+
+    def add_timer(self, pomodoro_id, fire_at: datetime): ...
+    def cancel_timer(self, pomodoro_id) -> bool: ...
+    def claim_due_timers(self, now: datetime, limit: int = 100) -> List[Mapping]: ...
+    def count_pending_timers(self) -> int: ...
+    def acquire_lease(self, name: str, owner: str, ttl_seconds: float) -> bool: ...
+
+    def add_event(self, event_type: str, payload: str): ...
+    def watch_events(self, callback, stop: threading.Event) -> None: ...
+
+    def get_daily_rollups(self, start_date: date, end_date: date) -> List[Mapping]: ...
+    def rebuild_daily_rollups(self, start_date: Optional[date] = None, end_date: Optional[date] = None) -> int: ...
+    def get_stats(self, start_date: date, end_date: date, group_by: str = 'day') -> Dict: ...
+
+# StorageBackend の関数名（読み込んだモジュールがすべて持っているかを確認する）
+STORAGE_FUNCTIONS = sorted(name for name in vars(StorageBackend) if not name.startswith('_'))
+
+class LazyBackend:
+    """ストレージ（SQLite / Firestore）のモジュールを最初に使うときに読み込む
+
+    K_SERVICE（Cloud Run）が設定されていればFirestore、なければSQLiteを使う。
+    firebase_admin の読み込みや init_db() は、最初に属性を参照したプロセスで1回だけ行う。
+    gunicornの preload_app で親プロセスが app を読み込んでも、クライアントはfork後の
+    各ワーカーで作られる。
+    """
+
+    def __init__(self, prepare=None):
+        self.prepare = prepare
+        self._module = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.load(), name)
+
+    def is_loaded(self) -> bool:
+        """読み込み済みか"""
+        return self._module is not None
+
+    def uses_firestore(self) -> bool:
+        """Firestoreを使う環境か（モジュールは読み込まない）"""
+        return bool(os.getenv('K_SERVICE'))
+
+    def load(self):
+        """モジュールを読み込み、prepareを適用してinit_dbを実行"""
+        if self._module is not None:
+            return self._module
+        with self._lock:
+            if self._module is None:
+                if self.uses_firestore():
+                    import firestore_models as module
+                else:
+                    import models as module
+                missing = [name for name in STORAGE_FUNCTIONS if not callable(getattr(module, name, None))]
+                if missing:
+                    raise TypeError(f'{module.__name__} に StorageBackend の関数がありません: {", ".join(missing)}')
+                if self.prepare is not None:
+                    self.prepare(module)
+                module.init_db()
+                self._module = module
+        return self._module
@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import models
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """一時ディレクトリのSQLiteで models を使う（接続はスレッドごとに開かれる）"""
+    monkeypatch.setattr(models, 'DATABASE', str(tmp_path / 'pomo_hub.db'))
+    models.init_db()
+    yield models
+    models.close_db_connection()
+
+@pytest.fixture
+def client(db, monkeypatch):
+    """テスト用のFlaskクライアント（スケジューラーは起動しない）
+
+    起動するとテストが終わっても一時DBを外した models でタイマーを処理し続ける。
+    """
+    monkeypatch.setenv('DISCORD_WEBHOOK_URL', '')
+    import app
+    monkeypatch.setattr(app, 'ensure_scheduler_started', lambda: None)
+    return app.app.test_client()
@@ -0,0 +1,21 @@
+"""境界より前に残った行が本体から読まれ、archive --status 用に数えられることの確認"""
+from datetime import date, datetime, timedelta
+
+import archive
+
+def test_rows_left_before_boundary(db):
+    month_end = datetime(2000, 1, 31, 23, 30)
+    db.import_records([
+        ('task', {'id': 'moved', 'name': 'moved', 'start_at': month_end - timedelta(hours=2),
+                  'end_at': month_end - timedelta(hours=1)}),
+        # 翌月に終わったタスクは1月にも2月にも移らない
+        ('task', {'id': 'left', 'name': 'left', 'start_at': month_end, 'end_at': month_end + timedelta(hours=1)}),
+        ('note', {'task_id': 'left', 'body': 'left'}),
+    ])
+    conn = db.get_db_connection()
+    assert archive.count_left_behind(conn) is None
+
+    archived = archive.archive_closed_months(conn, db.DATABASE, keep_months=0, today=date(2000, 3, 15))
+    assert [month_start for month_start, _ in archived] == [date(2000, 1, 1), date(2000, 2, 1)]
+    assert archive.count_left_behind(conn) == {'pomodoros': 0, 'tasks': 1, 'notes': 1}
+    assert sorted(task.name for task in db.get_tasks_by_date(month_end.date())) == ['left', 'moved']
@@ -0,0 +1,34 @@
+"""ETag/Last-Modified による条件付きGETの確認"""
+import sqlite3
+import time
+
+def set_updated_at(db, resource, updated_at):
+    # 別の接続で書き込み、data_version を変えてバージョンのキャッシュを捨てさせる
+    conn = sqlite3.connect(db.DATABASE)
+    with conn:
+        conn.execute('UPDATE resource_versions SET updated_at = ? WHERE resource = ?', (updated_at, resource))
+    conn.close()
+
+def test_if_modified_since(db, client):
+    db.add_category('work', '#ffffff')
+    set_updated_at(db, 'categories', time.time() - 60)
+    last_modified = client.get('/api/categories').headers['Last-Modified']
+
+    assert client.get('/api/categories', headers={'If-Modified-Since': last_modified}).status_code == 304
+    db.add_category('play', '#000000')
+    set_updated_at(db, 'categories', time.time() - 30)
+    assert client.get('/api/categories', headers={'If-Modified-Since': last_modified}).status_code == 200
+
+def test_if_none_match_takes_precedence(db, client):
+    db.add_category('work', '#ffffff')
+    set_updated_at(db, 'categories', time.time() - 60)
+    last_modified = client.get('/api/categories').headers['Last-Modified']
+    headers = {'If-Modified-Since': last_modified, 'If-None-Match': '"categories-0"'}
+    assert client.get('/api/categories', headers=headers).status_code == 200
+
+def test_no_last_modified_within_the_updated_second(db, client):
+    db.add_category('work', '#ffffff')
+    set_updated_at(db, 'categories', time.time() + 60)
+    response = client.get('/api/categories')
+    assert 'Last-Modified' not in response.headers
+    assert client.get('/api/categories', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
@@ -0,0 +1,42 @@
+"""SSE配信のブローカーの確認"""
+import queue
+
+import events
+
+def make_broker(**kwargs):
+    """add_event で積んだイベントを watch_events で配るだけのブローカー"""
+    pending = queue.Queue()
+    counter = iter(range(1, 1000))
+
+    def add_event(event_type, payload):
+        pending.put((next(counter), event_type, payload))
+
+    def watch_events(callback, stop):
+        while not stop.is_set():
+            try:
+                callback(*pending.get(timeout=0.05))
+            except queue.Empty:
+                pass
+
+    return events.EventBroker(add_event, watch_events, **kwargs)
+
+def test_open_stream_survives_thread_restart():
+    broker = make_broker()
+    subscriber = broker.subscribe()
+    broker.shutdown()
+    assert broker.thread_state() == 'dead'
+
+    # 次の接続で受信スレッドが作り直されても、開いたままの接続に配り続ける
+    assert broker.subscribe() is not None
+    broker.publish('pomodoro_started', {'pomodoro_id': 1})
+    frame = subscriber.queue.get(timeout=2)
+    assert 'event: pomodoro_started' in frame
+    broker.shutdown()
+
+def test_default_max_clients_leaves_threads_for_api(monkeypatch):
+    monkeypatch.setenv('GUNICORN_THREADS', '8')
+    assert events._default_max_clients() == 8 - events.EVENTS_RESERVED_THREADS
+    monkeypatch.setenv('GUNICORN_THREADS', '2')
+    assert events._default_max_clients() == 1
+    monkeypatch.delenv('GUNICORN_THREADS')
+    assert events._default_max_clients() == 8
@@ -0,0 +1,18 @@
+"""エクスポートの逐次送信と、送信前に起きたエラーの応答の確認"""
+import json
+
+def test_export_streams_records(db, client):
+    db.add_task('task')
+    response = client.get('/api/export/data?format=json')
+    assert response.status_code == 200
+    assert [task['name'] for task in json.loads(response.get_data())['data']['tasks']] == ['task']
+
+def test_export_error_before_streaming_returns_500(db, client, monkeypatch):
+    def fail(start_date, end_date):
+        raise RuntimeError('storage unavailable')
+        yield
+
+    monkeypatch.setattr(db, 'iter_pomodoros', fail)
+    response = client.get('/api/export/data?format=ndjson')
+    assert response.status_code == 500
+    assert response.get_json() == {'success': False, 'message': 'storage unavailable'}
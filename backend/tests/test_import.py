@@ -0,0 +1,27 @@
+"""インポートで登録できない行が、行番号付きのエラーとして報告されることの確認"""
+import json
+
+LINES = [
+    {'type': 'task', 'id': 't1', 'name': 'task', 'start_at': '2025-03-01T09:00:00', 'end_at': '2025-03-01T10:00:00'},
+    {'type': 'note', 'task_id': 't1', 'body': 'kept'},
+    {'type': 'note', 'task_id': 'missing', 'body': 'orphan'},
+    {'type': 'pomodoro', 'start_at': '2025-03-01T09:00:00', 'end_at': '2025-03-01T09:25:00', 'completed': True},
+    {'type': 'pomodoro', 'start_at': '2025-03-01T09:30:00', 'completed': False},
+]
+
+def test_import_reports_unimportable_lines(db, client):
+    body = '\n'.join(json.dumps(line) for line in LINES)
+    response = client.post('/api/import?format=ndjson', data=body)
+    result = response.get_json()
+    assert result['imported'] == {'pomodoro': 1, 'task': 1, 'note': 1}
+    assert result['skipped'] == 2
+    assert [error.split(':')[0] for error in result['errors']] == ['3行目', '5行目']
+
+    conn = db.get_db_connection()
+    task_id = conn.execute('SELECT id FROM tasks').fetchone()[0]
+    assert [tuple(row) for row in conn.execute('SELECT task_id, body FROM notes')] == [(task_id, 'kept')]
+    assert conn.execute('SELECT COUNT(*) FROM pomodoros WHERE end_at IS NULL').fetchone()[0] == 0
+
+def test_import_records_skips_notes_of_unknown_tasks(db):
+    counts = db.import_records([('note', {'task_id': 1, 'body': 'orphan'})])
+    assert counts == {'pomodoro': 0, 'task': 0, 'note': 0}
@@ -0,0 +1,69 @@
+"""切り替え時にタスクを終了していなかった頃のDBをマイグレーションしたときの確認"""
+import sqlite3
+from datetime import datetime, timedelta
+
+import migrations
+from test_rollups import assert_matches_rebuild
+
+START = datetime(2025, 3, 1, 9, 20)
+
+def insert_active_tasks(path):
+    """進行中のまま残ったタスク2件と、本当に進行中のタスク1件を入れる"""
+    conn = sqlite3.connect(path)
+    with conn:
+        for name, minutes in (('old', 0), ('older switch', 95), ('current', 130)):
+            conn.execute(
+                "INSERT INTO tasks (name, start_at, status) VALUES (?, ?, 'active')",
+                (name, str(START + timedelta(minutes=minutes)))
+            )
+    conn.close()
+
+def assert_only_newest_active(models):
+    conn = models.get_db_connection()
+    tasks = {row['name']: row for row in conn.execute('SELECT * FROM tasks')}
+    assert [name for name, row in tasks.items() if row['status'] == 'active'] == ['current']
+    assert conn.execute('SELECT task_id FROM active_task').fetchone()[0] == tasks['current']['id']
+    # 次のタスクが始まった時刻で終了している
+    assert tasks['old']['status'] == 'completed'
+    assert tasks['old']['end_at'] == tasks['older switch']['start_at']
+    assert tasks['older switch']['end_at'] == tasks['current']['start_at']
+    assert tasks['current']['end_at'] is None
+    assert_matches_rebuild(models)
+
+def test_legacy_database(tmp_path, monkeypatch):
+    import models
+    path = str(tmp_path / 'pomo_hub.db')
+    conn = sqlite3.connect(path)
+    migrations._create_base_tables(conn)
+    conn.close()
+    insert_active_tasks(path)
+
+    monkeypatch.setattr(models, 'DATABASE', path)
+    try:
+        models.init_db()
+        assert_only_newest_active(models)
+    finally:
+        models.close_db_connection()
+
+def test_database_migrated_before_closing(tmp_path, monkeypatch):
+    """6 を当てたあとのDBでも、残っていた進行中のタスクを終了する"""
+    import models
+    path = str(tmp_path / 'pomo_hub.db')
+    conn = sqlite3.connect(path)
+    with monkeypatch.context() as patch:
+        patch.setattr(migrations, 'MIGRATIONS', migrations.MIGRATIONS[:8])
+        patch.setattr(migrations, 'LATEST_VERSION', 8)
+        migrations.migrate(conn)
+    conn.close()
+    insert_active_tasks(path)
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("INSERT INTO active_task (slot, task_id) SELECT 1, id FROM tasks WHERE name = 'current'")
+    conn.close()
+
+    monkeypatch.setattr(models, 'DATABASE', path)
+    try:
+        models.init_db()
+        assert_only_newest_active(models)
+    finally:
+        models.close_db_connection()
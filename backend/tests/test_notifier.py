@@ -0,0 +1,113 @@
+"""Discord通知のディスパッチャーを、ローカルのHTTPスタブに送って確認"""
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from notifier import DiscordNotifier
+
+class WebhookStub:
+    """受け取った (時刻, 本文) を記録し、responses の順に応答する（尽きたら204）"""
+
+    def __init__(self):
+        self.posts = []
+        self.responses = []
+        self.release = threading.Event()
+        self.release.set()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                stub.posts.append((time.monotonic(), body['content']))
+                stub.release.wait(5)
+                status, payload = stub.responses.pop(0) if stub.responses else (204, None)
+                data = json.dumps(payload).encode() if payload is not None else b''
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/webhook'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def contents(self):
+        return [content for _, content in self.posts]
+
+    def wait_for_posts(self, count, timeout=5):
+        deadline = time.monotonic() + timeout
+        while len(self.posts) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return len(self.posts) >= count
+
+@pytest.fixture
+def stub():
+    stub = WebhookStub()
+    yield stub
+    stub.release.set()
+    stub.server.shutdown()
+    stub.server.server_close()
+
+def test_burst_is_coalesced_into_one_post(stub):
+    notifier = DiscordNotifier(stub.url, batch_window=0.3)
+    for index in range(5):
+        assert notifier.notify(f'message {index}')
+    assert notifier.flush(5)
+    assert stub.contents() == ['\n'.join(f'message {index}' for index in range(5))]
+    notifier.shutdown()
+
+def test_rate_limit_waits_retry_after(stub):
+    stub.responses = [(429, {'retry_after': 0.5})]
+    notifier = DiscordNotifier(stub.url, batch_window=0.01, backoff_base=0.01)
+    notifier.notify('rate limited')
+    assert notifier.flush(5)
+    assert stub.contents() == ['rate limited', 'rate limited']
+    # 指数バックオフ（0.01秒）ではなく retry_after の秒数だけ待ってから再送する
+    assert stub.posts[1][0] - stub.posts[0][0] >= 0.5
+    notifier.shutdown()
+
+def test_full_queue_drops_messages(stub):
+    notifier = DiscordNotifier(stub.url, max_queue=2, batch_window=0.01)
+    stub.release.clear()
+    notifier.notify('sending')
+    # 送信スレッドが応答待ちで止まっている間に積む
+    assert stub.wait_for_posts(1)
+    assert notifier.notify('queued 1')
+    assert notifier.notify('queued 2')
+    assert not notifier.notify('dropped')
+    assert notifier.dropped == 1
+
+    stub.release.set()
+    assert notifier.flush(5)
+    assert stub.contents() == ['sending', 'queued 1\nqueued 2']
+    notifier.shutdown()
+
+def test_shutdown_flushes_queued_messages(stub):
+    notifier = DiscordNotifier(stub.url, batch_window=0.2)
+    notifier.notify('first')
+    notifier.notify('second')
+    notifier.shutdown()
+    assert stub.contents() == ['first\nsecond']
+    assert not notifier.is_alive()
+
+def test_exit_flushes_queued_messages(stub):
+    # shutdown を呼ばずに終了しても、create_notifier が登録した atexit で送信される
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    script = (
+        'import notifier\n'
+        f'dispatcher = notifier.create_notifier({stub.url!r})\n'
+        "dispatcher.notify('before exit')\n"
+    )
+    subprocess.run([sys.executable, '-c', script], cwd=backend_dir, check=True, timeout=30,
+                   env=dict(os.environ, DISCORD_BATCH_SECONDS='0.2'))
+    assert stub.contents() == ['before exit']
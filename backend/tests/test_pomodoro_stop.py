@@ -0,0 +1,24 @@
+"""タイマーの発火とポモドーロの停止が前後しても、発火で完了にした記録を中断で上書きしないことの確認"""
+from datetime import datetime
+
+def pomodoro_state(db, pomodoro_id):
+    row = db.get_db_connection().execute(
+        'SELECT completed, end_at IS NOT NULL FROM pomodoros WHERE id = ?', (pomodoro_id,)
+    ).fetchone()
+    return tuple(row)
+
+def test_stop_after_timer_fired_keeps_completed(db, client):
+    pomodoro_id = client.post('/api/pomodoro/start', json={}).get_json()['pomodoro_id']
+    assert len(db.claim_due_timers(datetime.max)) == 1
+
+    response = client.post('/api/pomodoro/stop', json={'pomodoro_id': pomodoro_id}).get_json()
+    assert response == {'success': True, 'stopped': False}
+    assert pomodoro_state(db, pomodoro_id) == (1, 1)
+
+def test_stop_before_timer_fired_aborts(db, client):
+    pomodoro_id = client.post('/api/pomodoro/start', json={}).get_json()['pomodoro_id']
+
+    response = client.post('/api/pomodoro/stop', json={'pomodoro_id': pomodoro_id}).get_json()
+    assert response == {'success': True, 'stopped': True}
+    assert pomodoro_state(db, pomodoro_id) == (0, 1)
+    assert db.claim_due_timers(datetime.max) == []
@@ -0,0 +1,90 @@
+"""models.py の日付検索がフルスキャンしていないかを確認
+
+一時DBで各関数を実行し、発行されたSQLを EXPLAIN QUERY PLAN にかける。
+古い月をアーカイブしたあと、アーカイブと合わせて読む期間でも同じように確認する。
+統計情報がなくてもインデックスが選ばれることを確認するため、データはほとんど入れない。
+"""
+from datetime import date, datetime, time, timedelta
+
+import pytest
+
+import archive
+
+# 計画を確認する関数と引数
+CHECKED_CALLS = [
+    ('get_daily_summary', (date.today(),)),
+    ('get_today_pomodoros', ()),
+    ('get_today_tasks', ()),
+    ('get_active_task', ()),
+    ('count_pending_timers', ()),
+    ('get_pomodoros_by_date', (date.today(),)),
+    ('get_tasks_by_date', (date.today(),)),
+    ('get_all_notes_by_date', (date.today(),)),
+    ('get_notes_for_tasks', ([1, 2, 3],)),
+    ('get_task_history', (50, ('2026-01-01 00:00:00', 10))),
+    ('get_task_history', (50, ('2026-01-01 00:00:00', 10), 1, 'completed')),
+    ('get_pomodoro_history', (50, ('2026-01-01 00:00:00', 10), True)),
+]
+
+# アーカイブしたあとに確認する関数と引数（境界より前にかかる期間）
+ARCHIVED_DATE = date(2000, 1, 15)
+CHECKED_ARCHIVE_CALLS = [
+    ('get_daily_summary', (ARCHIVED_DATE,)),
+    ('get_pomodoros_by_date', (ARCHIVED_DATE,)),
+    ('get_tasks_by_date', (ARCHIVED_DATE,)),
+    ('get_all_notes_by_date', (ARCHIVED_DATE,)),
+    ('get_notes_for_tasks', ([1, 2, 3],)),
+    ('get_task_notes', (1,)),
+    ('get_task_history', (50, ('2000-02-01 00:00:00', 10))),
+    ('get_task_history', (50, ('2000-02-01 00:00:00', 10), 1, 'completed')),
+    ('get_pomodoro_history', (50, ('2000-02-01 00:00:00', 10), True)),
+]
+
+def call_id(call):
+    name, args = call
+    return f'{name}{args}'
+
+def capture_statements(models, name, args):
+    """関数が発行したSQL（パラメータ展開済み）を取得"""
+    conn = models.get_db_connection()
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        getattr(models, name)(*args)
+    finally:
+        conn.set_trace_callback(None)
+    return [sql for sql in statements if sql.lstrip().upper().startswith('SELECT')]
+
+def full_scans(models, sql):
+    """クエリプラン中のフルスキャン行を返す"""
+    plan = models.get_db_connection().execute('EXPLAIN QUERY PLAN ' + sql).fetchall()
+    return [row['detail'] for row in plan if row['detail'].startswith('SCAN')]
+
+@pytest.fixture
+def archived_db(db):
+    """古い月に1件ずつ記録を入れてアーカイブしたDB"""
+    start_at = datetime.combine(ARCHIVED_DATE, time(9))
+    db.import_records([
+        ('pomodoro', {'start_at': start_at, 'end_at': start_at + timedelta(minutes=25), 'completed': True}),
+        ('task', {'id': 1, 'name': 'archived', 'start_at': start_at, 'end_at': start_at + timedelta(hours=1)}),
+        ('note', {'task_id': 1, 'body': 'archived', 'created_at': start_at}),
+    ])
+    # ARCHIVED_DATE の月だけをアーカイブする
+    archive.archive_closed_months(db.get_db_connection(), db.DATABASE, keep_months=0,
+                                  today=ARCHIVED_DATE + timedelta(days=31))
+    return db
+
+@pytest.mark.parametrize('call', CHECKED_CALLS, ids=call_id)
+def test_no_full_scans(db, call):
+    statements = capture_statements(db, *call)
+    assert statements
+    for sql in statements:
+        assert full_scans(db, sql) == [], sql
+
+@pytest.mark.parametrize('call', CHECKED_ARCHIVE_CALLS, ids=call_id)
+def test_no_full_scans_with_archive(archived_db, call):
+    statements = capture_statements(archived_db, *call)
+    # 境界より前の期間を読むので、アーカイブと合わせて読んでいること
+    assert any('archive.' in sql for sql in statements)
+    for sql in statements:
+        assert full_scans(archived_db, sql) == [], sql
@@ -0,0 +1,59 @@
+"""同時に閉じても日別・時間帯別の集計が作り直した結果と一致することの確認"""
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+CLOSERS = 4
+ROUNDS = 100
+
+def read_rollups(models):
+    conn = models.get_db_connection()
+    return [
+        [tuple(row) for row in conn.execute(f'SELECT * FROM {table} ORDER BY 1, 2')]
+        for table in ('daily_rollups', 'hourly_rollups')
+    ]
+
+def close_concurrently(models, close, ids):
+    """CLOSERS 個のスレッドで同じ行を同時に閉じる"""
+    barrier = threading.Barrier(CLOSERS)
+    errors = []
+
+    def closer(index):
+        try:
+            for row_id in ids:
+                barrier.wait()
+                close(row_id, datetime.now() + timedelta(minutes=index))
+        except Exception as e:
+            errors.append(e)
+            barrier.abort()
+        finally:
+            models.close_db_connection()
+
+    threads = [threading.Thread(target=closer, args=(index,)) for index in range(CLOSERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+def assert_matches_rebuild(models):
+    incremental = read_rollups(models)
+    models.rebuild_daily_rollups()
+    # 作り直しは julianday で分数を出すので、ミリ秒未満の差は許す
+    for expected, actual in zip(read_rollups(models), incremental):
+        assert [row[:-1] for row in actual] == [row[:-1] for row in expected]
+        assert [row[-1] for row in actual] == pytest.approx([row[-1] for row in expected], abs=1e-3)
+
+def test_concurrent_update_task(db):
+    ids = []
+    for index in range(ROUNDS):
+        ids.append(db.add_task(f'task {index}'))
+    close_concurrently(db, db.update_task, ids)
+    assert_matches_rebuild(db)
+
+def test_concurrent_update_pomodoro(db):
+    db.add_task('task')
+    ids = [db.add_pomodoro() for _ in range(ROUNDS)]
+    close_concurrently(db, lambda pomodoro_id, end_time: db.update_pomodoro(pomodoro_id, end_time, completed=False), ids)
+    assert_matches_rebuild(db)
@@ -0,0 +1,15 @@
+"""preload_app でforkしたワーカーが、それぞれ別の所有者としてタイマーのリースを取り合うことの確認"""
+import os
+
+def test_forked_worker_does_not_share_lease(db, client):
+    import app
+    assert db.acquire_lease('pomodoro_timers', app._scheduler_owner(), 60)
+
+    pid = os.fork()
+    if pid == 0:
+        # 子プロセスでは親と別のIDになり、親のリースは取れない
+        acquired = db.acquire_lease('pomodoro_timers', app._scheduler_owner(), 60)
+        os._exit(1 if acquired else 0)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert db.acquire_lease('pomodoro_timers', app._scheduler_owner(), 60)
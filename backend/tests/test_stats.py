@@ -0,0 +1,11 @@
+"""期間集計の返す形の確認（Firestoreと同じく、未分類のカテゴリはNone）"""
+from datetime import date
+
+def test_category_groups_use_none_for_uncategorized(db):
+    category_id = db.add_category('work', '#ffffff')
+    db.add_task('uncategorized')
+    db.add_task('categorized', category_id)
+    db.add_task('last')
+
+    groups = db.get_stats(date.today(), date.today(), 'category')['groups']
+    assert [(group['key'], group['category_name']) for group in groups] == [(None, None), (category_id, 'work')]
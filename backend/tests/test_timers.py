@@ -0,0 +1,39 @@
+"""タイマーの発火とポモドーロの完了が1つのトランザクションで行われることの確認"""
+from datetime import datetime, timedelta
+
+import pytest
+
+def pomodoro_state(db, pomodoro_id):
+    row = db.get_db_connection().execute(
+        'SELECT completed, end_at IS NOT NULL FROM pomodoros WHERE id = ?', (pomodoro_id,)
+    ).fetchone()
+    return tuple(row)
+
+def test_claim_completes_pomodoro(db):
+    pomodoro_id = db.add_pomodoro()
+    db.add_timer(pomodoro_id, datetime.now() - timedelta(seconds=1))
+
+    timers = db.claim_due_timers(datetime.now())
+    assert [timer['pomodoro_id'] for timer in timers] == [pomodoro_id]
+    assert pomodoro_state(db, pomodoro_id) == (1, 1)
+    assert db.claim_due_timers(datetime.now()) == []
+
+def test_failed_completion_leaves_timer_pending(db, monkeypatch):
+    pomodoro_id = db.add_pomodoro()
+    db.add_timer(pomodoro_id, datetime.now() - timedelta(seconds=1))
+
+    def fail(*args):
+        raise RuntimeError('disk I/O error')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(db, '_update_pomodoro', fail)
+        with pytest.raises(RuntimeError):
+            db.claim_due_timers(datetime.now())
+    assert db.count_pending_timers() == 1
+    assert pomodoro_state(db, pomodoro_id) == (0, 0)
+
+    # 次のポーリングでやり直される
+    import app
+    app.process_due_timers()
+    assert db.count_pending_timers() == 0
+    assert pomodoro_state(db, pomodoro_id) == (1, 1)
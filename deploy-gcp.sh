@@ -64,8 +64,8 @@ fi
 # Firebaseプロジェクトの設定
 firebase use $PROJECT_ID || firebase use --add
 
-# Firebase Hostingデプロイ
-firebase deploy --only hosting
+# Firebase Hostingと、Firestoreのインデックス・TTLポリシー（SSEのイベントの削除）のデプロイ
+firebase deploy --only hosting,firestore:indexes
 
 # Firebase HostingのURLを取得
 FRONTEND_URL="https://$PROJECT_ID.web.app"
@@ -32,6 +32,10 @@ docker-compose -f docker-compose.prod.yml down
 echo "🔨 Building production images..."
 docker-compose -f docker-compose.prod.yml build --no-cache
 
+# スキーマのマイグレーション（ワーカーの起動時はバージョン確認だけになる）
+echo "🗄️  Applying database migrations..."
+docker-compose -f docker-compose.prod.yml run --rm --no-deps backend python manage.py migrate
+
 # コンテナを起動
 echo "🚀 Starting production containers..."
 docker-compose -f docker-compose.prod.yml up -d
@@ -41,7 +45,7 @@ echo "🔍 Waiting for services to be healthy..."
 sleep 10
 
 # バックエンドのヘルスチェック
-if curl -f http://localhost:5001/api/today > /dev/null 2>&1; then
+if curl -f http://localhost:5001/health/ready > /dev/null 2>&1; then
     echo "✅ Backend is healthy"
 else
     echo "❌ Backend health check failed"